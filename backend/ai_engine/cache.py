@@ -0,0 +1,151 @@
+"""
+Content-addressed cache for model responses
+Keys hash the model name, the step's prompt template version and the
+exact input bytes / JSON, so identical requests are answered from disk.
+Entries expire after a TTL and the least recently used ones are evicted
+once the cache grows past its size budget.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import llm_cache_lookups
+from config import MODEL_NAME, LLM_CACHE_ENABLED, LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_SECONDS
+
+class ResponseCache:
+    def __init__(self, cache_dir, max_bytes, ttl_seconds, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = None  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+
+    def make_key(self, step, prompt_version, *inputs):
+        """Hash model, step, prompt version and inputs into a cache key"""
+        digest = hashlib.sha256()
+        digest.update(f"{MODEL_NAME}\0{step}\0v{prompt_version}".encode())
+        for item in inputs:
+            if isinstance(item, (bytes, bytearray)):
+                data = bytes(item)
+            else:
+                data = json.dumps(item, sort_keys=True).encode()
+            digest.update(b"\0%d\0" % len(data))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return (True, value) on a fresh hit, (False, None) otherwise"""
+        self._load_index()
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return False, None
+
+        if time.time() - entry.get('createdAt', 0) > self.ttl_seconds:
+            self._remove(key)
+            with self._lock:
+                self.misses += 1
+            return False, None
+
+        try:
+            os.utime(path, None)  # keeps LRU order across restarts
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if key in self._index:
+                self._index.move_to_end(key)
+        return True, entry['value']
+
+    def set(self, key, value):
+        """Store a value and evict least recently used entries over budget"""
+        self._load_index()
+        data = json.dumps({"createdAt": time.time(), "value": value})
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            while self._total_bytes > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self._total_bytes -= size
+                self.evictions += 1
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def cached(self, step, prompt_version, inputs, generate, bypass=False):
+        """Return the cached response for inputs, calling generate() on a miss.
+        bypass=True skips the lookup (forced regrade) but still refreshes the entry."""
+        if not self.enabled:
+            return generate()
+        key = self.make_key(step, prompt_version, *inputs)
+        if not bypass:
+            hit, value = self.get(key)
+            if hit:
+                print(f"    (cache hit: {step})")
+                llm_cache_lookups.inc(step=step, result='hit')
+                return value
+        llm_cache_lookups.inc(step=step, result='bypass' if bypass else 'miss')
+        value = generate()
+        self.set(key, value)
+        return value
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        self._load_index()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._total_bytes
+            }
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _remove(self, key):
+        with self._lock:
+            self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _load_index(self):
+        # Built lazily from file mtimes so importing the module stays cheap
+        if self._index is not None:
+            return
+        with self._lock:
+            if self._index is not None:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.json'):
+                    continue
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, name[:-5], stat.st_size))
+            self._index = OrderedDict((key, size) for _, key, size in sorted(entries))
+            self._total_bytes = sum(self._index.values())
+
+llm_cache = ResponseCache(LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_SECONDS, enabled=LLM_CACHE_ENABLED)
@@ -0,0 +1,135 @@
+"""
+Gemini Files API handles for assignment and paper check PDFs
+Question and solution PDFs are uploaded when the assignment is built, and
+the answer PDF of a paper check once for steps 2 and 3. Requests then
+reference the returned file URI instead of sending the bytes inline.
+Assignment handles are stored together with their expiry, reused by
+rebuilds and re-uploaded when they expire within the refresh margin.
+
+GEMINI_FILES_BACKEND selects where uploads go: 'gemini' (the real Files
+API), 'local' (an on-disk stand-in with the same upload/get interface,
+for offline runs) or 'off' (always send bytes inline).
+"""
+import io
+import os
+import json
+import uuid
+import threading
+from datetime import datetime, timedelta, timezone
+
+from google.genai import types
+
+from config import (client, GEMINI_FILES_BACKEND, GEMINI_FILES_REFRESH_MARGIN,
+                    LOCAL_FILES_DIR, LOCAL_FILES_TTL_SECONDS)
+
+PDF_MIME_TYPE = "application/pdf"
+
+class LocalFilesEndpoint:
+    """Stand-in for client.files that keeps uploads on local disk"""
+    def __init__(self, root, ttl_seconds):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+    def upload(self, *, file, config=None):
+        config = dict(config or {})
+        name = f"files/{uuid.uuid4().hex[:16]}"
+        data = file.read() if hasattr(file, 'read') else open(file, 'rb').read()
+        now = datetime.now(timezone.utc)
+        meta = {
+            "name": name,
+            "display_name": config.get('display_name'),
+            "mime_type": config.get('mime_type', PDF_MIME_TYPE),
+            "size_bytes": len(data),
+            "create_time": now.isoformat(),
+            "expiration_time": (now + timedelta(seconds=self.ttl_seconds)).isoformat(),
+            "uri": f"local://{name}",
+            "state": "ACTIVE",
+        }
+        os.makedirs(self.root, exist_ok=True)
+        file_id = name.split('/', 1)[1]
+        with self._lock:
+            with open(os.path.join(self.root, f"{file_id}.bin"), 'wb') as f:
+                f.write(data)
+            with open(os.path.join(self.root, f"{file_id}.json"), 'w') as f:
+                json.dump(meta, f)
+        return types.File(**meta)
+
+    def get(self, *, name, config=None):
+        file_id = name.split('/', 1)[-1]
+        try:
+            with open(os.path.join(self.root, f"{file_id}.json"), 'r') as f:
+                meta = json.load(f)
+        except OSError:
+            raise FileNotFoundError(f"File {name} not found")
+        if datetime.fromisoformat(meta['expiration_time']) <= datetime.now(timezone.utc):
+            raise FileNotFoundError(f"File {name} has expired")
+        return types.File(**meta)
+
+    def read(self, uri):
+        """Bytes behind a local:// URI (what a stub model server would fetch)"""
+        file_id = uri.rsplit('/', 1)[-1]
+        self.get(name=f"files/{file_id}")
+        with open(os.path.join(self.root, f"{file_id}.bin"), 'rb') as f:
+            return f.read()
+
+def _files_endpoint():
+    if GEMINI_FILES_BACKEND == 'local':
+        return local_files
+    if GEMINI_FILES_BACKEND == 'gemini':
+        return client.files
+    return None
+
+def upload_pdf(pdf_bytes, blob_id=None):
+    """Upload a PDF and return its handle, or None when uploads are disabled"""
+    endpoint = _files_endpoint()
+    if endpoint is None:
+        return None
+    uploaded = endpoint.upload(file=io.BytesIO(pdf_bytes),
+                               config={"mime_type": PDF_MIME_TYPE, "display_name": blob_id})
+    expires = uploaded.expiration_time
+    if expires is None:
+        expires = datetime.now(timezone.utc) + timedelta(seconds=LOCAL_FILES_TTL_SECONDS)
+    elif isinstance(expires, str):
+        expires = datetime.fromisoformat(expires)
+    return {
+        "name": uploaded.name,
+        "uri": uploaded.uri,
+        "mimeType": uploaded.mime_type or PDF_MIME_TYPE,
+        "blobId": blob_id,
+        "backend": GEMINI_FILES_BACKEND,
+        "expiresAt": expires.isoformat(),
+    }
+
+def is_fresh(handle, blob_id=None):
+    """True when the handle points at blob_id and outlives the refresh margin"""
+    if not handle or not handle.get('uri') or handle.get('backend') != GEMINI_FILES_BACKEND:
+        return False
+    if blob_id is not None and handle.get('blobId') != blob_id:
+        return False
+    try:
+        expires = datetime.fromisoformat(handle['expiresAt'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    margin = timedelta(seconds=GEMINI_FILES_REFRESH_MARGIN)
+    return expires - margin > datetime.now(timezone.utc)
+
+def ensure_handle(handle, blob_id, load_bytes):
+    """Return handle if still fresh, otherwise upload again.
+    load_bytes is only called when an upload is needed. Upload failures
+    return None so callers fall back to inline bytes."""
+    if is_fresh(handle, blob_id):
+        return handle
+    try:
+        return upload_pdf(load_bytes(), blob_id)
+    except Exception as e:
+        print(f"Files API upload failed for {blob_id}, sending inline: {e}")
+        return None
+
+def pdf_part(pdf_bytes, handle=None):
+    """File reference when a fresh handle exists, inline bytes otherwise"""
+    if is_fresh(handle):
+        return types.Part.from_uri(file_uri=handle['uri'], mime_type=handle.get('mimeType', PDF_MIME_TYPE))
+    return types.Part.from_bytes(data=pdf_bytes, mime_type=PDF_MIME_TYPE)
+
+local_files = LocalFilesEndpoint(LOCAL_FILES_DIR, LOCAL_FILES_TTL_SECONDS)
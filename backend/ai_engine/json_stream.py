@@ -0,0 +1,86 @@
+"""
+Incremental parsing of a streamed JSON array of objects
+Step 3 returns the extracted answers as a list of question objects, either
+bare or under a key of a wrapper object such as {"answers": [...]}.
+JsonArrayItems is fed the response text chunk by chunk and returns each
+element object as soon as its closing brace arrives, so a question can be
+graded while the model is still writing out the next ones. It only tracks
+nesting, strings and the last key of the top-level object; each element is
+parsed with json.loads once complete, and the full response is still parsed
+normally at the end, which is what the step returns.
+"""
+import json
+
+class JsonArrayItems:
+    """Feed text chunks, get back the completed objects of the top-level array,
+    or of the array under one of keys in the top-level object"""
+
+    def __init__(self, keys=()):
+        self._keys = set(keys)
+        self._text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string = None       # raw characters of the open string, for strings of the top-level object
+        self._last_string = None  # the last one closed; a key when a value follows
+        self._array_depth = None  # nesting depth inside the array once found; -1 after it closed
+        self._item_start = None
+
+    def feed(self, chunk):
+        """Objects completed by this chunk, in order"""
+        self._text += chunk
+        items = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string is not None:
+                        self._last_string = self._decode(self._string)
+                        self._string = None
+                        continue
+                if self._string is not None:
+                    self._string.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._string = [] if self._depth == 1 else None
+            elif ch in '[{':
+                if ch == '[' and self._array_depth is None and self._is_answers():
+                    self._array_depth = self._depth + 1
+                elif ch == '{' and self._depth == self._array_depth and self._item_start is None:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in ']}':
+                self._depth -= 1
+                if ch == '}' and self._item_start is not None and self._depth == self._array_depth:
+                    try:
+                        items.append(json.loads(text[self._item_start:i + 1]))
+                    except ValueError:
+                        pass  # left to the final parse
+                    self._item_start = None
+                elif ch == ']' and self._depth == (self._array_depth or 0) - 1:
+                    self._array_depth = -1
+
+        # Keep only the unfinished element, so a long response isn't rescanned
+        keep = self._item_start if self._item_start is not None else len(text)
+        self._text = text[keep:]
+        self._pos = len(text) - keep
+        if self._item_start is not None:
+            self._item_start = 0
+        return items
+
+    def _is_answers(self):
+        return self._depth == 0 or self._depth == 1 and self._last_string in self._keys
+
+    @staticmethod
+    def _decode(chars):
+        try:
+            return json.loads('"' + ''.join(chars) + '"')
+        except ValueError:
+            return None
@@ -0,0 +1,285 @@
+"""
+Gateway for every model call
+Steps call generate_content() with their step name. The gateway
+- waits on token buckets sized to the quota (requests and tokens per minute),
+- retries 429 / 5xx / connection errors with jittered exponential backoff,
+- trips a circuit breaker after repeated failures, so calls fail fast with
+  LLMUnavailableError (and grading jobs are deferred) until the backend
+  recovers,
+- and records latency, token usage and failures per step (see metrics.py).
+generate_content_stream() is the streaming variant, used by step 3 to hand
+answers to step 4 while the response is still being written.
+"""
+import time
+import random
+import threading
+
+from google.genai import errors as genai_errors
+
+from config import (client, MODEL_NAME, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE,
+                    LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_RATE_LIMIT_MAX_WAIT,
+                    LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN)
+from metrics import (registry, Counter, Gauge, Histogram, STEP_BUCKETS,
+                     llm_latency, llm_errors, record_usage)
+
+try:
+    import httpx
+    _TRANSPORT_ERRORS = (ConnectionError, TimeoutError, httpx.TransportError)
+except ImportError:  # pragma: no cover
+    _TRANSPORT_ERRORS = (ConnectionError, TimeoutError)
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+PDF_PAGE_TOKENS = 258          # Gemini bills each PDF page as an image of this size
+PDF_BYTES_PER_PAGE = 50 * 1024  # rough size of a scanned page, for estimates only
+FILE_REFERENCE_PAGES = 10       # size of a Files API reference is unknown up front
+
+llm_retries = registry.register(Counter(
+    'paper_checker_llm_retries_total', 'Model calls retried after a retryable error',
+    ('step', 'error')))
+llm_rate_limit_wait = registry.register(Histogram(
+    'paper_checker_llm_rate_limit_wait_seconds', 'Time spent waiting on the rate limiter',
+    ('step',), buckets=STEP_BUCKETS))
+llm_first_chunk = registry.register(Histogram(
+    'paper_checker_llm_first_chunk_seconds', 'Time from a streaming call to its first chunk',
+    ('step',), buckets=STEP_BUCKETS))
+
+class LLMUnavailableError(Exception):
+    """The model backend is unhealthy or over quota; try again after retry_after seconds"""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at per_minute / 60 per second.
+    per_minute <= 0 disables the limit."""
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1, timeout=None):
+        """Take amount tokens, waiting up to timeout seconds; False on timeout"""
+        if self.rate <= 0:
+            return True
+        amount = min(amount, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, delta):
+        """Charge (or refund) the difference once the real usage is known"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+class CircuitBreaker:
+    """Opens after threshold consecutive failures; after cooldown one probe call
+    is let through (half-open) and its outcome closes or re-opens the breaker.
+    A probe that has not reported back within another cooldown is replaced."""
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._probe_at = now
+                return True
+            if self.state == self.HALF_OPEN and now - self._probe_at >= self.cooldown:
+                # The last probe never reported back; let another one through
+                self._probe_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    print(f"--- LLM circuit breaker open after {self.failures} failures ---")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def retry_after(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0
+            return max(1.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+request_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+token_bucket = TokenBucket(LLM_TOKENS_PER_MINUTE)
+breaker = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN)
+
+registry.register(Gauge(
+    'paper_checker_llm_circuit_open', 'Whether the model circuit breaker is open (1) or closed (0)', (),
+    lambda: {(): 0 if breaker.state == CircuitBreaker.CLOSED else 1}))
+
+def estimate_tokens(contents):
+    """Rough input token count used to charge the token bucket before a call"""
+    total = 0
+    for item in contents if isinstance(contents, list) else [contents]:
+        if isinstance(item, str):
+            total += len(item) // 4 + 1
+        elif getattr(item, 'inline_data', None) is not None:
+            total += max(1, len(item.inline_data.data or b'') // PDF_BYTES_PER_PAGE) * PDF_PAGE_TOKENS
+        elif getattr(item, 'file_data', None) is not None:
+            total += FILE_REFERENCE_PAGES * PDF_PAGE_TOKENS
+        elif getattr(item, 'text', None):
+            total += len(item.text) // 4 + 1
+    return total
+
+def is_retryable(error):
+    if isinstance(error, genai_errors.APIError):
+        return error.code in RETRYABLE_STATUS
+    return isinstance(error, _TRANSPORT_ERRORS)
+
+def unavailable_error(error):
+    """The LLMUnavailableError behind error (e.g. wrapped in a PipelineError), or None"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, LLMUnavailableError):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+def _backoff(attempt, error):
+    """Full-jitter exponential backoff, stretched to the server's Retry-After if given"""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    response = getattr(error, 'response', None)
+    retry_after = getattr(response, 'headers', {}).get('retry-after') if response is not None else None
+    try:
+        delay = max(delay, min(LLM_BACKOFF_MAX, float(retry_after)))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+def _acquire(step, estimate):
+    start = time.perf_counter()
+    ok = (request_bucket.acquire(1, timeout=LLM_RATE_LIMIT_MAX_WAIT) and
+          token_bucket.acquire(estimate, timeout=LLM_RATE_LIMIT_MAX_WAIT))
+    llm_rate_limit_wait.observe(time.perf_counter() - start, step=step)
+    if not ok:
+        llm_errors.inc(step=step, error='RateLimitWait')
+        raise LLMUnavailableError(f"Rate limiter wait exceeded {LLM_RATE_LIMIT_MAX_WAIT}s", LLM_BREAKER_COOLDOWN)
+
+def _failed(step, error, attempt, start, retry):
+    """Record a failed call and back off before the next attempt; raises when it is not retried"""
+    llm_latency.observe(time.perf_counter() - start, step=step)
+    llm_errors.inc(step=step, error=type(error).__name__)
+    if not is_retryable(error):
+        breaker.record_success()  # the backend answered; the request itself was bad
+        raise error
+    breaker.record_failure()
+    if not retry or attempt == LLM_MAX_RETRIES:
+        if breaker.state != CircuitBreaker.CLOSED:
+            # Not just this request: the backend is failing, so callers should retry later
+            raise LLMUnavailableError(f"Model backend unavailable: {error}", breaker.retry_after()) from error
+        raise error
+    llm_retries.inc(step=step, error=type(error).__name__)
+    time.sleep(_backoff(attempt, error))
+
+def _succeeded(step, start, usage, estimate):
+    llm_latency.observe(time.perf_counter() - start, step=step)
+    breaker.record_success()
+    record_usage(step, usage)
+    actual = getattr(usage, 'prompt_token_count', None)
+    if actual:
+        token_bucket.adjust(actual - estimate)
+
+def _admit(step, estimate):
+    # Rate limit first: a limiter timeout must not use up the half-open probe
+    _acquire(step, estimate)
+    if not breaker.allow():
+        request_bucket.adjust(-1)
+        token_bucket.adjust(-estimate)
+        llm_errors.inc(step=step, error='CircuitOpen')
+        raise LLMUnavailableError("Model backend unavailable (circuit open)", breaker.retry_after())
+
+def generate_content(step, contents, config=None):
+    """client.models.generate_content for MODEL_NAME through the limiter, retries and breaker"""
+    estimate = estimate_tokens(contents)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        _admit(step, estimate)
+        start = time.perf_counter()
+        recorded = False
+        try:
+            try:
+                response = client.models.generate_content(model=MODEL_NAME, contents=contents, config=config)
+            except Exception as e:
+                recorded = True
+                _failed(step, e, attempt, start, retry=True)
+                continue
+            _succeeded(step, start, getattr(response, 'usage_metadata', None), estimate)
+            recorded = True
+            return response
+        finally:
+            if not recorded:
+                breaker.record_failure()  # e.g. interrupted; never leave a probe unresolved
+
+def generate_content_stream(step, contents, config=None):
+    """client.models.generate_content_stream through the same limiter, retries
+    and breaker, yielding the response text as it arrives. Only failures
+    before the first chunk are retried: after that the caller may already
+    have acted on part of the text."""
+    estimate = estimate_tokens(contents)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        _admit(step, estimate)
+        start = time.perf_counter()
+        usage, received, recorded = None, False, False
+        try:
+            try:
+                for chunk in client.models.generate_content_stream(model=MODEL_NAME, contents=contents,
+                                                                   config=config):
+                    if not received:
+                        llm_first_chunk.observe(time.perf_counter() - start, step=step)
+                        received = True
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    if chunk.text:
+                        yield chunk.text
+            except Exception as e:
+                recorded = True
+                _failed(step, e, attempt, start, retry=not received)
+                continue
+            _succeeded(step, start, usage, estimate)
+            recorded = True
+            return
+        finally:
+            if not recorded:
+                breaker.record_failure()  # e.g. the caller closed the stream early
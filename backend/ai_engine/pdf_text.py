@@ -0,0 +1,95 @@
+"""
+Local text extraction for born-digital PDFs
+Typed question papers and solutions carry a real text layer; sending that
+text costs far fewer input tokens than the PDF itself. prepare_pdf()
+checks whether a PDF has usable embedded text and returns either a
+page-delimited text block or the usual PDF part (file handle or inline
+bytes) for scanned and handwritten papers. pypdf is optional; without it
+every PDF takes the multimodal path.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import List, Optional
+
+from config import PDF_TEXT_FAST_PATH, PDF_TEXT_MIN_CHARS_PER_PAGE
+from ai_engine.files import pdf_part, is_fresh
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - fast path disabled
+    PdfReader = None
+
+PATH_TEXT = 'text'
+PATH_FILE = 'file'
+PATH_INLINE = 'inline'
+
+_MEMO_SIZE = 32
+_memo = OrderedDict()  # sha256 -> pages or None
+_memo_lock = threading.Lock()
+
+def _usable(pages: List[str]) -> bool:
+    """Enough real characters on (nearly) every page to be a text layer, not OCR noise"""
+    if not pages:
+        return False
+    lengths = [len(''.join(page.split())) for page in pages]
+    if sum(lengths) < PDF_TEXT_MIN_CHARS_PER_PAGE * len(pages):
+        return False
+    # A few blank pages (covers, rough work) are fine; mostly-image documents are not
+    if sum(1 for n in lengths if n >= 20) < 0.8 * len(pages):
+        return False
+    text = ''.join(pages)
+    garbage = text.count('�') + text.count('(cid:')
+    return garbage <= 0.01 * len(text)
+
+def extract_pages(pdf_bytes: bytes) -> Optional[List[str]]:
+    """Text of each page when the PDF has a usable text layer, else None"""
+    if not PDF_TEXT_FAST_PATH or PdfReader is None or not pdf_bytes:
+        return None
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    with _memo_lock:
+        if digest in _memo:
+            _memo.move_to_end(digest)
+            return _memo[digest]
+
+    try:
+        reader = PdfReader(BytesIO(pdf_bytes))
+        pages = [(page.extract_text() or '').strip() for page in reader.pages]
+    except Exception:
+        pages = None
+    if pages is not None and not _usable(pages):
+        pages = None
+
+    with _memo_lock:
+        _memo[digest] = pages
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return pages
+
+def format_pages(pages: List[str]) -> str:
+    """Page-delimited text block sent in place of the PDF"""
+    body = '\n\n'.join(f"--- Page {i} ---\n{text}" for i, text in enumerate(pages, 1))
+    return f"The document below is the extracted text layer of the PDF, one block per page.\n\n{body}"
+
+class PdfInput:
+    """What a step sends for one PDF and which path produced it"""
+    def __init__(self, path, part, cache_input):
+        self.path = path
+        self.part = part
+        self.cache_input = cache_input
+
+def prepare_pdf(pdf_bytes: bytes, file_handle=None) -> PdfInput:
+    """Text block for born-digital PDFs, file reference or inline bytes otherwise"""
+    pages = extract_pages(pdf_bytes)
+    if pages is not None:
+        text = format_pages(pages)
+        return PdfInput(PATH_TEXT, text, text)
+    path = PATH_FILE if is_fresh(file_handle) else PATH_INLINE
+    return PdfInput(path, pdf_part(pdf_bytes, file_handle), pdf_bytes)
+
+def input_path(pdf_bytes: bytes, file_handle=None) -> str:
+    """Which path prepare_pdf takes for this PDF"""
+    if extract_pages(pdf_bytes) is not None:
+        return PATH_TEXT
+    return PATH_FILE if is_fresh(file_handle) else PATH_INLINE
@@ -0,0 +1,192 @@
+"""
+Dependency-graph executor for the grading pipeline
+Steps declare which results they need; every step whose inputs are ready
+is started on a thread pool, so step 2 (faculty key) and step 3 (student
+extraction) run side by side once the structure exists. With
+STREAM_STUDENT_ANSWERS, step 4 does not wait for step 3 either: it starts
+with the key and grades each answer as step 3 streams it out.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import PIPELINE_STEP_TIMEOUT, PIPELINE_MAX_PARALLEL_STEPS, STREAM_STUDENT_ANSWERS
+from metrics import step_latency, step_errors
+from ai_engine.step1_structure import get_exam_structure
+from ai_engine.step2_faculty import create_faculty_key
+from ai_engine.step3_student import extract_student_answers, AnswerFeed
+from ai_engine.step4_grading import grade_student_paper
+from ai_engine.pdf_text import input_path
+
+class PipelineError(Exception):
+    """A pipeline step failed or timed out; remaining steps were cancelled"""
+    def __init__(self, step, message):
+        super().__init__(f"{step}: {message}")
+        self.step = step
+
+class PipelineStep:
+    def __init__(self, name: str, func: Callable[..., Any], requires: Sequence[str] = (),
+                 timeout: Optional[float] = None):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.timeout = timeout if timeout is not None else PIPELINE_STEP_TIMEOUT
+
+def _run_step(step: PipelineStep, kwargs: Dict[str, Any], timings: Dict[str, float]):
+    start = time.perf_counter()
+    try:
+        return step.func(**kwargs)
+    except Exception as e:
+        step_errors.inc(step=step.name, error=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        step_latency.observe(elapsed, step=step.name)
+        timings[step.name] = round(elapsed, 3)
+
+def run_dag(steps: List[PipelineStep], seed: Optional[Dict[str, Any]] = None,
+            max_workers: int = PIPELINE_MAX_PARALLEL_STEPS,
+            timings: Optional[Dict[str, float]] = None,
+            on_result: Optional[Callable[[str, Any], None]] = None,
+            on_start: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Run steps as soon as their requirements are available.
+    seed holds already-known results (e.g. a stored faculty key); steps
+    producing a seeded name are skipped. Each step function receives its
+    requirements as keyword arguments. Wall time per step is written to
+    timings when given, and on_result(name, result) is called as each step
+    finishes, so callers can keep partial results if a later step fails.
+    on_start(name) is called as each step is started."""
+    timings = timings if timings is not None else {}
+    results = dict(seed or {})
+    pending = {s.name: s for s in steps if s.name not in results}
+    known = set(results) | set(pending)
+    for step in pending.values():
+        missing = [r for r in step.requires if r not in known]
+        if missing:
+            raise ValueError(f"Step '{step.name}' requires unknown inputs: {missing}")
+
+    running = {}  # future -> (step, deadline)
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="pipeline")
+    try:
+        while pending or running:
+            for name in [n for n, s in pending.items() if all(r in results for r in s.requires)]:
+                step = pending.pop(name)
+                kwargs = {r: results[r] for r in step.requires}
+                future = executor.submit(_run_step, step, kwargs, timings)
+                if on_start is not None:
+                    on_start(step.name)
+                running[future] = (step, time.monotonic() + step.timeout)
+
+            if not running:
+                raise PipelineError(next(iter(pending)), "dependency cycle")
+
+            next_deadline = min(deadline for _, deadline in running.values())
+            done, _ = wait(running, timeout=max(0, next_deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                step, _ = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    raise PipelineError(step.name, str(error)) from error
+                results[step.name] = future.result()
+                if on_result is not None:
+                    on_result(step.name, results[step.name])
+
+            now = time.monotonic()
+            for future, (step, deadline) in running.items():
+                if now >= deadline and not future.done():
+                    step_errors.inc(step=step.name, error='Timeout')
+                    raise PipelineError(step.name, f"timed out after {step.timeout}s")
+    finally:
+        # Drop queued steps; a step already talking to the model finishes in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+def run_grading_pipeline(question_pdf: bytes = None, solution_pdf: bytes = None,
+                         student_pdf: bytes = None, structure=None, faculty_key=None,
+                         bypass_cache: bool = False, until: str = 'grading_result',
+                         question_file=None, solution_file=None, student_file=None,
+                         student_answers=None, on_result=None, reuse_results=None,
+                         answer_groups=None, on_start=None, on_question=None) -> Dict[str, Any]:
+    """Run the four ai_engine steps as a graph.
+    Pass structure / faculty_key / student_answers when they are already
+    known to skip steps 1, 2 and 3. until='faculty_key' stops after building
+    the key. on_result and on_start are passed to run_dag, and reuse_results
+    (earlier per-question results), answer_groups and on_question to
+    grade_student_paper.
+    When step 3 runs and STREAM_STUDENT_ANSWERS is set, grading_result
+    starts without waiting for student_answers and is fed each answer as
+    step 3 streams it (step3_student.AnswerFeed).
+    *_file are Files API handles (ai_engine/files.py) used instead of
+    sending the matching PDF inline. The result's 'input_paths' records
+    whether each PDF that was read went as text, file handle or inline bytes,
+    and 'timings' the seconds spent in each step that ran."""
+    steps = [
+        PipelineStep('structure',
+                     lambda: get_exam_structure(question_pdf, question_file, bypass_cache=bypass_cache)),
+        PipelineStep('faculty_key',
+                     lambda structure: create_faculty_key(
+                         structure, solution_pdf, solution_file, bypass_cache=bypass_cache),
+                     requires=['structure']),
+    ]
+    streaming = STREAM_STUDENT_ANSWERS and until != 'faculty_key' and student_answers is None
+    if streaming:
+        feed = AnswerFeed()
+
+        def extract(structure):
+            try:
+                result = extract_student_answers(structure, student_pdf, student_file,
+                                                 bypass_cache=bypass_cache, on_answer=feed.put)
+            except Exception as e:
+                feed.close(error=e)
+                raise
+            feed.close(result=result)
+            return result
+
+        steps += [
+            PipelineStep('student_answers', extract, requires=['structure']),
+            PipelineStep('grading_result',
+                         lambda faculty_key, structure: grade_student_paper(
+                             None, faculty_key, bypass_cache=bypass_cache,
+                             structure=structure, reuse=reuse_results, groups=answer_groups,
+                             on_question=on_question, answer_feed=feed),
+                         requires=['faculty_key', 'structure']),
+        ]
+    elif until != 'faculty_key':
+        steps += [
+            PipelineStep('student_answers',
+                         lambda structure: extract_student_answers(
+                             structure, student_pdf, student_file, bypass_cache=bypass_cache),
+                         requires=['structure']),
+            PipelineStep('grading_result',
+                         lambda student_answers, faculty_key, structure: grade_student_paper(
+                             student_answers, faculty_key, bypass_cache=bypass_cache,
+                             structure=structure, reuse=reuse_results, groups=answer_groups,
+                             on_question=on_question),
+                         requires=['student_answers', 'faculty_key', 'structure']),
+        ]
+
+    seed = {}
+    if structure is not None:
+        seed['structure'] = structure
+    if faculty_key is not None:
+        seed['faculty_key'] = faculty_key
+    if student_answers is not None and until != 'faculty_key':
+        seed['student_answers'] = student_answers
+    start = time.perf_counter()
+    timings = {}
+    results = run_dag(steps, seed=seed, timings=timings, on_result=on_result, on_start=on_start)
+    timings['total'] = round(time.perf_counter() - start, 3)
+
+    paths = {}
+    if 'structure' not in seed:
+        paths['question'] = input_path(question_pdf, question_file)
+    if 'faculty_key' not in seed:
+        paths['solution'] = input_path(solution_pdf, solution_file)
+    if until != 'faculty_key' and 'student_answers' not in seed:
+        paths['student'] = input_path(student_pdf, student_file)
+    results['input_paths'] = paths
+    results['timings'] = timings
+    return results
@@ -0,0 +1,95 @@
+"""
+Local pre-grading ahead of step 4
+Answer-length and keyword-coverage statistics are computed for every
+question of a paper in one pass; step 4 passes them to the model as a hint
+next to each answer. Questions that need no judgment are scored 0 here
+without a model call: those step 3 marked "unanswered" and those it
+returned with empty answer text. Every answer with text goes to the model,
+however short: "B", "42" or "Mitochondria" can be worth full marks.
+Questions step 3 did not return at all are never scored here; step 4
+grades such a paper whole (see question_inputs).
+"""
+import re
+
+from config import PREGRADE_ENABLED
+from metrics import registry, Counter
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# Fields of a step 3 answer that describe it rather than hold the student's text
+_META_FIELDS = {'id', 'question_id', 'questionId', 'question_number', 'question', 'status', 'max_marks'}
+
+pregraded_questions = registry.register(Counter(
+    'paper_checker_pregraded_questions_total', 'Questions scored locally without a model call, by reason',
+    ('reason',)))
+
+def answer_text(answer):
+    """All text the student wrote for a question, including sub-parts"""
+    if isinstance(answer, str):
+        return answer
+    if isinstance(answer, dict):
+        if answer.get('status') == 'unanswered':
+            return ''
+        return ' '.join(_part_text(v) if k == 'sub_parts' else answer_text(v)
+                        for k, v in answer.items() if k not in _META_FIELDS)
+    if isinstance(answer, list):
+        return ' '.join(answer_text(v) for v in answer)
+    return ''
+
+def _part_text(parts):
+    """Text of answered sub-parts; bare labels ("a", "b") copied from the structure are not answers"""
+    if isinstance(parts, list):
+        return ' '.join(answer_text(p) for p in parts if not isinstance(p, str))
+    return answer_text(parts)
+
+def _keywords(key):
+    keywords = key.get('keywords') if isinstance(key, dict) else None
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    phrases = [' '.join(_WORD.findall(str(k).lower())) for k in keywords or []]
+    return [p for p in phrases if p]
+
+def answer_stats(inputs):
+    """{question ID: {"words", "keywords", "keywordHits", "keywordCoverage", "unanswered"}}
+    for every (answer, key slice) in inputs, as built by step 4's question_inputs"""
+    stats = {}
+    for question_id, (answer, key) in inputs.items():
+        words = _WORD.findall(answer_text(answer).lower())
+        # Padded with spaces so multi-word keywords only match whole words
+        text = f" {' '.join(words)} "
+        keywords = _keywords(key)
+        hits = sum(1 for k in keywords if f" {k} " in text)
+        stats[question_id] = {
+            "words": len(words),
+            "keywords": len(keywords),
+            "keywordHits": hits,
+            "keywordCoverage": round(hits / len(keywords), 3) if keywords else None,
+            "unanswered": not words
+        }
+    return stats
+
+def describe_stats(stat):
+    """One-line summary of an answer's statistics for a grading prompt"""
+    note = f"{stat['words']} words"
+    if stat['keywords']:
+        note += f", {stat['keywordHits']} of {stat['keywords']} key keywords present"
+    return note
+
+def pregrade(inputs):
+    """Local results for the questions in inputs that need no model call,
+    {question ID: QuestionResult}, and the statistics for all of them"""
+    stats = answer_stats(inputs)
+    if not PREGRADE_ENABLED:
+        return {}, stats
+
+    results = {}
+    for question_id, stat in stats.items():
+        if not stat['unanswered']:
+            continue
+        pregraded_questions.inc(reason='unanswered')
+        results[question_id] = {
+            "question_id": question_id,
+            "marks_obtained": 0.0,
+            "max_marks": inputs[question_id][1].get('max_marks', 0),
+            "feedback": "Not answered."
+        }
+    return results, stats
@@ -1,8 +1,12 @@
 import json
-from google.genai import types
-from config import client, MODEL_NAME
+from ai_engine.cache import llm_cache
+from ai_engine.llm import generate_content
+from ai_engine.pdf_text import prepare_pdf
 
-def get_exam_structure(pdf_bytes):
+# Bump when the prompt changes so cached responses are not reused
+PROMPT_VERSION = 1
+
+def get_exam_structure(pdf_bytes, file_handle=None, bypass_cache=False):
     print("--- Step 1: Extracting Exam Structure ---")
     
     prompt = """
@@ -16,13 +20,18 @@ def get_exam_structure(pdf_bytes):
     RETURN ONLY JSON.
     """
 
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=[
-            types.Part.from_bytes(data=pdf_bytes, mime_type="application/pdf"),
-            prompt
-        ],
-        config={"response_mime_type": "application/json"}
-    )
+    source = prepare_pdf(pdf_bytes, file_handle)
+
+    def generate():
+        response = generate_content(
+            "step1_structure",
+            contents=[
+                source.part,
+                prompt
+            ],
+            config={"response_mime_type": "application/json"}
+        )
     
-    return json.loads(response.text)
\ No newline at end of file
+        return json.loads(response.text)
+
+    return llm_cache.cached("step1_structure", PROMPT_VERSION, [source.cache_input], generate, bypass=bypass_cache)
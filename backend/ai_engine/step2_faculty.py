@@ -1,8 +1,12 @@
 import json
-from google.genai import types
-from config import client, MODEL_NAME
+from ai_engine.cache import llm_cache
+from ai_engine.llm import generate_content
+from ai_engine.pdf_text import prepare_pdf
 
-def create_faculty_key(exam_structure, solution_pdf_bytes):
+# Bump when the prompt changes so cached responses are not reused
+PROMPT_VERSION = 1
+
+def create_faculty_key(exam_structure, solution_pdf_bytes, file_handle=None, bypass_cache=False):
     print("--- Step 2: Creating Faculty Key ---")
 
     prompt = f"""
@@ -18,13 +22,18 @@ def create_faculty_key(exam_structure, solution_pdf_bytes):
     Return a JSON list matching the exam structure.
     """
 
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=[
-            types.Part.from_bytes(data=solution_pdf_bytes, mime_type="application/pdf"),
-            prompt
-        ],
-        config={"response_mime_type": "application/json"}
-    )
+    source = prepare_pdf(solution_pdf_bytes, file_handle)
+
+    def generate():
+        response = generate_content(
+            "step2_faculty",
+            contents=[
+                source.part,
+                prompt
+            ],
+            config={"response_mime_type": "application/json"}
+        )
     
-    return json.loads(response.text)
\ No newline at end of file
+        return json.loads(response.text)
+
+    return llm_cache.cached("step2_faculty", PROMPT_VERSION, [exam_structure, source.cache_input], generate, bypass=bypass_cache)
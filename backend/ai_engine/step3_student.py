@@ -1,8 +1,63 @@
 import json
-from google.genai import types
-from config import client, MODEL_NAME
+import queue
+import threading
+from ai_engine.cache import llm_cache
+from ai_engine.llm import generate_content, generate_content_stream, is_retryable, LLMUnavailableError
+from ai_engine.json_stream import JsonArrayItems
+from ai_engine.pdf_text import prepare_pdf
 
-def extract_student_answers(exam_structure, student_pdf_bytes):
+# Bump when the prompt changes so cached responses are not reused
+PROMPT_VERSION = 1
+# Wrapper keys the model puts the answer list under
+ANSWER_KEYS = ('answers', 'student_answers')
+
+class AnswerFeed:
+    """Answers handed from step 3 to step 4 while the extraction is still
+    running: put() each question's answer as it is parsed, then close() with
+    the complete extraction or the error that ended it. Iterating yields the
+    answers until close(); result() waits for the complete extraction."""
+    _END = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        self._result = None
+        self._error = None
+
+    def put(self, answer):
+        self._queue.put(answer)
+
+    def close(self, result=None, error=None):
+        self._result, self._error = result, error
+        self._closed.set()
+        self._queue.put(self._END)
+
+    def __iter__(self):
+        while True:
+            answer = self._queue.get()
+            if answer is self._END:
+                return
+            yield answer
+
+    def result(self):
+        self._closed.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+def _answer_items(data):
+    """The question objects of an extraction: a bare list, the list under an
+    answer key of a wrapper object, or else the wrapper's only list"""
+    if isinstance(data, dict):
+        keyed = [data[k] for k in ANSWER_KEYS if isinstance(data.get(k), list)]
+        lists = [v for v in data.values() if isinstance(v, list)]
+        data = keyed[0] if keyed else lists[0] if len(lists) == 1 else []
+    return [item for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+
+def extract_student_answers(exam_structure, student_pdf_bytes, file_handle=None, bypass_cache=False, on_answer=None):
+    """Extract the student's answer to each question. With on_answer, the
+    response is streamed and on_answer(answer) is called with each question's
+    answer as soon as it is complete (all at once on a cache hit)."""
     print("--- Step 3: Extracting Student Answers ---")
 
     prompt = f"""
@@ -17,13 +72,48 @@ def extract_student_answers(exam_structure, student_pdf_bytes):
     Return JSON filled with student data.
     """
 
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=[
-            types.Part.from_bytes(data=student_pdf_bytes, mime_type="application/pdf"),
-            prompt
-        ],
-        config={"response_mime_type": "application/json"}
-    )
-    
-    return json.loads(response.text)
\ No newline at end of file
+    source = prepare_pdf(student_pdf_bytes, file_handle)
+    emitted = []
+
+    def emit(answer):
+        if answer not in emitted:
+            emitted.append(answer)
+            on_answer(answer)
+
+    def generate():
+        if on_answer is not None:
+            parser, chunks = JsonArrayItems(ANSWER_KEYS), []
+            try:
+                for text in generate_content_stream(
+                        "step3_student",
+                        contents=[source.part, prompt],
+                        config={"response_mime_type": "application/json"}):
+                    chunks.append(text)
+                    for answer in parser.feed(text):
+                        emit(answer)
+                return json.loads(''.join(chunks))
+            except LLMUnavailableError:
+                raise
+            except Exception as e:
+                if not chunks or not is_retryable(e):
+                    raise
+                # The stream broke after some answers were handed on; finish with a regular call
+                print(f"--- Step 3: stream interrupted ({e}), retrying without streaming ---")
+
+        response = generate_content(
+            "step3_student",
+            contents=[
+                source.part,
+                prompt
+            ],
+            config={"response_mime_type": "application/json"}
+        )
+
+        return json.loads(response.text)
+
+    result = llm_cache.cached("step3_student", PROMPT_VERSION, [exam_structure, source.cache_input], generate, bypass=bypass_cache)
+    if on_answer is not None:
+        # Cache hits, and anything the incremental parser could not place
+        for answer in _answer_items(result):
+            emit(answer)
+    return result
@@ -1,6 +1,17 @@
 import json
+import time
+import threading
 import typing_extensions as typing
-from config import client, MODEL_NAME
+from concurrent.futures import ThreadPoolExecutor
+from config import GRADING_MODE, GRADING_QUESTION_CONCURRENCY, GRADING_QUESTION_RETRIES
+from ai_engine.cache import llm_cache
+from ai_engine.llm import generate_content, LLMUnavailableError
+from ai_engine.pregrade import pregrade, describe_stats
+from ai_engine.step3_student import ANSWER_KEYS
+from artifacts import artifact_hash
+
+# Bump when the prompt changes so cached responses are not reused
+PROMPT_VERSION = 2
 
 # Define the Output Schema strictly for the AI
 class QuestionResult(typing.TypedDict):
@@ -15,29 +26,324 @@ class FinalReportCard(typing.TypedDict):
     total_score: float
     remarks: str
 
-def grade_student_paper(student_data, faculty_data):
+def grade_student_paper(student_data, faculty_data, bypass_cache=False, mode=None, structure=None, reuse=None,
+                        groups=None, on_question=None, answer_feed=None):
+    """Grade a paper. mode='per_question' (default from GRADING_MODE) grades
+    each question in its own call; mode='whole' uses one call for the paper.
+    structure, reuse, groups, on_question and answer_feed are passed to
+    grade_per_question; in whole mode on_question gets every result once the
+    paper is graded, and answer_feed is only waited on for the full answers."""
+    if (mode or GRADING_MODE) == 'per_question':
+        report = grade_per_question(student_data, faculty_data, bypass_cache=bypass_cache,
+                                    structure=structure, reuse=reuse, groups=groups, on_question=on_question,
+                                    answer_feed=answer_feed)
+        if report is not None:
+            return report
+    if answer_feed is not None:
+        student_data = answer_feed.result()
+    report = _grade_whole(student_data, faculty_data, bypass_cache, structure)
+    if on_question is not None:
+        for result in report.get('results') or []:
+            on_question(result)
+    return report
+
+def _grade_whole(student_data, faculty_data, bypass_cache, structure):
+    """One call for the whole paper, with locally scored questions left out of the prompt"""
+    # Unanswered questions are scored locally and left out of the prompt
+    local, stats = pregrade(question_inputs(student_data, faculty_data, structure))
+    notes = {q: describe_stats(stat) for q, stat in stats.items() if q not in local}
+    if local:
+        student_data = [a for q, a in _index_by_question(student_data).items() if q not in local]
+        faculty_data = [k for q, k in _index_by_question(faculty_data).items() if q not in local]
+        if not faculty_data:
+            return {
+                "student_name": "",
+                "results": list(local.values()),
+                "total_score": 0.0,
+                "remarks": "No questions were answered."
+            }
+
     print("--- Step 4: Grading Paper ---")
 
     prompt = f"""
     You are a strict Professor.
     Student Answers: {json.dumps(student_data)}
     Faculty Key: {json.dumps(faculty_data)}
+    Answer Statistics: {json.dumps(notes)}
 
     Grading Rules:
     1. Use max_marks from the structure.
     2. Check for keywords and conceptual clarity.
     3. If description matches diagram requirements, give marks.
+    4. Answer statistics are counted locally per question ID; use them as a hint only.
     
     Return the Final Report Card JSON.
     """
 
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": FinalReportCard
-        }
-    )
+    def generate():
+        response = generate_content(
+            "step4_grading",
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": FinalReportCard
+            }
+        )
     
-    return json.loads(response.text)
\ No newline at end of file
+        return json.loads(response.text)
+
+    report = llm_cache.cached("step4_grading", PROMPT_VERSION, [student_data, faculty_data, notes], generate,
+                              bypass=bypass_cache)
+    if local:
+        report = {**report, "results": list(report.get('results') or []) + list(local.values())}
+    return report
+
+_ID_FIELDS = ('question_id', 'id', 'questionId', 'question_number', 'question')
+# Top-level fields of a step 3 object that are not keyed by question ID
+_PAPER_FIELDS = {'student_name', 'name', 'remarks', 'total_score'}
+
+def _question_id(item):
+    for field in _ID_FIELDS:
+        value = item.get(field)
+        if isinstance(value, (str, int)) and not isinstance(value, bool):
+            return str(value)
+    return None
+
+def _index_by_question(data):
+    """Map question ID -> entry for the shapes steps 2 and 3 return: a list of
+    question objects (possibly nested in lists or in a wrapper object), or an
+    object keyed by question ID. Empty when no question can be identified."""
+    if isinstance(data, list):
+        index = {}
+        for item in data:
+            if isinstance(item, list):
+                for question_id, entry in _index_by_question(item).items():
+                    index.setdefault(question_id, entry)
+            elif isinstance(item, dict) and _question_id(item) is not None:
+                index.setdefault(_question_id(item), item)
+        return index
+    if not isinstance(data, dict):
+        return {}
+    lists = [data[k] for k in ANSWER_KEYS if isinstance(data.get(k), list)]
+    lists = lists[:1] or [v for v in data.values() if isinstance(v, list)]
+    if len(lists) == 1:
+        index = _index_by_question(lists[0])
+        if index:
+            return index
+    # {"Q1": "text", ...} or {"Q1": {...}, ...}
+    return {str(k): {**v, "question_id": str(k)} if isinstance(v, dict) else {"question_id": str(k), "extracted_text": v}
+            for k, v in data.items() if k not in _PAPER_FIELDS and isinstance(v, (str, dict))}
+
+def _student_name(student_data):
+    if isinstance(student_data, dict):
+        return student_data.get('student_name') or student_data.get('name') or ""
+    return ""
+
+def grade_question(question_id, answer, key, bypass_cache=False, note=None):
+    """Grade one question against its slice of the faculty key; note is the
+    answer's locally computed statistics (pregrade.describe_stats)"""
+    prompt = f"""
+    You are a strict Professor grading a single question.
+    Question ID: {question_id}
+    Student Answer: {json.dumps(answer)}
+    Faculty Key: {json.dumps(key)}
+    Answer Statistics: {note or "not available"}
+
+    Grading Rules:
+    1. Use max_marks from the key.
+    2. Check for keywords and conceptual clarity.
+    3. If description matches diagram requirements, give marks.
+    4. An unanswered question gets 0 marks.
+    5. Answer statistics are counted locally; use them as a hint only.
+
+    Return the Question Result JSON.
+    """
+
+    def generate():
+        response = generate_content(
+            "step4_question",
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": QuestionResult
+            }
+        )
+
+        result = json.loads(response.text)
+        if isinstance(result, list) and len(result) == 1:
+            result = result[0]
+        if not isinstance(result, dict) or 'marks_obtained' not in result:
+            raise ValueError(f"Malformed result for {question_id}")
+        float(result['marks_obtained'])
+        return result
+
+    return llm_cache.cached("step4_question", PROMPT_VERSION, [question_id, answer, key, note], generate,
+                            bypass=bypass_cache)
+
+def _grade_with_retries(question_id, answer, key, bypass_cache, note=None):
+    for attempt in range(GRADING_QUESTION_RETRIES + 1):
+        try:
+            return grade_question(question_id, answer, key, bypass_cache=bypass_cache, note=note), None
+        except LLMUnavailableError:
+            raise  # the whole paper is retried later, not scored as failed
+        except Exception as e:
+            error = e
+            if attempt < GRADING_QUESTION_RETRIES:
+                time.sleep(0.5 * 2 ** attempt)
+    return None, error
+
+def key_slices(faculty_data, structure=None):
+    """{question ID: key slice}, with the structure's max_marks, when given,
+    overriding the key's. Empty when the key cannot be split by question ID."""
+    marks = {q: item['max_marks'] for q, item in _index_by_question(structure).items()
+             if item.get('max_marks') is not None}
+    return {q: {**key, "max_marks": marks[q]} if q in marks else key
+            for q, key in _index_by_question(faculty_data).items()}
+
+def question_inputs(student_data, faculty_data, structure=None):
+    """{question ID: (answer, key slice)} exactly as each question is graded.
+    Empty when the key cannot be split by question ID, or when the extraction
+    has no entry for one of its questions: such a paper is graded whole."""
+    keys = key_slices(faculty_data, structure)
+    answer_index = _index_by_question(student_data)
+    if not keys or any(q not in answer_index for q in keys):
+        return {}
+    inputs = {q: (answer_index[q], key) for q, key in keys.items()}
+    for question_id, answer in answer_index.items():
+        inputs.setdefault(question_id, (answer, {}))
+    return inputs
+
+def question_input_hashes(student_data, faculty_data, structure=None):
+    """{question ID: hash of its answer and key slice}; a question needs regrading when this changes"""
+    return {q: artifact_hash([q, answer, key])
+            for q, (answer, key) in question_inputs(student_data, faculty_data, structure).items()}
+
+def _question_result(question_id, key, result, error):
+    """Final QuestionResult: marks clamped to the key's max_marks, or 0 with the error"""
+    max_marks = key.get('max_marks', (result or {}).get('max_marks', 0))
+    try:
+        max_marks = float(max_marks)
+    except (TypeError, ValueError):
+        max_marks = 0
+    if result is None:
+        marks, feedback = 0.0, f"Grading failed: {error}"
+    else:
+        marks = float(result.get('marks_obtained', 0))
+        if max_marks > 0:
+            marks = min(max(marks, 0.0), max_marks)
+        feedback = result.get('feedback', '')
+    return {
+        "question_id": question_id,
+        "marks_obtained": marks,
+        "max_marks": int(max_marks) if float(max_marks).is_integer() else max_marks,
+        "feedback": feedback
+    }
+
+def grade_per_question(student_data, faculty_data, bypass_cache=False, structure=None, reuse=None, groups=None,
+                       on_question=None, answer_feed=None):
+    """Fan out one call per question and merge into a FinalReportCard.
+    reuse maps question ID -> {"hash", "result"} from an earlier grading;
+    a question whose inputs still hash the same keeps that result instead of
+    being graded again. groups (answer_groups.AnswerGroups) shares results
+    between near-identical answers of a class; it is skipped when bypassing
+    the cache. on_question(result) is called as each question's result is
+    known, in completion order. answer_feed (step3_student.AnswerFeed)
+    replaces student_data while step 3 is still running: each question is
+    started as soon as its answer arrives, and the paper is completed from
+    the feed's final extraction. Returns None when the inputs cannot be split
+    by question ID (see question_inputs), for the paper to be graded whole."""
+    keys = key_slices(faculty_data, structure)
+    if not keys:
+        return None
+    lock = threading.RLock()
+
+    def emit(result):
+        if on_question is not None:
+            with lock:
+                on_question(result)
+
+    started = {}  # question ID -> (answer, key) its outcome is for
+    kept, outcomes, grading, reported = {}, {}, {}, set()
+
+    def report_graded(q, future):
+        """Emit a model-graded question once, from its worker or the collecting thread, whichever comes first"""
+        with lock:
+            if future in reported or grading.get(q) is not future:
+                return
+            reported.add(future)
+            emit(_question_result(q, started[q][1], *future.result()))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, GRADING_QUESTION_CONCURRENCY), thread_name_prefix="grade-q")
+
+    def start(q, answer, key):
+        with lock:
+            for earlier in (kept, outcomes, grading):
+                earlier.pop(q, None)
+            started[q] = (answer, key)
+        entry = (reuse or {}).get(q)
+        if entry and entry.get('hash') == artifact_hash([q, answer, key]):
+            kept[q] = entry['result']
+            emit(kept[q])
+            return
+        # Unanswered questions are scored locally
+        local, stats = pregrade({q: (answer, key)})
+        result = local.get(q)
+        if result is None and groups is not None and not bypass_cache:
+            result = groups.lookup(q, answer, key)
+        if result is not None:
+            outcomes[q] = (result, None)
+            emit(_question_result(q, key, result, None))
+            return
+        grading[q] = pool.submit(_grade_with_retries, q, answer, key, bypass_cache, describe_stats(stats[q]))
+        grading[q].add_done_callback(lambda f: f.cancelled() or f.exception() or report_graded(q, f))
+
+    try:
+        if answer_feed is not None:
+            for answer in answer_feed:
+                q = _question_id(answer)
+                if q in keys and q not in started:
+                    start(q, answer, keys[q])
+            student_data = answer_feed.result()
+        inputs = question_inputs(student_data, faculty_data, structure)
+        if not inputs:
+            return None
+        question_ids = list(inputs)
+        for q in question_ids:
+            # Streamed answers normally match the final extraction; anything else is (re)started here
+            if started.get(q) != inputs[q]:
+                start(q, *inputs[q])
+        print(f"--- Step 4: Grading Paper ({len(grading)} of {len(question_ids)} questions) ---")
+        for q, future in grading.items():
+            outcomes[q] = future.result()
+            report_graded(q, future)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    if groups is not None:
+        for q in grading:
+            if outcomes[q][0] is not None:
+                groups.record(q, *inputs[q], outcomes[q][0])
+
+    results, failed = [], []
+    for question_id in question_ids:
+        if question_id in kept:
+            results.append(kept[question_id])
+            continue
+        result, error = outcomes[question_id]
+        if result is None:
+            failed.append(question_id)
+        results.append(_question_result(question_id, inputs[question_id][1], result, error))
+
+    total_score = sum(r['marks_obtained'] for r in results)
+    max_total = sum(r['max_marks'] for r in results)
+    remarks = f"Scored {total_score:g} out of {max_total:g}."
+    if failed:
+        remarks += f" Could not grade: {', '.join(failed)}."
+    report = {
+        "student_name": _student_name(student_data),
+        "results": results,
+        "total_score": total_score,
+        "remarks": remarks
+    }
+    if failed:
+        report["failed_questions"] = failed
+    return report
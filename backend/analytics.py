@@ -0,0 +1,146 @@
+"""
+Per-assignment class analytics, maintained incrementally
+database.py applies each submission write to its assignment's aggregate
+inside the same transaction: the old version's contribution is subtracted
+and the new one's added, so the aggregate never needs a scan of the
+submissions. It keeps only sums and counts (scores by value for the
+median, a 10-bin percentage histogram, letter grades and per-question
+marks), which summarize() turns into the /analytics response.
+"""
+from datetime import datetime
+
+HISTOGRAM_BINS = 10
+
+def empty(assignment_id):
+    return {
+        "assignmentId": assignment_id,
+        "statusCounts": {},
+        "graded": 0,
+        "sumMarks": 0.0,
+        "sumPercentage": 0.0,
+        "scores": {},
+        "histogram": [0] * HISTOGRAM_BINS,
+        "grades": {},
+        "questions": {},
+        "updatedAt": None
+    }
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def contribution(submission):
+    """What one submission adds to its assignment's aggregate (None for no submission)"""
+    if not submission:
+        return None
+    part = {"status": submission.get('status') or 'pending', "graded": None}
+    ai_result = submission.get('aiResult')
+    if part['status'] == 'graded' and isinstance(ai_result, dict):
+        total, max_marks = _number(ai_result.get('totalMarks')), _number(ai_result.get('maxMarks'))
+        percentage = min(max(100 * total / max_marks, 0.0), 100.0) if max_marks > 0 else 0.0
+        questions = {}
+        for result in ai_result.get('detailedResults') or []:
+            if isinstance(result, dict) and result.get('question_id') is not None:
+                questions[str(result['question_id'])] = (_number(result.get('marks_obtained')),
+                                                         _number(result.get('max_marks')))
+        part['graded'] = {
+            "marks": total,
+            "percentage": percentage,
+            "bin": min(int(percentage * HISTOGRAM_BINS // 100), HISTOGRAM_BINS - 1),
+            "grade": ai_result.get('grade') or '-',
+            "questions": questions
+        }
+    return part
+
+def _bump(counts, key, delta):
+    counts[key] = counts.get(key, 0) + delta
+    if counts[key] <= 0:
+        del counts[key]
+
+def apply(aggregate, part, sign):
+    """Add (sign=1) or remove (sign=-1) a contribution in place"""
+    if part is None:
+        return aggregate
+    _bump(aggregate['statusCounts'], part['status'], sign)
+    graded = part['graded']
+    if graded:
+        aggregate['graded'] += sign
+        # Rounded so repeated add/remove doesn't accumulate float error
+        aggregate['sumMarks'] = round(aggregate['sumMarks'] + sign * graded['marks'], 6)
+        aggregate['sumPercentage'] = round(aggregate['sumPercentage'] + sign * graded['percentage'], 6)
+        _bump(aggregate['scores'], f"{graded['marks']:g}", sign)
+        aggregate['histogram'][graded['bin']] += sign
+        _bump(aggregate['grades'], graded['grade'], sign)
+        for question_id, (marks, max_marks) in graded['questions'].items():
+            entry = aggregate['questions'].setdefault(question_id, {"count": 0, "marks": 0.0, "maxMarks": 0.0})
+            entry['count'] += sign
+            entry['marks'] = round(entry['marks'] + sign * marks, 6)
+            entry['maxMarks'] = round(entry['maxMarks'] + sign * max_marks, 6)
+            if entry['count'] <= 0:
+                del aggregate['questions'][question_id]
+    return aggregate
+
+def update(aggregate, old, new):
+    """Aggregate after a submission changed from old to new (either may be None)"""
+    before, after = contribution(old), contribution(new)
+    if before == after:
+        return aggregate
+    apply(aggregate, before, -1)
+    apply(aggregate, after, 1)
+    aggregate['updatedAt'] = datetime.now().isoformat()
+    return aggregate
+
+def build(assignment_id, submissions):
+    """Aggregate for a whole class in one pass (backfill and rebuilds)"""
+    aggregate = empty(assignment_id)
+    for submission in submissions:
+        apply(aggregate, contribution(submission), 1)
+    aggregate['updatedAt'] = datetime.now().isoformat()
+    return aggregate
+
+def _median(scores):
+    """Median from {score: count} without expanding the counts"""
+    values = sorted((float(v), n) for v, n in scores.items())
+    count = sum(n for _, n in values)
+    if not count:
+        return None
+
+    def at(position):
+        seen = 0
+        for value, n in values:
+            seen += n
+            if seen > position:
+                return value
+
+    return round((at((count - 1) // 2) + at(count // 2)) / 2, 3)
+
+def summarize(aggregate):
+    """API shape: mean, median, histogram, grade counts and per-question difficulty"""
+    graded = aggregate['graded']
+    scores = [float(v) for v in aggregate['scores']]
+    width = 100 // HISTOGRAM_BINS
+    return {
+        "assignmentId": aggregate['assignmentId'],
+        "submissions": sum(aggregate['statusCounts'].values()),
+        "statusCounts": aggregate['statusCounts'],
+        "graded": graded,
+        "mean": round(aggregate['sumMarks'] / graded, 3) if graded else None,
+        "meanPercentage": round(aggregate['sumPercentage'] / graded, 2) if graded else None,
+        "median": _median(aggregate['scores']),
+        "min": min(scores) if scores else None,
+        "max": max(scores) if scores else None,
+        "histogram": [{"from": i * width, "to": (i + 1) * width, "count": n}
+                      for i, n in enumerate(aggregate['histogram'])],
+        "grades": aggregate['grades'],
+        "questions": [{
+            "questionId": question_id,
+            "graded": entry['count'],
+            "averageMarks": round(entry['marks'] / entry['count'], 3),
+            "maxMarks": round(entry['maxMarks'] / entry['count'], 3),
+            # Share of the available marks the class obtained: lower is harder
+            "difficulty": round(entry['marks'] / entry['maxMarks'], 3) if entry['maxMarks'] else None
+        } for question_id, entry in aggregate['questions'].items()],
+        "updatedAt": aggregate['updatedAt']
+    }
@@ -0,0 +1,116 @@
+"""
+Grading identical answers once per class
+Short answers to the same question are often word-for-word the same. For
+each (assignment, question, key slice), the first answer of a kind is graded
+by the model and stored as a group representative; later answers that
+normalise to the same text reuse its marks and feedback instead of another
+model call. Everything else is graded on its own and starts a new group.
+
+Near-identical answers are only grouped with ANSWER_GROUP_NEAR_MATCHES, since
+answers a few words apart can deserve different marks ("TCP" / "UDP",
+"from high to low" / "from low to high"). Then an answer joins a group when
+the cosine similarity of their hashed word-bigram vectors, which keep word
+order, is at least ANSWER_GROUP_THRESHOLD, and both contain the same numbers,
+negations and terms of the answer key.
+
+Only answers of up to ANSWER_GROUP_MAX_WORDS words are grouped.
+"""
+import re
+import zlib
+import math
+
+from config import (ANSWER_GROUPS_ENABLED, ANSWER_GROUP_NEAR_MATCHES, ANSWER_GROUP_THRESHOLD,
+                    ANSWER_GROUP_MAX_WORDS)
+from database import get_answer_groups, create_answer_group, add_answer_group_member
+from metrics import registry, Counter
+from artifacts import artifact_hash
+from ai_engine.pregrade import answer_text
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_NEGATIONS = {'no', 'not', 'never', 'none', 'nor', 'cannot', 'without', 'neither', 'nothing'}
+_DIMENSIONS = 1 << 20
+# Part of each group's key hash, so vectors stored in an earlier format are never compared
+_VECTOR_FORMAT = 'word-bigrams'
+
+grouped_questions = registry.register(Counter(
+    'paper_checker_grouped_questions_total', 'Question answers graded by reusing a group result, by match',
+    ('match',)))
+
+def normalize(text):
+    """Lowercase words only, so case, punctuation and spacing don't split a group"""
+    return ' '.join(_WORD.findall(text.lower()))
+
+def vectorize(normalized):
+    """L2-normalised hashed word-bigram counts, {bucket: weight}; the bigrams
+    include the first and last word at the boundaries, so word order counts"""
+    words = ['^'] + normalized.split() + ['$']
+    counts = {}
+    for pair in zip(words, words[1:]):
+        bucket = zlib.crc32(' '.join(pair).encode('utf-8')) % _DIMENSIONS
+        counts[bucket] = counts.get(bucket, 0) + 1
+    norm = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    return {str(b): c / norm for b, c in counts.items()}
+
+def cosine(vector, other):
+    if len(other) < len(vector):
+        vector, other = other, vector
+    return sum(weight * other.get(bucket, 0.0) for bucket, weight in vector.items())
+
+def _guard(normalized, key_terms):
+    """Tokens that must match exactly for two answers to share a group"""
+    words = normalized.split()
+    return (sorted(w for w in words if any(ch.isdigit() for ch in w)),
+            sorted(w for w in words if w in _NEGATIONS or w.endswith("n't")),
+            sorted(set(words) & key_terms))
+
+class AnswerGroups:
+    """Group lookups for one assignment, passed to step 4's grade_per_question"""
+
+    def __init__(self, assignment_id):
+        self.assignment_id = assignment_id
+
+    def _prepare(self, question_id, answer, key):
+        normalized = normalize(answer_text(answer))
+        if not ANSWER_GROUPS_ENABLED or not normalized or len(normalized.split()) > ANSWER_GROUP_MAX_WORDS:
+            return None
+        return normalized, artifact_hash([question_id, key, _VECTOR_FORMAT])
+
+    def _match(self, groups, normalized, key):
+        for group in groups:
+            if group['normalized'] == normalized:
+                return group, 'exact'
+        if not ANSWER_GROUP_NEAR_MATCHES:
+            return None, None
+        best, best_score = None, ANSWER_GROUP_THRESHOLD
+        key_terms = set(normalize(answer_text(key)).split())
+        guard = _guard(normalized, key_terms)
+        vector = vectorize(normalized)
+        for group in groups:
+            score = cosine(vector, group['vector'])
+            if score >= best_score and _guard(group['normalized'], key_terms) == guard:
+                best, best_score = group, score
+        return best, 'near'
+
+    def lookup(self, question_id, answer, key):
+        """Result of the group this answer belongs to, or None when it has to be graded"""
+        prepared = self._prepare(question_id, answer, key)
+        if prepared is None:
+            return None
+        normalized, key_hash = prepared
+        group, match = self._match(get_answer_groups(self.assignment_id, question_id, key_hash), normalized, key)
+        if group is None:
+            return None
+        add_answer_group_member(group['id'])
+        grouped_questions.inc(match=match)
+        return group['result']
+
+    def record(self, question_id, answer, key, result):
+        """Store a freshly graded answer as a group representative, unless an
+        equivalent group was created meanwhile (e.g. by a concurrent paper)"""
+        prepared = self._prepare(question_id, answer, key)
+        if prepared is None:
+            return
+        normalized, key_hash = prepared
+        group, _ = self._match(get_answer_groups(self.assignment_id, question_id, key_hash), normalized, key)
+        if group is None:
+            create_answer_group(self.assignment_id, question_id, key_hash, normalized, vectorize(normalized), result)
@@ -1,27 +1,65 @@
 import os
+import io
+import csv
 import json
 import uuid
+import base64
+import hashlib
+import time
+import queue
+import zipfile
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from functools import wraps
-from flask import Flask, request, jsonify, session, send_from_directory, send_file
+from flask import Flask, Request, Response, request, jsonify, session, send_file, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
 
 # Import AI Logic
-from ai_engine.step1_structure import get_exam_structure
-from ai_engine.step2_faculty import create_faculty_key
-from ai_engine.step3_student import extract_student_answers
-from ai_engine.step4_grading import grade_student_paper
+from ai_engine.pipeline import run_grading_pipeline
+from ai_engine.step4_grading import question_inputs, question_input_hashes, key_slices
+from ai_engine.files import ensure_handle, is_fresh
+from ai_engine.pdf_text import extract_pages
+from ai_engine.llm import unavailable_error
+from ai_engine.cache import llm_cache
+from config import (BULK_GRADING_CONCURRENCY, BULK_MAX_UPLOAD_BYTES, REGRADE_CONCURRENCY, METRICS_TOKEN, STATIC_RELOAD,
+                    EVENTS_KEEPALIVE_SECONDS, EVENTS_STREAM_MAX_SECONDS, ARTIFACT_HISTORY_LIMIT,
+                    GRADE_HISTORY_LIMIT)
+from metrics import registry, Gauge, http_requests, http_latency
 
 # Import database functions
 from database import (
-    get_all_assignments, get_assignment_by_id, create_assignment,
-    get_all_submissions, get_submission_by_id, get_submissions_by_assignment,
+    get_all_assignments, get_assignment_by_id, get_assignments_by_teacher, create_assignment, update_assignment,
+    get_submission_by_id, get_submissions_by_assignment, get_submissions_by_assignments,
     get_submissions_by_student, create_submission, update_submission,
-    get_all_papers, get_paper_by_id, get_papers_by_teacher, create_paper
+    get_all_papers, get_paper_by_id, get_papers_by_teacher, create_paper, update_paper,
+    get_job_by_id, get_jobs_by_owner, count_jobs_by_status,
+    get_batch_by_id, create_batch, update_batch, get_table_versions,
+    get_assignment_analytics, rebuild_assignment_analytics
 )
+from jobs import enqueue_job, register_handler, start_workers, JobDeferred
+from user_store import user_store, hash_password, verify_password, AuthBusyError
+from utils import calculate_grade
+from storage import UPLOAD_FOLDER, store_upload, release, file_path, read_bytes, is_blob_id, content_id
+from answer_groups import AnswerGroups
+from plagiarism import check_submission, link_matches, paper_texts, percentage
+from analytics import summarize
+from events import hub
+from assets import get_manifest, IMMUTABLE, REVALIDATE
+from artifacts import artifact_hash, stage_record, stage_hash, forced_stages, is_current
+
+class GradingRequest(Request):
+    """Lets the bulk upload endpoint accept a whole class archive"""
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'api_bulk_grade':
+            return BULK_MAX_UPLOAD_BYTES
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = GradingRequest
 
 # Enable CORS for all routes
 CORS(app, 
@@ -38,32 +76,21 @@ app.secret_key = 'super_secret_key_for_demo_change_in_production'
 BASE_DIR = os.path.dirname(__file__)
 PROJECT_ROOT = os.path.dirname(BASE_DIR)
 FRONTEND_DIR = os.path.join(PROJECT_ROOT, 'frontend')
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 OUTPUT_FOLDER = os.path.join(BASE_DIR, 'outputs')
-USER_DB_FILE = os.path.join(BASE_DIR, 'users.json')
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+MAX_PDF_SIZE = 16 * 1024 * 1024  # per PDF inside a bulk upload
 
 ALLOWED_EXTENSIONS = {'pdf'}
+MAX_PAGE_SIZE = 200
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # --- USER MANAGEMENT HELPER FUNCTIONS ---
-def load_users():
-    if not os.path.exists(USER_DB_FILE):
-        return {}
-    with open(USER_DB_FILE, 'r') as f:
-        return json.load(f)
-
-def save_users(users):
-    with open(USER_DB_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
-
 def require_auth(required_role=None):
     """Decorator to require authentication"""
     def decorator(f):
@@ -98,24 +125,23 @@ def api_register():
         if role not in ['faculty', 'student']:
             return jsonify({"success": False, "error": "Invalid role"}), 400
 
-        users = load_users()
-
-        if username in users:
+        if user_store.exists(username):
             return jsonify({"success": False, "error": "Username already exists"}), 400
 
         # Create new user
         user_id = f"u_{int(uuid.uuid4().int % 1e10)}"
-        users[username] = {
+        created = user_store.add({
             "id": user_id,
             "username": username,
-            "password": generate_password_hash(password),
+            "password": hash_password(password),
             "role": role,
             "name": name,
             "department": department,
             "branch": branch,
             "semester": semester
-        }
-        save_users(users)
+        })
+        if not created:
+            return jsonify({"success": False, "error": "Username already exists"}), 400
 
         return jsonify({
             "success": True,
@@ -127,6 +153,8 @@ def api_register():
             }
         }), 201
 
+    except AuthBusyError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -142,13 +170,11 @@ def api_login():
         if not username or not password:
             return jsonify({"success": False, "error": "Missing credentials"}), 400
 
-        users = load_users()
-
-        if username not in users:
+        user = user_store.get(username)
+        if not user:
             return jsonify({"success": False, "error": "Invalid credentials"}), 401
 
-        user = users[username]
-        if not check_password_hash(user['password'], password):
+        if not verify_password(user['password'], password):
             return jsonify({"success": False, "error": "Invalid credentials"}), 401
 
         if role and user['role'] != role:
@@ -158,6 +184,7 @@ def api_login():
         session['username'] = username
         session['user_id'] = user.get('id', username)
         session['role'] = user['role']
+        session['name'] = user.get('name', username)
 
         return jsonify({
             "success": True,
@@ -169,6 +196,8 @@ def api_login():
             }
         }), 200
 
+    except AuthBusyError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -180,24 +209,18 @@ def api_logout():
 
 @app.route('/api/auth/current', methods=['GET'])
 def api_current_user():
-    """Get current user"""
+    """Get current user (served from the signed session, no store lookup)"""
     if 'username' not in session:
         return jsonify({"success": False, "error": "Not authenticated"}), 401
 
-    users = load_users()
     username = session['username']
-    if username not in users:
-        session.clear()
-        return jsonify({"success": False, "error": "User not found"}), 404
-
-    user = users[username]
     return jsonify({
         "success": True,
         "user": {
-            "id": user.get('id', username),
+            "id": session.get('user_id', username),
             "username": username,
-            "role": user['role'],
-            "name": user.get('name', username)
+            "role": session.get('role'),
+            "name": session.get('name', username)
         }
     }), 200
 
@@ -221,37 +244,31 @@ def api_create_assignment():
         if not allowed_file(q_file.filename) or not allowed_file(s_file.filename):
             return jsonify({"success": False, "error": "Only PDF files allowed"}), 400
 
-        # Save files
-        assignment_id = f"asg_{int(uuid.uuid4().int % 1e10)}"
-        q_filename = f"{assignment_id}_question.pdf"
-        s_filename = f"{assignment_id}_solution.pdf"
-        
-        q_path = os.path.join(UPLOAD_FOLDER, q_filename)
-        s_path = os.path.join(UPLOAD_FOLDER, s_filename)
-        
-        q_file.save(q_path)
-        s_file.save(s_path)
+        # Save files (content-addressed, identical PDFs are stored once)
+        q_blob = store_upload(q_file.stream)
+        s_blob = store_upload(s_file.stream)
 
-        # Extract structure from question paper
+        # Build structure and faculty key once; every submission reuses them
         try:
-            with open(q_path, "rb") as f:
-                q_bytes = f.read()
-            structure = get_exam_structure(q_bytes)
+            artifacts = _build_assignment_artifacts(q_blob, s_blob)
         except Exception as e:
-            return jsonify({"success": False, "error": f"Failed to process question paper: {str(e)}"}), 500
+            release(q_blob)
+            release(s_blob)
+            unavailable = _unavailable_response(e)
+            if unavailable:
+                return unavailable
+            return jsonify({"success": False, "error": f"Failed to process assignment PDFs: {str(e)}"}), 500
 
         # Create assignment
         assignment = {
-            "id": assignment_id,
             "title": title,
             "subject": subject,
             "description": description,
             "deadline": deadline,
             "teacherId": session.get('user_id', session.get('username')),
-            "questionPdf": q_filename,
-            "solutionPdf": s_filename,
-            "structure": structure,
-            "questions": structure if isinstance(structure, list) else []
+            "questionPdf": q_blob,
+            "solutionPdf": s_blob,
+            **artifacts
         }
 
         created_assignment = create_assignment(assignment)
@@ -269,13 +286,11 @@ def api_create_assignment():
 @app.route('/api/assignments', methods=['GET'])
 @require_auth()
 def api_get_assignments():
-    """Get all assignments"""
+    """Get all assignments (supports ?limit=&cursor=&fields=)"""
     try:
-        assignments = get_all_assignments()
-        return jsonify({
-            "success": True,
-            "assignments": assignments
-        }), 200
+        return _list_response('assignments', ['assignments'], get_all_assignments, view=_assignment_view)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -289,11 +304,170 @@ def api_get_assignment(assignment_id):
             return jsonify({"success": False, "error": "Assignment not found"}), 404
         return jsonify({
             "success": True,
-            "assignment": assignment
+            "assignment": _assignment_view(assignment)
         }), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/faculty/assignments/<assignment_id>/rebuild-artifacts', methods=['POST'])
+@require_auth('faculty')
+def api_rebuild_assignment_artifacts(assignment_id):
+    """Rebuild structure and faculty key, optionally from replaced PDFs"""
+    try:
+        assignment = get_assignment_by_id(assignment_id)
+        if not assignment:
+            return jsonify({"success": False, "error": "Assignment not found"}), 404
+
+        teacher_id = session.get('user_id', session.get('username'))
+        if assignment.get('teacherId') != teacher_id:
+            return jsonify({"success": False, "error": "Access denied"}), 403
+
+        uploads = _replacement_uploads()
+        if uploads is None:
+            return jsonify({"success": False, "error": "Only PDF files allowed"}), 400
+        if not _kept_files_exist(assignment, uploads):
+            return jsonify({"success": False, "error": "Assignment files not found"}), 500
+        updates = {key: store_upload(upload.stream) for key, upload in uploads.items()}
+
+        q_ref = updates.get('questionPdf', assignment['questionPdf'])
+        s_ref = updates.get('solutionPdf', assignment['solutionPdf'])
+
+        # An explicit rebuild always asks the model again instead of reusing cached responses
+        try:
+            updates.update(_build_assignment_artifacts(q_ref, s_ref, assignment, force='structure'))
+        except Exception as e:
+            for key in uploads:
+                release(updates[key])
+            unavailable = _unavailable_response(e)
+            if unavailable:
+                return unavailable
+            return jsonify({"success": False, "error": f"Failed to process assignment PDFs: {str(e)}"}), 500
+
+        updated_assignment = update_assignment(assignment_id, updates)
+        for key in uploads:
+            release(assignment[key])
+
+        return jsonify({
+            "success": True,
+            "assignment": updated_assignment
+        }), 200
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/faculty/assignments/<assignment_id>/regrade', methods=['POST'])
+@require_auth('faculty')
+def api_regrade_assignment(assignment_id):
+    """Regrade a class, rerunning only the stages and questions whose inputs changed.
+    Takes replaced 'question_pdf' / 'faculty_solution_pdf', or a JSON body
+    with an edited 'structure' / 'facultyKey', and optionally 'force' to
+    rerun a stage (and everything after it) regardless."""
+    try:
+        assignment = get_assignment_by_id(assignment_id)
+        if not assignment:
+            return jsonify({"success": False, "error": "Assignment not found"}), 404
+
+        teacher_id = session.get('user_id', session.get('username'))
+        if assignment.get('teacherId') != teacher_id:
+            return jsonify({"success": False, "error": "Access denied"}), 403
+
+        force = _regrade_force()
+        try:
+            forced_stages(force)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        body = request.get_json(silent=True) if request.is_json else None
+        edits = {field: (body or {}).get(field) for field in ('structure', 'facultyKey')}
+        if any(not isinstance(value, (list, dict)) for value in edits.values() if value is not None):
+            return jsonify({"success": False, "error": "structure and facultyKey must be JSON lists"}), 400
+        editing = any(value is not None for value in edits.values())
+        if editing and force in ('structure', 'facultyKey'):
+            return jsonify({"success": False, "error": "Edits cannot be combined with rebuilding them"}), 400
+
+        uploads = _replacement_uploads()
+        if uploads is None:
+            return jsonify({"success": False, "error": "Only PDF files allowed"}), 400
+        if not _kept_files_exist(assignment, uploads):
+            return jsonify({"success": False, "error": "Assignment files not found"}), 500
+        updates = {key: store_upload(upload.stream) for key, upload in uploads.items()}
+
+        q_ref = updates.get('questionPdf', assignment['questionPdf'])
+        s_ref = updates.get('solutionPdf', assignment['solutionPdf'])
+
+        # Steps 1-2 are rebuilt here; only stages built after this point count as regraded
+        since = datetime.now().isoformat()
+        try:
+            assignment = _ensure_assignment_artifacts(assignment) or assignment
+            if editing:
+                updates.update(_edit_assignment_artifacts(assignment, edits['structure'], edits['facultyKey']))
+            else:
+                updates.update(_build_assignment_artifacts(q_ref, s_ref, assignment, force))
+        except Exception as e:
+            for key in uploads:
+                release(updates[key])
+            unavailable = _unavailable_response(e)
+            if unavailable:
+                return unavailable
+            return jsonify({"success": False, "error": f"Failed to process assignment PDFs: {str(e)}"}), 500
+
+        rebuilt = [stage for stage in ('structure', 'facultyKey')
+                   if (updates.get('artifacts') or {}).get(stage, {}).get('builtAt', '') >= since
+                   and (not editing or edits[stage] is not None)]
+        questions = {"changed": [], "added": [], "removed": []}
+        if updates:
+            previous = assignment
+            assignment = update_assignment(assignment_id, updates)
+            for key in uploads:
+                release(previous[key])
+            questions = _diff_questions(previous, assignment)
+
+        # Submissions already waiting for a worker pick up the new artifacts when they run
+        stale = {}
+        for submission in get_submissions_by_assignment(assignment_id):
+            if submission.get('status') == 'pending':
+                continue
+            stages = _stale_submission_stages(submission, assignment, force, since)
+            if stages:
+                stale[submission['id']] = stages
+
+        batch, job = None, None
+        if stale:
+            batch = create_batch({
+                "assignmentId": assignment_id,
+                "teacherId": teacher_id,
+                "kind": "regrade",
+                "force": force,
+                "since": since,
+                "questions": questions,
+                "submissionIds": list(stale),
+                "stages": {stage: sum(stage in stages for stages in stale.values())
+                           for stage in ('studentAnswers', 'gradingResult')},
+                "skipped": [],
+                "total": len(stale),
+                "graded": 0,
+                "failed": 0,
+                "status": "queued"
+            })
+            job = enqueue_job('batch', {"batchId": batch['id']}, owner_id=teacher_id)
+            batch = update_batch(batch['id'], {"jobId": job['id']})
+
+        return jsonify({
+            "success": True,
+            "assignment": assignment,
+            "rebuilt": rebuilt,
+            "questions": questions,
+            "batch": batch,
+            "job": job
+        }), 202 if batch else 200
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
 # ========== SUBMISSION API ==========
 
 @app.route('/api/student/submit-assignment', methods=['POST'])
@@ -320,64 +494,25 @@ def api_submit_assignment():
             return jsonify({"success": False, "error": "Assignment not found"}), 404
 
         # Save submission file
-        submission_id = f"sub_{int(uuid.uuid4().int % 1e10)}"
-        sub_filename = f"{submission_id}_student.pdf"
-        sub_path = os.path.join(UPLOAD_FOLDER, sub_filename)
-        sub_file.save(sub_path)
-
-        # Get question paper and solution
-        q_path = os.path.join(UPLOAD_FOLDER, assignment['questionPdf'])
-        s_path = os.path.join(UPLOAD_FOLDER, assignment['solutionPdf'])
-
-        if not os.path.exists(q_path) or not os.path.exists(s_path):
-            return jsonify({"success": False, "error": "Assignment files not found"}), 500
-
-        # Run AI grading
-        try:
-            with open(q_path, "rb") as f:
-                q_bytes = f.read()
-            with open(s_path, "rb") as f:
-                s_bytes = f.read()
-            with open(sub_path, "rb") as f:
-                student_bytes = f.read()
-
-            structure = assignment.get('structure', get_exam_structure(q_bytes))
-            faculty_key = create_faculty_key(structure, s_bytes)
-            student_answers = extract_student_answers(structure, student_bytes)
-            grading_result = grade_student_paper(student_answers, faculty_key)
-
-            # Calculate total marks
-            total_marks = grading_result.get('total_score', 0)
-            max_marks = sum(q.get('max_marks', 0) for q in structure if isinstance(q, dict))
-
-            # Create submission record
-            submission = {
-                "id": submission_id,
-                "assignmentId": assignment_id,
-                "studentId": student_id,
-                "submissionPdf": sub_filename,
-                "aiResult": {
-                    "totalMarks": total_marks,
-                    "maxMarks": max_marks,
-                    "grade": _calculate_grade(total_marks, max_marks),
-                    "plagiarismPercentage": 0,  # Can be enhanced later
-                    "feedback": grading_result.get('remarks', ''),
-                    "detailedResults": grading_result.get('results', [])
-                },
-                "status": "graded"
-            }
+        sub_blob = store_upload(sub_file.stream)
 
-            created_submission = create_submission(submission)
+        submission = create_submission({
+            "assignmentId": assignment_id,
+            "studentId": student_id,
+            "submissionPdf": sub_blob,
+            "aiResult": None,
+            "status": "pending"
+        })
 
-            return jsonify({
-                "success": True,
-                "result": created_submission
-            }), 201
+        # Grading runs on the background worker pool
+        job = enqueue_job('submission', {"submissionId": submission['id']}, owner_id=student_id)
+        submission = update_submission(submission['id'], {"jobId": job['id']})
 
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return jsonify({"success": False, "error": f"Grading failed: {str(e)}"}), 500
+        return jsonify({
+            "success": True,
+            "result": submission,
+            "job": job
+        }), 202
 
     except Exception as e:
         import traceback
@@ -393,20 +528,21 @@ def api_get_submissions():
         user_id = session.get('user_id', session.get('username'))
 
         if role == 'student':
-            submissions = get_submissions_by_student(user_id)
+            return _list_response('submissions', ['submissions'],
+                                  lambda after_id, limit: get_submissions_by_student(user_id, after_id, limit))
         elif role == 'faculty':
             # Get all submissions for assignments created by this teacher
-            assignments = get_all_assignments()
-            teacher_assignments = [a['id'] for a in assignments if a.get('teacherId') == user_id]
-            all_subs = get_all_submissions()
-            submissions = [s for s in all_subs if s.get('assignmentId') in teacher_assignments]
-        else:
-            submissions = []
+            def fetch(after_id, limit):
+                teacher_assignments = [a['id'] for a in get_assignments_by_teacher(user_id)]
+                return get_submissions_by_assignments(teacher_assignments, after_id, limit)
+            return _list_response('submissions', ['assignments', 'submissions'], fetch)
 
         return jsonify({
             "success": True,
-            "submissions": submissions
+            "submissions": []
         }), 200
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -425,6 +561,9 @@ def api_get_submission(submission_id):
         
         if role == 'student' and submission.get('studentId') != user_id:
             return jsonify({"success": False, "error": "Access denied"}), 403
+        if role != 'faculty':
+            # Earlier grades are kept for faculty audit
+            submission = {k: v for k, v in submission.items() if k != 'gradeHistory'}
 
         return jsonify({
             "success": True,
@@ -433,19 +572,197 @@ def api_get_submission(submission_id):
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/submissions/<submission_id>/events', methods=['GET'])
+@require_auth()
+def api_submission_events(submission_id):
+    """Server-sent events with grading progress: 'status', 'step' (started /
+    finished), 'question' (each result as it is graded) and a final 'done'"""
+    try:
+        submission = get_submission_by_id(submission_id)
+        if not submission:
+            return jsonify({"success": False, "error": "Submission not found"}), 404
+
+        role = session.get('role')
+        user_id = session.get('user_id', session.get('username'))
+        if role == 'student' and submission.get('studentId') != user_id:
+            return jsonify({"success": False, "error": "Access denied"}), 403
+
+        try:
+            after = int(request.headers.get('Last-Event-ID', 0))
+        except ValueError:
+            after = 0
+        return Response(_submission_event_stream(submission, after), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def _sse(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return '\n'.join(lines) + '\n\n'
+
+def _submission_event_stream(submission, after):
+    """Relay the submission's events from the hub, which reads the shared
+    events table once per process for all open streams, so the stream works
+    whichever process runs the grading job. The submission is read again only
+    when a keepalive finds no run in progress, to notice a job that ended
+    without publishing 'done'. A response ends after EVENTS_STREAM_MAX_SECONDS
+    and the browser reconnects with Last-Event-ID, so one stream doesn't hold
+    a server worker for a whole run."""
+    submission_id = submission['id']
+    subscriber, backlog, active = hub.subscribe(submission_id, after)
+    try:
+        yield "retry: 3000\n\n"
+        if not active and submission.get('status') != 'pending':
+            yield _sse('done', {"status": submission.get('status'), "aiResult": submission.get('aiResult'),
+                                "error": submission.get('error')})
+            return
+        if not active:
+            yield _sse('status', {"status": "queued"})
+            # Anything on the channel belongs to an earlier run
+            after = max([after] + [event_id for event_id, _, _ in backlog])
+            backlog = []
+        for event_id, event, data in backlog:
+            yield _sse(event, data, event_id)
+            if event == 'done':
+                return
+            after = event_id
+        deadline = time.monotonic() + EVENTS_STREAM_MAX_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event_id, event, data = subscriber.get(timeout=min(EVENTS_KEEPALIVE_SECONDS, remaining))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    return
+                yield ": keepalive\n\n"
+                if not hub.active(submission_id):
+                    current = get_submission_by_id(submission_id) or {}
+                    if current.get('status') != 'pending':
+                        yield _sse('done', {"status": current.get('status'), "aiResult": current.get('aiResult'),
+                                            "error": current.get('error')})
+                        return
+                continue
+            if event_id <= after:
+                continue  # already sent from the backlog
+            after = event_id
+            yield _sse(event, data, event_id)
+            if event == 'done':
+                return
+    finally:
+        hub.unsubscribe(submission_id, subscriber)
+
 @app.route('/api/assignments/<assignment_id>/submissions', methods=['GET'])
 @require_auth('faculty')
 def api_get_assignment_submissions(assignment_id):
-    """Get all submissions for an assignment"""
+    """Get all submissions for an assignment (supports ?limit=&cursor=&fields=)"""
+    try:
+        return _list_response('submissions', ['submissions'],
+                              lambda after_id, limit: get_submissions_by_assignment(assignment_id, after_id, limit))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/assignments/<assignment_id>/analytics', methods=['GET'])
+@require_auth('faculty')
+def api_get_assignment_analytics(assignment_id):
+    """Class statistics for an assignment, from its incrementally maintained aggregate"""
     try:
-        submissions = get_submissions_by_assignment(assignment_id)
+        if not get_assignment_by_id(assignment_id):
+            return jsonify({"success": False, "error": "Assignment not found"}), 404
         return jsonify({
             "success": True,
-            "submissions": submissions
+            "analytics": summarize(get_assignment_analytics(assignment_id))
         }), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/faculty/assignments/<assignment_id>/analytics/rebuild', methods=['POST'])
+@require_auth('faculty')
+def api_rebuild_assignment_analytics(assignment_id):
+    """Recompute an assignment's aggregate from all of its submissions"""
+    try:
+        assignment = get_assignment_by_id(assignment_id)
+        if not assignment:
+            return jsonify({"success": False, "error": "Assignment not found"}), 404
+
+        teacher_id = session.get('user_id', session.get('username'))
+        if assignment.get('teacherId') != teacher_id:
+            return jsonify({"success": False, "error": "Access denied"}), 403
+
+        return jsonify({
+            "success": True,
+            "analytics": summarize(rebuild_assignment_analytics(assignment_id))
+        }), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/faculty/submissions/<submission_id>/regrade', methods=['POST'])
+@require_auth('faculty')
+def api_regrade_submission(submission_id):
+    """Regrade one submission, reusing its extracted answers unless they are stale
+    or 'force' is 'studentAnswers'"""
+    try:
+        submission = get_submission_by_id(submission_id)
+        if not submission:
+            return jsonify({"success": False, "error": "Submission not found"}), 404
+
+        teacher_id = session.get('user_id', session.get('username'))
+        assignment = get_assignment_by_id(submission['assignmentId'])
+        if not assignment:
+            return jsonify({"success": False, "error": "Assignment not found"}), 404
+        if assignment.get('teacherId') != teacher_id:
+            return jsonify({"success": False, "error": "Access denied"}), 403
+        if submission.get('status') == 'pending':
+            return jsonify({"success": False, "error": "Submission is already being graded"}), 409
+
+        force = _regrade_force()
+        try:
+            forced_stages(force)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        if force in ('structure', 'facultyKey'):
+            return jsonify({"success": False,
+                            "error": "Rebuild the structure or faculty key with the assignment regrade"}), 400
+
+        try:
+            assignment = _ensure_assignment_artifacts(assignment)
+        except Exception as e:
+            unavailable = _unavailable_response(e)
+            if unavailable:
+                return unavailable
+            raise
+        if not assignment:
+            return jsonify({"success": False, "error": "Assignment files not found"}), 500
+
+        since = datetime.now().isoformat()
+        stages = _stale_submission_stages(submission, assignment, force, since)
+        if not stages:
+            return jsonify({
+                "success": True,
+                "submission": submission,
+                "stages": []
+            }), 200
+
+        job = enqueue_job('submission', {"submissionId": submission_id, "force": force, "since": since},
+                          owner_id=teacher_id)
+        submission = update_submission(submission_id, {"jobId": job['id']})
+
+        return jsonify({
+            "success": True,
+            "submission": submission,
+            "stages": stages,
+            "job": job
+        }), 202
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
 # ========== PAPER CHECK API (Separate Feature) ==========
 
 @app.route('/api/faculty/check-paper', methods=['POST'])
@@ -462,61 +779,27 @@ def api_check_paper():
         if not allowed_file(q_file.filename) or not allowed_file(a_file.filename):
             return jsonify({"success": False, "error": "Only PDF files allowed"}), 400
 
-        # Save files temporarily
-        paper_id = f"paper_{int(uuid.uuid4().int % 1e10)}"
-        q_filename = f"{paper_id}_question.pdf"
-        a_filename = f"{paper_id}_answer.pdf"
-        
-        q_path = os.path.join(UPLOAD_FOLDER, q_filename)
-        a_path = os.path.join(UPLOAD_FOLDER, a_filename)
-        
-        q_file.save(q_path)
-        a_file.save(a_path)
-
-        # Run AI grading
-        try:
-            with open(q_path, "rb") as f:
-                q_bytes = f.read()
-            with open(a_path, "rb") as f:
-                a_bytes = f.read()
-
-            structure = get_exam_structure(q_bytes)
-            # For paper check, we use the answer PDF as both solution and student answer
-            # The teacher provides the answer key in the answer_pdf
-            faculty_key = create_faculty_key(structure, a_bytes)
-            student_answers = extract_student_answers(structure, a_bytes)
-            grading_result = grade_student_paper(student_answers, faculty_key)
-
-            # Calculate total marks
-            total_marks = grading_result.get('total_score', 0)
-            max_marks = sum(q.get('max_marks', 0) for q in structure if isinstance(q, dict))
-
-            # Create paper record
-            paper = {
-                "id": paper_id,
-                "teacherId": session.get('user_id', session.get('username')),
-                "questionPdf": q_filename,
-                "answerPdf": a_filename,
-                "result": {
-                    "totalMarks": total_marks,
-                    "maxMarks": max_marks,
-                    "grade": _calculate_grade(total_marks, max_marks),
-                    "feedback": grading_result.get('remarks', ''),
-                    "detailedResults": grading_result.get('results', [])
-                }
-            }
+        # Save files
+        q_blob = store_upload(q_file.stream)
+        a_blob = store_upload(a_file.stream)
 
-            created_paper = create_paper(paper)
+        teacher_id = session.get('user_id', session.get('username'))
+        paper = create_paper({
+            "teacherId": teacher_id,
+            "questionPdf": q_blob,
+            "answerPdf": a_blob,
+            "result": None,
+            "status": "pending"
+        })
 
-            return jsonify({
-                "success": True,
-                "paper": created_paper
-            }), 201
+        job = enqueue_job('paper', {"paperId": paper['id']}, owner_id=teacher_id)
+        paper = update_paper(paper['id'], {"jobId": job['id']})
 
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return jsonify({"success": False, "error": f"Grading failed: {str(e)}"}), 500
+        return jsonify({
+            "success": True,
+            "paper": paper,
+            "job": job
+        }), 202
 
     except Exception as e:
         import traceback
@@ -558,42 +841,882 @@ def api_get_paper(paper_id):
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+# ========== BULK GRADING API ==========
+
+@app.route('/api/faculty/assignments/<assignment_id>/bulk-grade', methods=['POST'])
+@require_auth('faculty')
+def api_bulk_grade(assignment_id):
+    """Grade a whole class: a ZIP 'archive' and/or several 'answer_pdfs' files.
+    Each PDF file name (without extension) is used as the student ID."""
+    try:
+        assignment = get_assignment_by_id(assignment_id)
+        if not assignment:
+            return jsonify({"success": False, "error": "Assignment not found"}), 404
+
+        teacher_id = session.get('user_id', session.get('username'))
+        if assignment.get('teacherId') != teacher_id:
+            return jsonify({"success": False, "error": "Access denied"}), 403
+
+        archive = request.files.get('archive')
+        pdf_files = request.files.getlist('answer_pdfs')
+        if not archive and not pdf_files:
+            return jsonify({"success": False, "error": "Upload a ZIP archive or answer PDFs"}), 400
+
+        # Checked before anything is stored, so a rejected request leaves nothing behind
+        if archive and not zipfile.is_zipfile(archive.stream):
+            return jsonify({"success": False, "error": "Archive must be a ZIP file"}), 400
+
+        saved, skipped, submission_ids, batch = [], [], [], None
+
+        def store(name, open_stream):
+            """Store one PDF; a file that cannot be read is reported in skipped"""
+            try:
+                with open_stream() as stream:
+                    saved.append((name, store_upload(stream)))
+            except Exception as e:
+                skipped.append({"file": name, "reason": f"Could not be read: {e}"})
+
+        try:
+            for upload in pdf_files:
+                if not allowed_file(upload.filename):
+                    skipped.append({"file": upload.filename, "reason": "Not a PDF"})
+                    continue
+                store(upload.filename, lambda: contextlib.nullcontext(upload.stream))
+
+            if archive:
+                archive.stream.seek(0)
+                # Members are copied to disk one by one; the archive itself stays spooled on disk
+                with zipfile.ZipFile(archive.stream) as zf:
+                    for member in zf.infolist():
+                        name = member.filename
+                        if member.is_dir() or name.startswith('__MACOSX/'):
+                            continue
+                        if not allowed_file(name):
+                            skipped.append({"file": name, "reason": "Not a PDF"})
+                            continue
+                        if member.file_size > MAX_PDF_SIZE:
+                            skipped.append({"file": name, "reason": "File too large"})
+                            continue
+                        store(name, lambda: zf.open(member))
+
+            if not saved:
+                return jsonify({"success": False, "error": "No PDF files found", "skipped": skipped}), 400
+
+            for original_name, sub_blob in saved:
+                student_id = secure_filename(os.path.splitext(os.path.basename(original_name))[0]) or sub_blob[:12]
+                submission = create_submission({
+                    "assignmentId": assignment['id'],
+                    "studentId": student_id,
+                    "submissionPdf": sub_blob,
+                    "sourceFilename": original_name,
+                    "aiResult": None,
+                    "status": "pending"
+                })
+                submission_ids.append(submission['id'])
+
+            batch = create_batch({
+                "assignmentId": assignment['id'],
+                "teacherId": teacher_id,
+                "submissionIds": submission_ids,
+                "skipped": skipped,
+                "total": len(submission_ids),
+                "graded": 0,
+                "failed": 0,
+                "status": "queued"
+            })
+            for submission_id in submission_ids:
+                update_submission(submission_id, {"batchId": batch['id']})
+
+            job = enqueue_job('batch', {"batchId": batch['id']}, owner_id=teacher_id)
+            batch = update_batch(batch['id'], {"jobId": job['id']})
+        except Exception:
+            # No job will pick these up: release the PDFs no submission holds yet, and close the rest
+            for _, sub_blob in saved[len(submission_ids):]:
+                release(sub_blob)
+            for submission_id in submission_ids:
+                update_submission(submission_id, {"status": "failed", "error": "Bulk upload failed"})
+            if batch:
+                update_batch(batch['id'], {"status": "failed"})
+            raise
+
+        return jsonify({
+            "success": True,
+            "batch": batch,
+            "job": job
+        }), 202
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/faculty/batches/<batch_id>', methods=['GET'])
+@require_auth('faculty')
+def api_get_batch(batch_id):
+    """Get bulk grading progress"""
+    try:
+        batch = get_batch_by_id(batch_id)
+        if not batch:
+            return jsonify({"success": False, "error": "Batch not found"}), 404
+        if batch.get('teacherId') != session.get('user_id', session.get('username')):
+            return jsonify({"success": False, "error": "Access denied"}), 403
+        return jsonify({
+            "success": True,
+            "batch": batch
+        }), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/faculty/batches/<batch_id>/results', methods=['GET'])
+@require_auth('faculty')
+def api_get_batch_results(batch_id):
+    """Download the results graded so far (JSON, or CSV with ?format=csv)"""
+    try:
+        batch = get_batch_by_id(batch_id)
+        if not batch:
+            return jsonify({"success": False, "error": "Batch not found"}), 404
+        if batch.get('teacherId') != session.get('user_id', session.get('username')):
+            return jsonify({"success": False, "error": "Access denied"}), 403
+
+        batch_ids = set(batch['submissionIds'])
+        rows = []
+        for sub in get_submissions_by_assignment(batch['assignmentId']):
+            if sub.get('id') not in batch_ids:
+                continue
+            result = sub.get('aiResult') or {}
+            rows.append({
+                "submissionId": sub['id'],
+                "studentId": sub.get('studentId'),
+                "sourceFilename": sub.get('sourceFilename'),
+                "status": sub.get('status'),
+                "totalMarks": result.get('totalMarks'),
+                "maxMarks": result.get('maxMarks'),
+                "grade": result.get('grade'),
+                "error": sub.get('error')
+            })
+
+        if request.args.get('format') == 'csv':
+            out = io.StringIO()
+            writer = csv.DictWriter(out, fieldnames=list(rows[0].keys()) if rows else ["submissionId"])
+            writer.writeheader()
+            writer.writerows(rows)
+            return app.response_class(
+                out.getvalue(), mimetype='text/csv',
+                headers={"Content-Disposition": f"attachment; filename={batch_id}_results.csv"})
+
+        return jsonify({
+            "success": True,
+            "batch": batch,
+            "results": rows
+        }), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# ========== JOB API ==========
+
+@app.route('/api/jobs', methods=['GET'])
+@require_auth()
+def api_get_jobs():
+    """Get grading jobs enqueued by the current user"""
+    try:
+        user_id = session.get('user_id', session.get('username'))
+        jobs = get_jobs_by_owner(user_id)
+        status = request.args.get('status')
+        if status:
+            jobs = [j for j in jobs if j.get('status') == status]
+        return jsonify({
+            "success": True,
+            "jobs": jobs
+        }), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@require_auth()
+def api_get_job(job_id):
+    """Get grading job status (queued, running, graded, failed)"""
+    try:
+        job = get_job_by_id(job_id)
+        if not job:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+
+        user_id = session.get('user_id', session.get('username'))
+        if not _can_view_job(job, user_id):
+            return jsonify({"success": False, "error": "Access denied"}), 403
+
+        return jsonify({
+            "success": True,
+            "job": job
+        }), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def _can_view_job(job, user_id):
+    """The user who enqueued a job, and for a submission job (e.g. a faculty
+    regrade) also the student whose submission it grades"""
+    if job.get('ownerId') == user_id:
+        return True
+    if job.get('kind') != 'submission':
+        return False
+    submission = get_submission_by_id((job.get('payload') or {}).get('submissionId'))
+    return bool(submission) and submission.get('studentId') == user_id
+
+# ========== METRICS API ==========
+
+registry.register(Gauge(
+    'paper_checker_jobs', 'Grading jobs by status', ('status',),
+    lambda: {(status,): count for status, count in count_jobs_by_status().items()}))
+registry.register(Gauge(
+    'paper_checker_llm_cache_size', 'Response cache size (entries, bytes)', ('unit',),
+    lambda: {(unit,): llm_cache.stats()[unit] for unit in ('entries', 'bytes')}))
+
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """Prometheus text metrics for this process (Bearer METRICS_TOKEN when set)"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"success": False, "error": "Authentication required"}), 401
+    response = app.response_class(registry.render(), mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+# ========== GRADING JOBS ==========
+
+def _grade_submission_job(job):
+    """Run steps 3 and 4 (or just the stale ones, for a regrade) for a submission"""
+    payload = job['payload']
+    submission_id = payload['submissionId']
+    _grade_submission(submission_id, force=payload.get('force'), since=payload.get('since'))
+    return {"submissionId": submission_id}
+
+def _grade_submission(submission_id, assignment=None, force=None, since=None):
+    """Grade one submission against its assignment's stored structure and key,
+    reusing stored extracted answers and the results of questions whose
+    answer and key are unchanged. A replaced result is kept in gradeHistory,
+    up to GRADE_HISTORY_LIMIT entries. Marks the submission failed and
+    re-raises on error."""
+    submission = None
+    try:
+        submission = get_submission_by_id(submission_id)
+        if not submission:
+            raise ValueError(f"Submission {submission_id} not found")
+
+        if assignment is None:
+            assignment = get_assignment_by_id(submission['assignmentId'])
+            if not assignment:
+                raise ValueError("Assignment not found")
+            assignment = _ensure_assignment_artifacts(assignment)
+            if not assignment:
+                raise ValueError("Assignment files not found")
+
+        stale = _stale_submission_stages(submission, assignment, force, since)
+        if not stale:
+            return submission
+        hub.publish(submission_id, 'status', {"status": "running", "stages": stale})
+
+        # Time spent waiting for a worker, to size the pools against
+        queued = None
+        if submission.get('submittedAt') and submission.get('status') == 'pending':
+            queued = round((datetime.now() - datetime.fromisoformat(submission['submittedAt'])).total_seconds(), 3)
+
+        structure = assignment['structure']
+        structure_hash = stage_hash(assignment, 'structure', structure)
+        key_hash = stage_hash(assignment, 'facultyKey', assignment['facultyKey'])
+        artifacts = dict(submission.get('artifacts') or {})
+        reuse_answers = 'studentAnswers' not in stale
+
+        # Earlier per-question results, kept for questions whose inputs still hash the same
+        previous_hashes = (artifacts.get('gradingResult') or {}).get('questions') or {}
+        reuse = None
+        if submission.get('aiResult') and 'gradingResult' not in forced_stages(force):
+            reuse = {r['question_id']: {"hash": previous_hashes[r['question_id']], "result": r}
+                     for r in submission['aiResult'].get('detailedResults') or []
+                     if isinstance(r, dict) and r.get('question_id') in previous_hashes}
+
+        def keep_answers(step, result):
+            hub.publish(submission_id, 'step', {"step": step, "state": "finished"})
+            # Stored as soon as step 3 finishes, so a step 4 failure doesn't repeat the extraction
+            if step == 'student_answers':
+                artifacts['studentAnswers'] = stage_record(
+                    result, submissionPdf=content_id(submission['submissionPdf']),
+                    structure=_extraction_hash(structure))
+                update_submission(submission_id, {"studentAnswers": result, "artifacts": dict(artifacts)})
+
+        outputs = run_grading_pipeline(
+            student_pdf=None if reuse_answers else read_bytes(submission['submissionPdf']),
+            structure=structure, faculty_key=assignment['facultyKey'],
+            student_answers=submission['studentAnswers'] if reuse_answers else None,
+            bypass_cache=bool(forced_stages(force) & set(stale)), on_result=keep_answers,
+            reuse_results=reuse, answer_groups=AnswerGroups(submission['assignmentId']),
+            on_start=lambda step: hub.publish(submission_id, 'step', {"step": step, "state": "started"}),
+            on_question=lambda result: hub.publish(submission_id, 'question', result)
+        )
+        grading_result = outputs['grading_result']
+        artifacts['gradingResult'] = stage_record(
+            grading_result, studentAnswers=artifacts['studentAnswers']['hash'], facultyKey=key_hash,
+            structure=structure_hash)
+        # Failed questions get no hash, so the next regrade tries them again
+        question_hashes = question_input_hashes(outputs['student_answers'], assignment['facultyKey'], structure)
+        failed = set(grading_result.get('failed_questions') or [])
+        artifacts['gradingResult']['questions'] = {q: h for q, h in question_hashes.items() if q not in failed}
+        regraded = [q for q, h in question_hashes.items() if reuse is None or previous_hashes.get(q) != h]
+
+        texts = paper_texts(question_inputs(outputs['student_answers'], assignment['facultyKey'], structure),
+                            outputs['student_answers'])
+        matches, words = check_submission(submission['assignmentId'], submission_id, texts,
+                                          student_id=submission.get('studentId'))
+
+        # Calculate total marks
+        total_marks = grading_result.get('total_score', 0)
+        max_marks = sum(q.get('max_marks', 0) for q in structure if isinstance(q, dict))
+
+        updates = {}
+        if submission.get('aiResult'):
+            history = (submission.get('gradeHistory') or []) + [{
+                "aiResult": submission['aiResult'],
+                "artifactsVersion": submission.get('artifactsVersion'),
+                "gradedAt": submission.get('gradedAt'),
+                "replacedAt": datetime.now().isoformat(),
+                "regradedQuestions": regraded
+            }]
+            updates["gradeHistory"] = history[-GRADE_HISTORY_LIMIT:] if GRADE_HISTORY_LIMIT > 0 else []
+
+        graded = update_submission(submission_id, {
+            **updates,
+            "artifactsVersion": assignment.get('artifactsVersion'),
+            "artifacts": artifacts,
+            "inputPath": outputs['input_paths'].get('student', submission.get('inputPath')),
+            "timings": {"queued": queued, **outputs['timings']},
+            "aiResult": {
+                "totalMarks": total_marks,
+                "maxMarks": max_marks,
+                "grade": calculate_grade(total_marks, max_marks),
+                "plagiarismPercentage": percentage(matches, words),
+                "plagiarismMatches": matches,
+                "feedback": grading_result.get('remarks', ''),
+                "detailedResults": grading_result.get('results', [])
+            },
+            "status": "graded",
+            "gradedAt": datetime.now().isoformat(),
+            "error": None
+        })
+        hub.publish(submission_id, 'done', {"status": "graded", "aiResult": graded['aiResult'], "error": None})
+        try:
+            link_matches(submission['assignmentId'], submission_id, matches)
+        except Exception as e:
+            print(f"--- Could not record plagiarism matches of {submission_id} on earlier submissions: {e} ---")
+        return graded
+    except Exception as e:
+        # A failed regrade keeps the previous result visible
+        graded = bool(submission) and submission.get('status') == 'graded'
+        deferred = _as_deferred(e)
+        if deferred:
+            update_submission(submission_id, {"status": "graded" if graded else "pending", "error": str(deferred)})
+            hub.publish(submission_id, 'status', {"status": "queued", "error": str(deferred)})
+            raise deferred from e
+        error = f"Grading failed: {str(e)}"
+        update_submission(submission_id, {"status": "graded" if graded else "failed", "error": error})
+        hub.publish(submission_id, 'done', {"status": "graded" if graded else "failed",
+                                            "aiResult": submission.get('aiResult') if graded else None,
+                                            "error": error})
+        raise
+
+def _bulk_grade_job(job):
+    """Grade every pending submission of a batch (or regrade the stale ones) with bounded concurrency"""
+    batch_id = job['payload']['batchId']
+    batch = get_batch_by_id(batch_id)
+    if not batch:
+        raise ValueError(f"Batch {batch_id} not found")
+
+    assignment = get_assignment_by_id(batch['assignmentId'])
+    if not assignment:
+        raise ValueError("Assignment not found")
+    # Structure and key are loaded once and shared by every paper in the batch
+    assignment = _ensure_assignment_artifacts(assignment)
+    if not assignment:
+        raise ValueError("Assignment files not found")
+
+    # After a restart, papers graded (or regraded) before the interruption are skipped
+    force, since = batch.get('force'), batch.get('since')
+    todo = []
+    for sid in batch['submissionIds']:
+        submission = get_submission_by_id(sid)
+        if not submission:
+            todo.append(sid)  # fails and is counted as such
+        elif batch.get('kind') == 'regrade':
+            if _stale_submission_stages(submission, assignment, force, since):
+                todo.append(sid)
+        elif submission.get('status') != 'graded':
+            todo.append(sid)
+    counts = {"graded": len(batch['submissionIds']) - len(todo), "failed": 0}
+    update_batch(batch_id, {"status": "running", **counts})
+
+    counts_lock = threading.Lock()
+    deferred = []
+    # Regrades are throttled so they don't crowd out newly submitted papers
+    concurrency = REGRADE_CONCURRENCY if batch.get('kind') == 'regrade' else BULK_GRADING_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(_grade_submission, sid, assignment, force, since) for sid in todo]
+        for future in as_completed(futures):
+            error = future.exception()
+            with counts_lock:
+                if isinstance(error, JobDeferred):
+                    deferred.append(error)
+                    continue
+                counts["failed" if error else "graded"] += 1
+                update_batch(batch_id, dict(counts))
+
+    # Papers that hit an unavailable backend are picked up when the job reruns
+    if deferred:
+        update_batch(batch_id, {"status": "queued", **counts})
+        raise JobDeferred(str(deferred[0]), max(d.delay for d in deferred))
+
+    update_batch(batch_id, {"status": "completed", "finishedAt": datetime.now().isoformat()})
+    return {"batchId": batch_id, **counts}
+
+def _check_paper_job(job):
+    """Run the full pipeline for a paper check"""
+    paper_id = job['payload']['paperId']
+    try:
+        paper = get_paper_by_id(paper_id)
+        if not paper:
+            raise ValueError(f"Paper {paper_id} not found")
+
+        q_bytes = read_bytes(paper['questionPdf'])
+        a_bytes = read_bytes(paper['answerPdf'])
+
+        # For paper check, we use the answer PDF as both solution and student answer
+        # The teacher provides the answer key in the answer_pdf, so it is uploaded once for steps 2 and 3
+        a_handle = None
+        if extract_pages(a_bytes) is None:
+            a_handle = ensure_handle(None, paper['answerPdf'], lambda: a_bytes)
+        outputs = run_grading_pipeline(question_pdf=q_bytes, solution_pdf=a_bytes, student_pdf=a_bytes,
+                                       solution_file=a_handle, student_file=a_handle)
+        structure = outputs['structure']
+        grading_result = outputs['grading_result']
+
+        # Calculate total marks
+        total_marks = grading_result.get('total_score', 0)
+        max_marks = sum(q.get('max_marks', 0) for q in structure if isinstance(q, dict))
+
+        update_paper(paper_id, {
+            "result": {
+                "totalMarks": total_marks,
+                "maxMarks": max_marks,
+                "grade": calculate_grade(total_marks, max_marks),
+                "feedback": grading_result.get('remarks', ''),
+                "detailedResults": grading_result.get('results', [])
+            },
+            "inputPaths": {
+                "questionPdf": outputs['input_paths'].get('question'),
+                "answerPdf": outputs['input_paths'].get('student')
+            },
+            "timings": outputs['timings'],
+            "status": "graded"
+        })
+    except Exception as e:
+        deferred = _as_deferred(e)
+        if deferred:
+            update_paper(paper_id, {"status": "pending", "error": str(deferred)})
+            raise deferred from e
+        update_paper(paper_id, {"status": "failed", "error": f"Grading failed: {str(e)}"})
+        raise
+
+    return {"paperId": paper_id}
+
+def _as_deferred(error):
+    """JobDeferred when error comes from the model backend being unavailable"""
+    if isinstance(error, JobDeferred):
+        return error
+    unavailable = unavailable_error(error)
+    if unavailable is None:
+        return None
+    return JobDeferred(f"Model backend unavailable, retrying: {unavailable}", unavailable.retry_after)
+
+def _unavailable_response(error):
+    """503 with Retry-After for synchronous model calls that hit an unavailable backend"""
+    unavailable = unavailable_error(error)
+    if unavailable is None:
+        return None
+    response = jsonify({"success": False, "error": "AI grading is temporarily unavailable, please retry shortly"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(int(unavailable.retry_after) + 1)
+    return response
+
+register_handler('submission', _grade_submission_job)
+register_handler('paper', _check_paper_job)
+register_handler('batch', _bulk_grade_job)
+
+@app.before_request
+def _ensure_grading_workers():
+    """Start workers lazily so the reloader parent and pre-fork masters don't own threads"""
+    start_workers()
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    """Latency and status per route rule (not per URL, to keep label values bounded)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_latency.observe(time.perf_counter() - started, route=route, method=request.method)
+        http_requests.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
 # ========== HELPER FUNCTIONS ==========
 
-def _calculate_grade(total_marks, max_marks):
-    """Calculate letter grade"""
-    if max_marks == 0:
-        return 'F'
-    percentage = (total_marks / max_marks) * 100
-    if percentage >= 90:
-        return 'A'
-    elif percentage >= 80:
-        return 'B'
-    elif percentage >= 70:
-        return 'C'
-    elif percentage >= 60:
-        return 'D'
+# Audit history stays on the single-record endpoints
+_LIST_OMITTED_FIELDS = ('artifactHistory', 'gradeHistory')
+
+def _list_response(name, tables, fetch, view=None):
+    """Serve a list endpoint with cursor pagination, ?fields= projection and ETags.
+    fetch(after_id, limit) returns records in insertion order, returned without
+    _LIST_OMITTED_FIELDS; view, if given, trims each record for the current user
+    before projection. The ETag is
+    derived from the tables' change counters, so an unchanged list is answered
+    with 304 before any record is loaded."""
+    limit = _page_limit(request.args.get('limit'))
+    after_id = _decode_cursor(request.args.get('cursor'))
+    versions = get_table_versions(tables)
+    etag = hashlib.sha1(json.dumps(
+        [versions, session.get('user_id', session.get('username')), request.full_path]
+    ).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        records = fetch(after_id, limit + 1 if limit else None)
+        next_cursor = None
+        if limit and len(records) > limit:
+            records = records[:limit]
+            next_cursor = _encode_cursor(records[-1]['id'])
+
+        records = [{k: v for k, v in record.items() if k not in _LIST_OMITTED_FIELDS} for record in records]
+        if view is not None:
+            records = [view(record) for record in records]
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+        if fields:
+            records = [_project(record, fields) for record in records]
+
+        response = jsonify({
+            "success": True,
+            name: records,
+            "nextCursor": next_cursor
+        })
+    response.set_etag(etag)
+    # Browsers revalidate with If-None-Match and reuse their cached copy on 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Answer key and build internals of an assignment, shown only to its faculty
+_ASSIGNMENT_PRIVATE_FIELDS = ('facultyKey', 'artifacts', 'artifactHistory', 'fileHandles', 'inputPaths')
+
+def _assignment_view(assignment):
+    """The assignment as the current user may see it"""
+    if (session.get('role') == 'faculty' and
+            assignment.get('teacherId') == session.get('user_id', session.get('username'))):
+        return assignment
+    return {k: v for k, v in assignment.items() if k not in _ASSIGNMENT_PRIVATE_FIELDS}
+
+def _encode_cursor(record_id):
+    return base64.urlsafe_b64encode(record_id.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        record_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    # Only cursors this server handed out round-trip exactly
+    if _encode_cursor(record_id) != cursor:
+        raise ValueError("Invalid cursor")
+    return record_id
+
+def _page_limit(value):
+    """?limit= as an int in 1..MAX_PAGE_SIZE, or None when absent"""
+    if value is None:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+def _project(record, fields):
+    """Keep only the requested fields; dotted names select nested keys (aiResult.grade)"""
+    projected = {}
+    for field in fields:
+        source, target = record, projected
+        parts = field.split('.')
+        for part in parts[:-1]:
+            source = source.get(part) if isinstance(source, dict) else None
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(part, {})
+        else:
+            if parts[-1] in source:
+                target[parts[-1]] = source[parts[-1]]
+    return projected
+
+def _build_assignment_artifacts(q_ref, s_ref, previous=None, force=None):
+    """Run steps 1 and 2 where their inputs changed (or from the forced stage on)
+    and return the fields to store; {} when both are current. previous is
+    the stored assignment, if any."""
+    previous = previous or {}
+    forced = forced_stages(force)
+    artifacts = dict(previous.get('artifacts') or {})
+    q_id, s_id = content_id(q_ref), content_id(s_ref)
+
+    rebuild_structure = (previous.get('structure') is None or 'structure' in forced or
+                         not is_current(artifacts.get('structure'), {"questionPdf": q_id}))
+    if not rebuild_structure:
+        key_inputs = {"solutionPdf": s_id, "structure": artifacts['structure']['hash']}
+        if (previous.get('facultyKey') is not None and
+                is_current(artifacts.get('facultyKey'), key_inputs, 'facultyKey' in forced)):
+            return {}
+
+    sources = {'solutionPdf': (s_ref, read_bytes(s_ref))}
+    if rebuild_structure:
+        sources['questionPdf'] = (q_ref, read_bytes(q_ref))
+    handles = {k: v for k, v in (previous.get('fileHandles') or {}).items()
+               if k not in sources and is_fresh(v, previous.get(k))}
+    handles.update(_refresh_file_handles(previous.get('fileHandles'), sources))
+
+    # Forced stages ask the model again instead of reusing cached responses
+    outputs = run_grading_pipeline(question_pdf=sources.get('questionPdf', (None, None))[1],
+                                   solution_pdf=sources['solutionPdf'][1],
+                                   structure=None if rebuild_structure else previous['structure'],
+                                   question_file=handles.get('questionPdf'),
+                                   solution_file=handles.get('solutionPdf'),
+                                   bypass_cache=bool(forced), until='faculty_key')
+    structure = outputs['structure']
+    faculty_key = outputs['faculty_key']
+
+    if rebuild_structure:
+        artifacts['structure'] = stage_record(structure, questionPdf=q_id)
+    artifacts['facultyKey'] = stage_record(faculty_key, solutionPdf=s_id, structure=artifacts['structure']['hash'])
+    input_paths = dict(previous.get('inputPaths') or {})
+    for field, name in (('questionPdf', 'question'), ('solutionPdf', 'solution')):
+        if name in outputs['input_paths']:
+            input_paths[field] = outputs['input_paths'][name]
+
+    return {
+        "structure": structure,
+        "questions": structure if isinstance(structure, list) else [],
+        "facultyKey": faculty_key,
+        "artifacts": artifacts,
+        "artifactsVersion": previous.get('artifactsVersion', 0) + 1,
+        "artifactsBuiltAt": datetime.now().isoformat(),
+        "artifactHistory": _archive_artifacts(previous),
+        "fileHandles": handles,
+        "inputPaths": input_paths
+    }
+
+def _refresh_file_handles(file_handles, sources):
+    """Files API handles for the PDFs about to be sent: stored handles are
+    reused, and uploaded again when missing, pointing at a replaced PDF or
+    expiring within the refresh margin. sources maps field -> (blob id, bytes).
+    PDFs with a usable text layer are sent as text and need no handle."""
+    handles = {}
+    for field, (ref, data) in sources.items():
+        if extract_pages(data) is not None:
+            continue
+        handle = ensure_handle((file_handles or {}).get(field), ref, lambda data=data: data)
+        if handle:
+            handles[field] = handle
+    return handles
+
+def _extraction_hash(structure):
+    """Hash of the structure as far as step 3 is concerned: marks don't change what gets extracted"""
+    def strip(value):
+        if isinstance(value, dict):
+            return {k: strip(v) for k, v in value.items() if k != 'max_marks'}
+        if isinstance(value, list):
+            return [strip(v) for v in value]
+        return value
+    return artifact_hash(strip(structure))
+
+def _archive_artifacts(assignment):
+    """artifactHistory with the assignment's current structure and key appended, for audit;
+    the last ARTIFACT_HISTORY_LIMIT entries"""
+    history = list(assignment.get('artifactHistory') or [])
+    if assignment.get('structure') is not None or assignment.get('facultyKey') is not None:
+        history.append({
+            "artifactsVersion": assignment.get('artifactsVersion'),
+            "structure": assignment.get('structure'),
+            "facultyKey": assignment.get('facultyKey'),
+            "artifacts": assignment.get('artifacts'),
+            "replacedAt": datetime.now().isoformat()
+        })
+    return history[-ARTIFACT_HISTORY_LIMIT:] if ARTIFACT_HISTORY_LIMIT > 0 else []
+
+def _edit_assignment_artifacts(assignment, structure=None, faculty_key=None):
+    """Fields to store for a hand-edited structure and/or faculty key; {} when
+    nothing changed. Edits are taken as they are: a structure edit does not
+    rebuild the key."""
+    if ((structure is None or artifact_hash(structure) == stage_hash(assignment, 'structure', assignment['structure'])) and
+            (faculty_key is None or
+             artifact_hash(faculty_key) == stage_hash(assignment, 'facultyKey', assignment['facultyKey']))):
+        return {}
+    artifacts = dict(assignment.get('artifacts') or {})
+    now = datetime.now().isoformat()
+    if structure is not None:
+        artifacts['structure'] = {**stage_record(structure, **artifacts['structure']['inputs']), "editedAt": now}
     else:
-        return 'F'
+        structure = assignment['structure']
+    key_entry = artifacts['facultyKey']
+    edited_at = now if faculty_key is not None else key_entry.get('editedAt')
+    if faculty_key is None:
+        faculty_key = assignment['facultyKey']
+    artifacts['facultyKey'] = stage_record(faculty_key, solutionPdf=key_entry['inputs']['solutionPdf'],
+                                           structure=artifacts['structure']['hash'])
+    if edited_at:
+        artifacts['facultyKey']['editedAt'] = edited_at
+    return {
+        "structure": structure,
+        "questions": structure if isinstance(structure, list) else [],
+        "facultyKey": faculty_key,
+        "artifacts": artifacts,
+        "artifactsVersion": assignment.get('artifactsVersion', 0) + 1,
+        "artifactHistory": _archive_artifacts(assignment)
+    }
+
+def _diff_questions(old, new):
+    """Question IDs whose key slice (with max_marks from the structure) changed, was added or removed"""
+    before = key_slices(old.get('facultyKey'), old.get('structure'))
+    after = key_slices(new.get('facultyKey'), new.get('structure'))
+    return {
+        "changed": [q for q in after if q in before and after[q] != before[q]],
+        "added": [q for q in after if q not in before],
+        "removed": [q for q in before if q not in after]
+    }
+
+def _replacement_uploads():
+    """Replaced assignment PDFs in the request by record field; None if one isn't a PDF"""
+    uploads = {}
+    for field, key in (('question_pdf', 'questionPdf'), ('faculty_solution_pdf', 'solutionPdf')):
+        if field not in request.files:
+            continue
+        upload = request.files[field]
+        if not allowed_file(upload.filename):
+            return None
+        uploads[key] = upload
+    return uploads
+
+def _kept_files_exist(assignment, uploads):
+    """Whether the assignment PDFs that uploads don't replace are still on disk.
+    Checked before the replacements are stored, so the early return holds no blob references."""
+    return all(os.path.exists(file_path(assignment[key]) or '')
+               for key in ('questionPdf', 'solutionPdf') if key not in uploads)
+
+def _regrade_force():
+    """Stage named by 'force' in a JSON body or form field, if any"""
+    body = request.get_json(silent=True) if request.is_json else None
+    return (body or {}).get('force') or request.form.get('force') or None
+
+def _ensure_assignment_artifacts(assignment):
+    """Backfill artifacts for assignments created before they were stored"""
+    q_path = file_path(assignment['questionPdf'])
+    s_path = file_path(assignment['solutionPdf'])
+    files_exist = q_path and s_path and os.path.exists(q_path) and os.path.exists(s_path)
+
+    if assignment.get('structure') is not None and assignment.get('facultyKey') is not None:
+        if assignment.get('artifacts') or not files_exist:
+            return assignment
+        # Stored before hashes were kept: record them as built from the current PDFs
+        built_at = assignment.get('artifactsBuiltAt')
+        structure = stage_record(assignment['structure'], built_at,
+                                 questionPdf=content_id(assignment['questionPdf']))
+        faculty_key = stage_record(assignment['facultyKey'], built_at,
+                                   solutionPdf=content_id(assignment['solutionPdf']), structure=structure['hash'])
+        return update_assignment(assignment['id'], {"artifacts": {"structure": structure, "facultyKey": faculty_key}})
+
+    if not files_exist:
+        return None
+    artifacts = _build_assignment_artifacts(assignment['questionPdf'], assignment['solutionPdf'], assignment)
+    return update_assignment(assignment['id'], artifacts)
+
+def _stale_submission_stages(submission, assignment, force=None, since=None):
+    """Submission stages to rerun: step 3 when the PDF or structure changed,
+    step 4 when the extracted answers or faculty key changed, plus forced
+    stages not rebuilt since the regrade was requested"""
+    artifacts = submission.get('artifacts') or {}
+    forced = forced_stages(force)
+    structure_hash = stage_hash(assignment, 'structure', assignment['structure'])
+    answers_inputs = {
+        "submissionPdf": content_id(submission['submissionPdf']),
+        "structure": _extraction_hash(assignment['structure'])
+    }
+    answers = artifacts.get('studentAnswers')
+    if (submission.get('studentAnswers') is None or
+            not is_current(answers, answers_inputs, 'studentAnswers' in forced, since)):
+        return ['studentAnswers', 'gradingResult']
+
+    grading_inputs = {
+        "studentAnswers": answers['hash'],
+        "facultyKey": stage_hash(assignment, 'facultyKey', assignment['facultyKey']),
+        "structure": structure_hash
+    }
+    if (submission.get('aiResult') is None or
+            not is_current(artifacts.get('gradingResult'), grading_inputs, 'gradingResult' in forced, since)):
+        return ['gradingResult']
+    return []
 
 # ========== FILE SERVING ==========
 
 @app.route('/api/files/<filename>', methods=['GET'])
 @require_auth()
 def api_get_file(filename):
-    """Serve uploaded files"""
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        return send_file(file_path, mimetype='application/pdf')
+    """Serve uploaded files (blob IDs or legacy file names), with Range support"""
+    path = file_path(filename)
+    if path and os.path.isfile(path):
+        if is_blob_id(filename):
+            # Content-addressed: the ID is the ETag and the bytes never change
+            response = send_file(path, mimetype='application/pdf', conditional=True,
+                                 etag=filename, max_age=31536000)
+            response.cache_control.immutable = True
+            response.cache_control.public = False
+            response.cache_control.private = True
+            return response
+        return send_file(path, mimetype='application/pdf', conditional=True)
     return jsonify({"error": "File not found"}), 404
 
 # ========== FRONTEND ROUTES ==========
 # These routes must be defined AFTER all API routes to avoid conflicts
 
+# Built at startup, so the first page view doesn't pay for reading and compressing frontend/
+get_manifest(FRONTEND_DIR, reload=STATIC_RELOAD)
+
+def _serve_asset(path):
+    """Answer from the in-memory asset manifest with the best precompressed
+    variant, a strong ETag and a year-long Cache-Control for fingerprinted URLs"""
+    manifest = get_manifest(FRONTEND_DIR, reload=STATIC_RELOAD)
+    # For SPA routing (e.g., /faculty/dashboard), serve main index.html
+    asset = manifest.lookup(path) or manifest.lookup('index.html')
+    if asset is None:
+        return jsonify({"error": "File not found"}), 404
+
+    encoding, body, etag = asset.variant(request.accept_encodings)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = IMMUTABLE if asset.fingerprinted else REVALIDATE
+    if len(asset.variants) > 1:
+        response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/')
 def serve_index():
     """Serve index.html"""
-    return send_from_directory(FRONTEND_DIR, 'index.html')
+    return _serve_asset('index.html')
 
 @app.route('/<path:path>')
 def serve_frontend(path):
@@ -601,48 +1724,7 @@ def serve_frontend(path):
     # Skip API routes (shouldn't reach here, but safety check)
     if path.startswith('api/'):
         return jsonify({"error": "API endpoint not found"}), 404
-    
-    # Build full file path
-    file_path = os.path.join(FRONTEND_DIR, path)
-    
-    # Check if it's a file
-    if os.path.isfile(file_path):
-        # Determine MIME type based on extension
-        mimetype = None
-        if file_path.endswith('.html'):
-            mimetype = 'text/html'
-        elif file_path.endswith('.css'):
-            mimetype = 'text/css'
-        elif file_path.endswith('.js'):
-            mimetype = 'application/javascript'
-        elif file_path.endswith('.json'):
-            mimetype = 'application/json'
-        elif file_path.endswith('.png'):
-            mimetype = 'image/png'
-        elif file_path.endswith(('.jpg', '.jpeg')):
-            mimetype = 'image/jpeg'
-        elif file_path.endswith('.svg'):
-            mimetype = 'image/svg+xml'
-        elif file_path.endswith('.ico'):
-            mimetype = 'image/x-icon'
-        elif file_path.endswith('.woff') or file_path.endswith('.woff2'):
-            mimetype = 'font/woff2'
-        
-        return send_file(file_path, mimetype=mimetype)
-    
-    # Check if it's a directory with index.html
-    if os.path.isdir(file_path):
-        index_path = os.path.join(file_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_file(index_path)
-    
-    # For SPA routing (e.g., /faculty/dashboard), serve main index.html
-    # This allows frontend JavaScript routing to work
-    index_path = os.path.join(FRONTEND_DIR, 'index.html')
-    if os.path.exists(index_path):
-        return send_file(index_path)
-    
-    return jsonify({"error": "File not found"}), 404
+    return _serve_asset(path)
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -0,0 +1,59 @@
+"""
+Content hashes for stored pipeline outputs
+Assignments keep the structure (step 1) and faculty key (step 2); each
+submission keeps its extracted answers (step 3) next to aiResult (step 4).
+Every stored output has an entry in its record's 'artifacts' field:
+
+    {"hash": <sha256 of the output>, "inputs": {<input>: <sha256>, ...}, "builtAt": ...}
+
+A stage is current while its inputs still hash to what it was built from,
+so a regrade only reruns the stages whose inputs changed. A new solution
+PDF, for example, rebuilds the faculty key and step 4, while the stored
+student answers are reused.
+"""
+import json
+import hashlib
+from datetime import datetime
+
+# Each stage and the stages that consume its output, directly or not
+DOWNSTREAM = {
+    'structure': ('structure', 'facultyKey', 'studentAnswers', 'gradingResult'),
+    'facultyKey': ('facultyKey', 'gradingResult'),
+    'studentAnswers': ('studentAnswers', 'gradingResult'),
+    'gradingResult': ('gradingResult',),
+}
+
+def artifact_hash(value):
+    """sha256 of a JSON value in canonical form (key order and whitespace don't matter)"""
+    data = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def stage_record(output, built_at=None, **inputs):
+    """Artifact entry for a stage output built from the given input hashes"""
+    return {
+        "hash": artifact_hash(output),
+        "inputs": inputs,
+        "builtAt": built_at or datetime.now().isoformat()
+    }
+
+def stage_hash(record, stage, value):
+    """Stored hash of a stage output, computed for records saved without one"""
+    entry = (record.get('artifacts') or {}).get(stage)
+    return entry['hash'] if entry else artifact_hash(value)
+
+def forced_stages(force):
+    """Stages to rebuild even when their inputs are unchanged: force and everything after it"""
+    if not force:
+        return set()
+    if force not in DOWNSTREAM:
+        raise ValueError(f"Unknown stage '{force}' (expected one of: {', '.join(DOWNSTREAM)})")
+    return set(DOWNSTREAM[force])
+
+def is_current(entry, inputs, forced=False, since=None):
+    """True when entry was built from inputs. A forced stage only counts as
+    current when it was rebuilt at or after since (so resumed regrades skip it)."""
+    if not entry or entry.get('inputs') != inputs:
+        return False
+    if forced:
+        return since is not None and entry.get('builtAt', '') >= since
+    return True
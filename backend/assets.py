@@ -0,0 +1,144 @@
+"""
+Static asset manifest for the frontend
+frontend/ is read once at startup into memory. Every file gets a strong
+ETag (its SHA-256) and, for text types, gzip and brotli variants compressed
+ahead of time. CSS, JS and images are also published under a fingerprinted
+URL (js/data.<hash>.js) that can be cached for a year; the HTML pages are
+rewritten to reference those URLs and are themselves served with no-cache,
+so a deploy is picked up on the next navigation while unchanged assets are
+never downloaded again. Requests are answered from the manifest without
+touching the filesystem.
+"""
+import os
+import re
+import copy
+import gzip
+import hashlib
+import mimetypes
+import posixpath
+import threading
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - br variants disabled
+    brotli = None
+
+MIMETYPES = {
+    '.html': 'text/html',
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+    '.json': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.ico': 'image/x-icon',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+}
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_BYTES = 256
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+_REFERENCE = re.compile(r'''(\b(?:src|href)\s*=\s*["'])([^"'#?]+)(["'])''', re.IGNORECASE)
+
+class Asset:
+    def __init__(self, path, body, mimetype, etag, fingerprinted=False):
+        self.path = path
+        self.mimetype = mimetype
+        self.fingerprinted = fingerprinted
+        self.variants = {None: (body, etag)}
+        if mimetype.startswith(COMPRESSIBLE) and len(body) >= MIN_COMPRESS_BYTES:
+            # Each encoding is its own representation, so it gets its own strong ETag
+            for encoding, compress in (('br', brotli and (lambda b: brotli.compress(b, quality=11))),
+                                       ('gzip', lambda b: gzip.compress(b, 9, mtime=0))):
+                if compress:
+                    compressed = compress(body)
+                    if len(compressed) < len(body):
+                        self.variants[encoding] = (compressed, f"{etag}-{encoding}")
+
+    def published(self):
+        """Same bytes under a fingerprinted URL, cacheable forever"""
+        twin = copy.copy(self)
+        twin.fingerprinted = True
+        return twin
+
+    def variant(self, accept_encodings):
+        """(encoding, body, etag) for the best encoding the client accepts"""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding]:
+                return (encoding,) + self.variants[encoding]
+        return (None,) + self.variants[None]
+
+def _mimetype(path):
+    ext = os.path.splitext(path)[1].lower()
+    return MIMETYPES.get(ext) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+def _fingerprint(path, digest):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{digest[:10]}{ext}"
+
+class AssetManifest:
+    """URL path -> Asset for everything under root"""
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.urls = {}
+        files = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                full = os.path.join(directory, name)
+                rel = os.path.relpath(full, root).replace(os.sep, '/')
+                with open(full, 'rb') as f:
+                    files[rel] = f.read()
+
+        # Assets first, so the pages can be rewritten to their fingerprinted URLs
+        for rel, body in files.items():
+            if not rel.endswith('.html'):
+                digest = hashlib.sha256(body).hexdigest()
+                asset = Asset(rel, body, _mimetype(rel), digest)
+                self.assets[rel] = asset
+                self.urls[rel] = _fingerprint(rel, digest)
+                self.assets[self.urls[rel]] = asset.published()
+        for rel, body in files.items():
+            if rel.endswith('.html'):
+                body = self._rewrite(rel, body.decode('utf-8')).encode('utf-8')
+                self.assets[rel] = Asset(rel, body, 'text/html', hashlib.sha256(body).hexdigest())
+                directory = posixpath.dirname(rel)
+                if posixpath.basename(rel) == 'index.html' and directory:
+                    self.assets[directory] = self.assets[f"{directory}/"] = self.assets[rel]
+
+    def _rewrite(self, page, html):
+        """Point local src/href references of a page at fingerprinted URLs"""
+        base = posixpath.dirname(page)
+
+        def replace(match):
+            prefix, ref, quote = match.groups()
+            if '://' in ref or ref.startswith(('/', 'data:', 'mailto:')):
+                return match.group(0)
+            target = posixpath.normpath(posixpath.join(base, ref))
+            if target not in self.urls:
+                return match.group(0)
+            return f"{prefix}{ref[:len(ref) - len(posixpath.basename(ref))]}{posixpath.basename(self.urls[target])}{quote}"
+
+        return _REFERENCE.sub(replace, html)
+
+    def lookup(self, path):
+        return self.assets.get(path.lstrip('/'))
+
+_manifest = None
+_stamp = None
+_lock = threading.Lock()
+
+def _tree_stamp(root):
+    return max((os.stat(os.path.join(d, n)).st_mtime_ns for d, _, names in os.walk(root) for n in names),
+               default=0)
+
+def get_manifest(root, reload=False):
+    """The process-wide manifest, built on first use; with reload, rebuilt whenever a file changed (development)"""
+    global _manifest, _stamp
+    stamp = _tree_stamp(root) if reload else None
+    if _manifest is None or (reload and stamp != _stamp):
+        with _lock:
+            if _manifest is None or (reload and stamp != _stamp):
+                _manifest, _stamp = AssetManifest(root), stamp
+    return _manifest
@@ -0,0 +1,438 @@
+"""
+Offline load test for the grading API
+Starts the stub model server and the Flask app (on a temporary database,
+upload folder and cache), drives a weighted mix of login, list,
+create-assignment and submit traffic at each concurrency level, waits for
+the grading queue to drain and reports p50/p95/p99 latency, requests per
+second and time per pipeline step. Results are written to
+benchmarks/results/ and can be compared against an earlier run.
+
+    cd backend
+    python -m benchmarks.run_benchmark --concurrency 1,4,16 --duration 30 --latency-ms 800
+    python -m benchmarks.run_benchmark --compare benchmarks/results/<baseline>.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from http.cookiejar import CookieJar
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+DEFAULT_MIX = 'login=1,list_assignments=4,list_submissions=2,submit=2,create=1'
+PASSWORD = 'bench-password'
+
+# ========== PERCENTILES ==========
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for an empty list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4) if values else None,
+        "p50": _round(percentile(values, 50)),
+        "p95": _round(percentile(values, 95)),
+        "p99": _round(percentile(values, 99)),
+    }
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+def histogram_percentile(buckets, counts, pct):
+    """Upper bound of the bucket holding the pct-th observation"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = pct / 100.0 * total
+    seen = 0
+    for bound, count in zip(buckets, counts):
+        seen += count
+        if seen >= rank:
+            return bound
+    return float('inf')
+
+# ========== PDF PAYLOADS ==========
+
+def scanned_pdf(size_kb):
+    """PDF-looking payload without a text layer (takes the multimodal path)"""
+    body = os.urandom(max(0, size_kb * 1024 - 64))
+    return b'%PDF-1.4\n%' + uuid.uuid4().hex.encode() + b'\n' + body + b'\n%%EOF\n'
+
+def text_pdf(pages, chars_per_page=1500):
+    """Minimal born-digital PDF with a Helvetica text layer (takes the text fast path)"""
+    words = ('regression correlation coefficient variance mean median deviation sample '
+             'population estimate derive compute explain').split()
+    page_texts = [' '.join(random.choice(words) for _ in range(chars_per_page // 8)) for _ in range(pages)]
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               f'<< /Type /Pages /Kids [{" ".join(f"{3 + 2 * i} 0 R" for i in range(pages))}] /Count {pages} >>'.encode()]
+    font = 3 + 2 * pages
+    for i, text in enumerate(page_texts):
+        lines = [text[j:j + 90] for j in range(0, len(text), 90)]
+        stream = 'BT /F1 9 Tf 36 800 Td 11 TL ' + ' '.join(f'({line}) Tj T*' for line in lines) + ' ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * i} 0 R '
+                       f'/Resources << /Font << /F1 {font} 0 R >> >> >>'.encode())
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream'.encode())
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode() + obj + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return out
+
+# ========== HTTP CLIENT ==========
+
+class Client:
+    """Cookie-keeping HTTP client; every call returns (status, json body, seconds)"""
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, method, path, data=None, headers=None):
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers or {})
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=600) as response:
+                status, raw = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, raw = e.code, e.read()
+        except (urllib.error.URLError, OSError):
+            status, raw = 0, b''
+        elapsed = time.perf_counter() - start
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        return status, body, elapsed
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post_json(self, path, payload):
+        return self.request('POST', path, json.dumps(payload).encode(), {'Content-Type': 'application/json'})
+
+    def post_files(self, path, fields, files):
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for name, value in fields.items():
+            chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, (filename, data) in files.items():
+            chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                          f'Content-Type: application/pdf\r\n\r\n'.encode() + data + b'\r\n')
+        chunks.append(f'--{boundary}--\r\n'.encode())
+        return self.request('POST', path, b''.join(chunks),
+                            {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+# ========== WORKLOAD ==========
+
+class Workload:
+    def __init__(self, base_url, args):
+        self.base_url = base_url
+        self.args = args
+        self.assignment_ids = []
+        self.submission_ids = []
+        self._lock = threading.Lock()
+
+    def pdf(self):
+        if self.args.text_pdf:
+            return text_pdf(self.args.pdf_pages)
+        return scanned_pdf(self.args.pdf_kb)
+
+    def account(self, role, index):
+        username = f"bench_{role}_{index}"
+        client = Client(self.base_url)
+        client.post_json('/api/auth/register', {"username": username, "password": PASSWORD, "role": role})
+        status, body, _ = client.post_json('/api/auth/login', {"username": username, "password": PASSWORD, "role": role})
+        if status != 200:
+            raise RuntimeError(f"Login failed for {username}: {status} {body}")
+        return username, client
+
+    def create_assignment(self, faculty):
+        status, body, elapsed = faculty.post_files('/api/faculty/create-assignment', {
+            "title": f"Bench {uuid.uuid4().hex[:6]}", "subject": "Statistics", "deadline": "2099-01-01"
+        }, {"question_pdf": ("question.pdf", self.pdf()), "faculty_solution_pdf": ("solution.pdf", self.pdf())})
+        if status == 201:
+            with self._lock:
+                self.assignment_ids.append(body['assignment']['id'])
+        return status, elapsed
+
+    def run_user(self, index, mix, deadline, samples):
+        """One virtual user issuing weighted random operations until deadline"""
+        student_name, student = self.account('student', index)
+        _, faculty = self.account('faculty', index)
+        ops, weights = zip(*mix.items())
+        rng = random.Random(index)
+        while time.monotonic() < deadline:
+            op = rng.choices(ops, weights)[0]
+            if op == 'login':
+                status, _, elapsed = Client(self.base_url).post_json(
+                    '/api/auth/login', {"username": student_name, "password": PASSWORD, "role": "student"})
+            elif op == 'list_assignments':
+                status, _, elapsed = student.get('/api/assignments?limit=50')
+            elif op == 'list_submissions':
+                status, _, elapsed = faculty.get('/api/submissions?limit=50')
+            elif op == 'create':
+                status, elapsed = self.create_assignment(faculty)
+            elif op == 'submit':
+                with self._lock:
+                    assignment_id = rng.choice(self.assignment_ids)
+                status, body, elapsed = student.post_files('/api/student/submit-assignment', {
+                    "assignment_id": assignment_id}, {"sub_pdf": ("answers.pdf", self.pdf())})
+                if status == 202:
+                    with self._lock:
+                        self.submission_ids.append(body['result']['id'])
+            else:
+                raise ValueError(f"Unknown operation '{op}'")
+            samples.append((op, status, elapsed))
+
+def run_level(workload, concurrency, args, mix):
+    """Drive one concurrency level and collect request, step and grading stats"""
+    import database
+    from metrics import step_latency
+
+    steps_before = step_latency.snapshot()
+    first_submission = len(workload.submission_ids)
+    samples = []
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=workload.run_user, args=(i, mix, deadline, samples), daemon=True)
+               for i in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - started
+
+    # Let the background workers finish what this level queued
+    drain_started = time.monotonic()
+    while time.monotonic() - drain_started < args.drain_timeout:
+        counts = database.count_jobs_by_status()
+        if not counts.get('queued') and not counts.get('running'):
+            break
+        time.sleep(0.25)
+    drain = time.monotonic() - drain_started
+
+    ops = {}
+    for op in sorted({s[0] for s in samples}):
+        latencies = [s[2] for s in samples if s[0] == op]
+        errors = sum(1 for s in samples if s[0] == op and not 200 <= s[1] < 300)
+        ops[op] = {**summarize(latencies), "errors": errors}
+
+    steps = {}
+    steps_after = step_latency.snapshot()
+    for labels, (counts, total, count) in steps_after.items():
+        before_counts, before_total, before_count = steps_before.get(labels, ([0] * len(counts), 0, 0))
+        delta = [a - b for a, b in zip(counts, before_counts)]
+        n = count - before_count
+        if n:
+            steps[labels[0]] = {
+                "count": n,
+                "mean": round((total - before_total) / n, 4),
+                "p95_bucket": histogram_percentile(step_latency.buckets, delta, 95),
+            }
+
+    graded, failed, queued, totals = 0, 0, [], []
+    for submission_id in workload.submission_ids[first_submission:]:
+        submission = database.get_submission_by_id(submission_id) or {}
+        if submission.get('status') == 'graded':
+            graded += 1
+            timings = submission.get('timings') or {}
+            if timings.get('queued') is not None:
+                queued.append(timings['queued'])
+            if timings.get('total') is not None:
+                totals.append(timings['total'])
+        elif submission.get('status') == 'failed':
+            failed += 1
+
+    return {
+        "concurrency": concurrency,
+        "duration": round(wall, 2),
+        "requests": len(samples),
+        "rps": round(len(samples) / wall, 2) if wall else None,
+        "errors": sum(1 for s in samples if not 200 <= s[1] < 300),
+        "latency": summarize([s[2] for s in samples]),
+        "ops": ops,
+        "steps": steps,
+        "grading": {
+            "submitted": len(workload.submission_ids) - first_submission,
+            "graded": graded,
+            "failed": failed,
+            "drainSeconds": round(drain, 2),
+            "queued": summarize(queued),
+            "pipeline": summarize(totals),
+        },
+    }
+
+# ========== REPORTING ==========
+
+def _ms(value):
+    return '-' if value is None else f"{value * 1000:.0f}"
+
+def print_level(level):
+    print(f"\n=== concurrency {level['concurrency']}: {level['requests']} requests in {level['duration']}s "
+          f"({level['rps']} req/s, {level['errors']} errors) ===")
+    print(f"{'operation':<18}{'count':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for op, stats in level['ops'].items():
+        print(f"{op:<18}{stats['count']:>7}{stats['errors']:>5}{_ms(stats['p50']):>9}"
+              f"{_ms(stats['p95']):>9}{_ms(stats['p99']):>9}")
+    if level['steps']:
+        print(f"{'pipeline step':<18}{'count':>7}{'mean ms':>10}{'p95 <= ms':>11}")
+        for step, stats in sorted(level['steps'].items()):
+            print(f"{step:<18}{stats['count']:>7}{_ms(stats['mean']):>10}{_ms(stats['p95_bucket']):>11}")
+    grading = level['grading']
+    print(f"grading: {grading['graded']}/{grading['submitted']} graded, {grading['failed']} failed, "
+          f"queue wait p95 {_ms(grading['queued']['p95'])} ms, pipeline p95 {_ms(grading['pipeline']['p95'])} ms, "
+          f"drained in {grading['drainSeconds']}s")
+
+def compare(result, baseline, threshold):
+    """Print p95 / throughput changes against a baseline; returns the regressions found"""
+    regressions = []
+    base_levels = {level['concurrency']: level for level in baseline.get('levels', [])}
+    print(f"\n=== compared with {baseline.get('label')} ({baseline.get('createdAt')}) ===")
+    for level in result['levels']:
+        base = base_levels.get(level['concurrency'])
+        if not base:
+            continue
+        checks = [(f"c={level['concurrency']} req/s", base['rps'], level['rps'], False)]
+        for op, stats in level['ops'].items():
+            if op in base['ops']:
+                checks.append((f"c={level['concurrency']} {op} p95", base['ops'][op]['p95'], stats['p95'], True))
+        for name, old, new, lower_is_better in checks:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if lower_is_better else change < -threshold
+            print(f"{name:<32}{old:>10.3f}{new:>10.3f}{change * 100:>+8.1f}%{'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append(name)
+    return regressions
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# ========== MAIN ==========
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated virtual user counts')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of traffic per level')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation=weight list')
+    parser.add_argument('--latency-ms', type=float, default=800, help='stub model mean latency per call')
+    parser.add_argument('--jitter-ms', type=float, default=300)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of stub calls answered with 503')
+    parser.add_argument('--pdf-kb', type=int, default=200, help='size of generated scanned PDFs')
+    parser.add_argument('--text-pdf', action='store_true', help='upload born-digital PDFs (text fast path)')
+    parser.add_argument('--pdf-pages', type=int, default=4)
+    parser.add_argument('--seed-assignments', type=int, default=3)
+    parser.add_argument('--drain-timeout', type=float, default=300)
+    parser.add_argument('--cache', action='store_true', help='keep the LLM response cache enabled')
+    parser.add_argument('--label', default=None, help='name for the saved result file')
+    parser.add_argument('--output-dir', default=RESULTS_DIR)
+    parser.add_argument('--compare', default=None, help='baseline result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative regression')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    from benchmarks.stub_model_server import make_server, StubModel, load_fixtures
+    stub = make_server(port=0, model=StubModel(load_fixtures(), args.latency_ms, args.jitter_ms, args.error_rate))
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    # The app reads its configuration at import time, so set it up first
+    workdir = tempfile.mkdtemp(prefix='paper_checker_bench_')
+    os.environ.update({
+        "MODEL_BACKEND": "stub",
+        "STUB_MODEL_URL": f"http://127.0.0.1:{stub.server_address[1]}",
+        "DATABASE_PATH": os.path.join(workdir, 'bench.db'),
+        "UPLOAD_FOLDER": os.path.join(workdir, 'uploads'),
+        "LLM_CACHE_DIR": os.path.join(workdir, 'llm_cache'),
+        "LOCAL_FILES_DIR": os.path.join(workdir, 'files'),
+        "LLM_CACHE_ENABLED": "1" if args.cache else "0",
+    })
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "0")
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('pypdf').setLevel(logging.ERROR)
+    from werkzeug.serving import make_server as make_app_server
+    import config
+    from app import app
+    server = make_app_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"App on {base_url}, stub model on {os.environ['STUB_MODEL_URL']}, data in {workdir}")
+
+    workload = Workload(base_url, args)
+    _, faculty = workload.account('faculty', 'seed')
+    for _ in range(args.seed_assignments):
+        status, _ = workload.create_assignment(faculty)
+        if status != 201:
+            sys.exit(f"Could not create seed assignments (HTTP {status})")
+
+    result = {
+        "label": args.label or datetime.now().strftime('%Y%m%d-%H%M%S'),
+        "createdAt": datetime.now().isoformat(),
+        "gitCommit": _git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ('output_dir', 'compare')},
+        "settings": {name: getattr(config, name) for name in (
+            'GRADING_WORKERS', 'BULK_GRADING_CONCURRENCY', 'GRADING_QUESTION_CONCURRENCY',
+            'PIPELINE_MAX_PARALLEL_STEPS', 'GRADING_MODE', 'LLM_CACHE_ENABLED', 'PDF_TEXT_FAST_PATH',
+            'STREAM_STUDENT_ANSWERS')},
+        "levels": [],
+    }
+    for concurrency in levels:
+        level = run_level(workload, concurrency, args, mix)
+        print_level(level)
+        result['levels'].append(level)
+    result['stubRequests'] = stub.model.requests
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{result['label']}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved {path}")
+
+    server.shutdown()
+    stub.shutdown()
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Local stand-in for the Gemini generateContent endpoint
+Answers POST /<version>/models/<model>:generateContent with fixtures built
+from outputs/result_john.doe.json, after a configurable delay, so the app
+can be exercised without spending quota. :streamGenerateContent sends the
+same text as server-sent chunks, with the delay spread across them. Point the app at it with
+MODEL_BACKEND=stub and STUB_MODEL_URL (see config.py).
+
+    python -m benchmarks.stub_model_server --port 8765 --latency-ms 800 --jitter-ms 300
+"""
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'outputs', 'result_john.doe.json')
+
+def load_fixtures(path=FIXTURE_FILE):
+    """Responses for each step, derived from one real final report"""
+    with open(path, 'r') as f:
+        report = json.load(f)
+    results = report['results']
+    return {
+        'structure': [{"id": r['question_id'], "sub_parts": [], "max_marks": r['max_marks']} for r in results],
+        'faculty_key': [{"id": r['question_id'], "max_marks": r['max_marks'],
+                         "solution": r['feedback'], "keywords": r['feedback'].split()[:4]} for r in results],
+        'student_answers': [{"id": r['question_id'], "extracted_text": r['feedback']} for r in results],
+        'questions': {r['question_id']: r for r in results},
+        'report': report,
+    }
+
+class StubModel:
+    def __init__(self, fixtures, latency_ms=0, jitter_ms=0, error_rate=0.0, seed=None):
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self.random.random() < self.error_rate
+        return delay, fail
+
+    def _payload(self, text, prompt_tokens, final_text):
+        payload = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+        if final_text is not None:  # last chunk: finish reason and usage for the whole response
+            payload['candidates'][0]['finishReason'] = "STOP"
+            payload['usageMetadata'] = {"promptTokenCount": prompt_tokens,
+                                        "candidatesTokenCount": len(final_text) // 4,
+                                        "totalTokenCount": prompt_tokens + len(final_text) // 4}
+        return payload
+
+    def _prompt(self, body):
+        parts = [p for c in body.get('contents', []) for p in c.get('parts', [])]
+        prompt = ' '.join(p.get('text', '') for p in parts)
+        return prompt, len(prompt) // 4 + sum(258 for p in parts if 'inlineData' in p or 'fileData' in p)
+
+    def respond(self, body):
+        """(status, payload) for a generateContent request body"""
+        delay, fail = self._admit()
+        time.sleep(delay)
+        if fail:
+            return 503, {"error": {"code": 503, "message": "stub overloaded", "status": "UNAVAILABLE"}}
+        prompt, prompt_tokens = self._prompt(body)
+        text = json.dumps(self._answer(prompt))
+        return 200, self._payload(text, prompt_tokens, text)
+
+    def stream(self, body):
+        """(status, [payload, ...] generator) for a streamGenerateContent request body;
+        a list answer is sent one element per chunk"""
+        delay, fail = self._admit()
+        if fail:
+            time.sleep(delay)
+            return 503, {"error": {"code": 503, "message": "stub overloaded", "status": "UNAVAILABLE"}}
+        prompt, prompt_tokens = self._prompt(body)
+        answer = self._answer(prompt)
+        if isinstance(answer, list) and answer:
+            pieces = ['[' + json.dumps(answer[0])] + [', ' + json.dumps(item) for item in answer[1:]]
+            pieces[-1] += ']'
+        else:
+            pieces = [json.dumps(answer)]
+        text = ''.join(pieces)
+
+        def chunks():
+            for i, piece in enumerate(pieces):
+                time.sleep(delay / len(pieces))
+                yield self._payload(piece, prompt_tokens, text if i == len(pieces) - 1 else None)
+
+        return 200, chunks()
+
+    def _answer(self, prompt):
+        if 'Question Paper' in prompt:
+            return self.fixtures['structure']
+        if 'Academic Expert' in prompt:
+            return self.fixtures['faculty_key']
+        if 'Answer Extractor' in prompt:
+            return self.fixtures['student_answers']
+        match = re.search(r'Question ID:\s*(\S+)', prompt)
+        if match:
+            question = self.fixtures['questions'].get(match.group(1))
+            return question or {"question_id": match.group(1), "marks_obtained": 0, "max_marks": 0, "feedback": ""}
+        return self.fixtures['report']
+
+def make_server(host='127.0.0.1', port=8765, model=None):
+    model = model or StubModel(load_fixtures())
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length)
+            method = self.path.split('?')[0].rsplit(':', 1)[-1]
+            if method not in ('generateContent', 'streamGenerateContent'):
+                return self._send(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+            try:
+                body = json.loads(raw or b'{}')
+            except json.JSONDecodeError:
+                return self._send(400, {"error": {"code": 400, "message": "bad json", "status": "INVALID_ARGUMENT"}})
+            if method == 'generateContent':
+                return self._send(*model.respond(body))
+            status, payload = model.stream(body)
+            if status != 200:
+                return self._send(status, payload)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            for chunk in payload:
+                self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode())
+                self.wfile.flush()
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.model = model
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=800, help='mean delay per call')
+    parser.add_argument('--jitter-ms', type=float, default=300, help='uniform +/- jitter around the mean')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with 503')
+    parser.add_argument('--fixture', default=FIXTURE_FILE)
+    args = parser.parse_args()
+
+    model = StubModel(load_fixtures(args.fixture), args.latency_ms, args.jitter_ms, args.error_rate)
+    server = make_server(args.host, args.port, model)
+    print(f"Stub model server on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
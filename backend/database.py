@@ -1,21 +1,51 @@
 """
 Database management for assignments, submissions, and papers
-Uses JSON files for data persistence
+Uses SQLite (WAL mode) for data persistence. Each record is stored as a
+JSON document next to indexed lookup columns, so callers keep working
+with plain dicts. Data from the old JSON files is imported once.
 """
 import os
 import json
+import uuid
+import sqlite3
+import threading
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
+
+import analytics
 
 BASE_DIR = os.path.dirname(__file__)
 DB_FOLDER = os.path.join(BASE_DIR, 'database')
+DB_FILE = os.getenv('DATABASE_PATH', os.path.join(DB_FOLDER, 'paper_checker.db'))
+
+# Legacy JSON files, only read by the one-shot migration
 ASSIGNMENTS_FILE = os.path.join(DB_FOLDER, 'assignments.json')
 SUBMISSIONS_FILE = os.path.join(DB_FOLDER, 'submissions.json')
 PAPERS_FILE = os.path.join(DB_FOLDER, 'papers.json')
+JOBS_FILE = os.path.join(DB_FOLDER, 'jobs.json')
+BATCHES_FILE = os.path.join(DB_FOLDER, 'batches.json')
+USERS_FILE = os.path.join(BASE_DIR, 'users.json')
+
+# Table -> {record field: indexed column}
+TABLES = {
+    'assignments': {'teacherId': 'teacher_id'},
+    'submissions': {'assignmentId': 'assignment_id', 'studentId': 'student_id'},
+    'papers': {'teacherId': 'teacher_id'},
+    'jobs': {'ownerId': 'owner_id', 'status': 'status'},
+    'batches': {'assignmentId': 'assignment_id'},
+    'users': {'username': 'username'},
+    'blobs': {},
+    'analytics': {},
+}
+UNIQUE_COLUMNS = {('users', 'username')}
 
 # Ensure database folder exists
 os.makedirs(DB_FOLDER, exist_ok=True)
 
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_for = None
+
 def load_json_file(filepath: str, default: List = None) -> List:
     """Load JSON file, return default if doesn't exist"""
     if default is None:
@@ -28,109 +58,620 @@ def load_json_file(filepath: str, default: List = None) -> List:
     except (json.JSONDecodeError, IOError):
         return default
 
-def save_json_file(filepath: str, data: List):
-    """Save data to JSON file"""
-    with open(filepath, 'w') as f:
-        json.dump(data, f, indent=2)
+# ========== CONNECTION & SCHEMA ==========
+def get_connection() -> sqlite3.Connection:
+    """Per-thread connection; creates the schema and migrates JSON data on first use"""
+    global _initialized_for
+    if _initialized_for != DB_FILE:
+        with _init_lock:
+            if _initialized_for != DB_FILE:
+                _init_db()
+                _initialized_for = DB_FILE
+
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != DB_FILE:
+        conn = _open(DB_FILE)
+        _local.conn = conn
+        _local.path = DB_FILE
+    return conn
+
+def _open(path: str) -> sqlite3.Connection:
+    # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+def _init_db():
+    conn = _open(DB_FILE)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        for table, columns in TABLES.items():
+            extra = ''.join(f', {col} TEXT' for col in columns.values())
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {table} '
+                         f'(seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL{extra}, data TEXT NOT NULL)')
+            for col in columns.values():
+                unique = 'UNIQUE ' if (table, col) in UNIQUE_COLUMNS else ''
+                conn.execute(f'CREATE {unique}INDEX IF NOT EXISTS idx_{table}_{col} ON {table} ({col})')
+        _create_plagiarism_tables(conn)
+        _create_answer_group_tables(conn)
+        _create_event_tables(conn)
+
+        migrated = conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if not migrated:
+            _migrate_from_json(conn)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                         (datetime.now().isoformat(),))
+        if not conn.execute("SELECT 1 FROM meta WHERE key = 'analytics_built'").fetchone():
+            _build_all_analytics(conn)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('analytics_built', ?)",
+                         (datetime.now().isoformat(),))
+        if not conn.execute("SELECT 1 FROM meta WHERE key = 'users_json_migrated'").fetchone():
+            _migrate_users_from_json(conn)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('users_json_migrated', ?)",
+                         (datetime.now().isoformat(),))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+def _create_plagiarism_tables(conn: sqlite3.Connection):
+    """MinHash signatures and LSH buckets per (assignment, question), see plagiarism.py"""
+    conn.execute('CREATE TABLE IF NOT EXISTS plagiarism_signatures '
+                 '(assignment_id TEXT NOT NULL, question_id TEXT NOT NULL, submission_id TEXT NOT NULL, '
+                 'words INTEGER NOT NULL, signature BLOB NOT NULL, '
+                 'PRIMARY KEY (assignment_id, question_id, submission_id))')
+    conn.execute('CREATE TABLE IF NOT EXISTS plagiarism_buckets '
+                 '(assignment_id TEXT NOT NULL, question_id TEXT NOT NULL, bucket TEXT NOT NULL, '
+                 'submission_id TEXT NOT NULL, PRIMARY KEY (assignment_id, question_id, bucket, submission_id))')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_plagiarism_buckets_submission '
+                 'ON plagiarism_buckets (assignment_id, submission_id)')
+
+def _create_answer_group_tables(conn: sqlite3.Connection):
+    """Graded answer groups per (assignment, question, key slice), see answer_groups.py"""
+    conn.execute('CREATE TABLE IF NOT EXISTS answer_groups '
+                 '(id INTEGER PRIMARY KEY AUTOINCREMENT, assignment_id TEXT NOT NULL, question_id TEXT NOT NULL, '
+                 'key_hash TEXT NOT NULL, normalized TEXT NOT NULL, vector TEXT NOT NULL, result TEXT NOT NULL, '
+                 'members INTEGER NOT NULL DEFAULT 1, created_at TEXT NOT NULL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_answer_groups_question '
+                 'ON answer_groups (assignment_id, question_id, key_hash)')
+
+def _create_event_tables(conn: sqlite3.Connection):
+    """Grading progress events per channel (submission), see events.py"""
+    conn.execute('CREATE TABLE IF NOT EXISTS events '
+                 '(id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, event TEXT NOT NULL, '
+                 'data TEXT NOT NULL, created_at REAL NOT NULL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_events_channel ON events (channel, id)')
+
+def _build_all_analytics(conn: sqlite3.Connection):
+    """One-shot backfill of the per-assignment aggregates from existing submissions"""
+    by_assignment = {}
+    for (data,) in conn.execute('SELECT data FROM submissions ORDER BY seq'):
+        submission = json.loads(data)
+        by_assignment.setdefault(submission.get('assignmentId'), []).append(submission)
+    for assignment_id, submissions in by_assignment.items():
+        if assignment_id:
+            _save_analytics(conn, analytics.build(assignment_id, submissions))
+
+def _migrate_from_json(conn: sqlite3.Connection):
+    """One-shot import of the legacy JSON files (left in place as a backup)"""
+    sources = {
+        'assignments': ASSIGNMENTS_FILE,
+        'submissions': SUBMISSIONS_FILE,
+        'papers': PAPERS_FILE,
+        'jobs': JOBS_FILE,
+        'batches': BATCHES_FILE,
+    }
+    for table, filepath in sources.items():
+        records = [r for r in load_json_file(filepath, []) if isinstance(r, dict) and r.get('id')]
+        for record in records:
+            conn.execute(*_insert_sql(table, record, or_ignore=True))
+        if records:
+            print(f"✅ Migrated {len(records)} {table} from {os.path.basename(filepath)}")
+
+def _migrate_users_from_json(conn: sqlite3.Connection):
+    """One-shot import of users.json ({username: user}), left in place as a backup"""
+    users = load_json_file(USERS_FILE, {})
+    if not isinstance(users, dict):
+        return
+    for username, user in users.items():
+        record = dict(user, username=username)
+        record.setdefault('id', username)
+        conn.execute(*_insert_sql('users', record, or_ignore=True))
+    if users:
+        print(f"✅ Migrated {len(users)} users from {os.path.basename(USERS_FILE)}")
+
+# ========== GENERIC RECORD HELPERS ==========
+def _insert_sql(table: str, record: Dict, or_ignore: bool = False):
+    columns = TABLES[table]
+    names = ['id'] + list(columns.values()) + ['data']
+    values = [record['id']] + [record.get(field) for field in columns] + [json.dumps(record)]
+    verb = 'INSERT OR IGNORE' if or_ignore else 'INSERT'
+    return (f'{verb} INTO {table} ({", ".join(names)}) VALUES ({", ".join("?" for _ in names)})', values)
+
+def _new_record_id(conn: sqlite3.Connection, table: str, prefix: str) -> str:
+    """Timestamp-based ID, bumped when records are created within the same millisecond"""
+    stamp = int(datetime.now().timestamp() * 1000)
+    while conn.execute(f'SELECT 1 FROM {table} WHERE id = ?', (f"{prefix}_{stamp}",)).fetchone():
+        stamp += 1
+    return f"{prefix}_{stamp}"
+
+def _select(table: str, column: str = None, values: List = None,
+            after_id: str = None, limit: int = None) -> List[Dict]:
+    """Records in insertion order; after_id/limit page through them by cursor.
+    Raises ValueError when after_id is not a record of the table."""
+    sql = f'SELECT data FROM {table}'
+    where, params = [], []
+    if column:
+        where.append(f'{column} IN ({", ".join("?" for _ in values)})')
+        params += list(values)
+    if after_id:
+        row = get_connection().execute(f'SELECT seq FROM {table} WHERE id = ?', (after_id,)).fetchone()
+        if row is None:
+            raise ValueError("Invalid cursor")
+        where.append('seq > ?')
+        params.append(row[0])
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY seq'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    rows = get_connection().execute(sql, params).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+def _bump_version(conn: sqlite3.Connection, table: str):
+    conn.execute("INSERT INTO meta (key, value) VALUES (?, '1') "
+                 "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                 (f'version:{table}',))
+
+def get_table_versions(tables: List[str]) -> Dict[str, int]:
+    """Change counters per table, bumped on every create/update (used for ETags)"""
+    rows = get_connection().execute(
+        f'SELECT key, value FROM meta WHERE key IN ({", ".join("?" for _ in tables)})',
+        [f'version:{t}' for t in tables]).fetchall()
+    versions = {key.split(':', 1)[1]: int(value) for key, value in rows}
+    return {t: versions.get(t, 0) for t in tables}
+
+def _get(table: str, record_id: str) -> Optional[Dict]:
+    row = get_connection().execute(f'SELECT data FROM {table} WHERE id = ?', (record_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def _create(table: str, record: Dict, id_value: str = None, prefix: str = None,
+            stamp_field: str = 'createdAt') -> Dict:
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        record['id'] = id_value or _new_record_id(conn, table, prefix)
+        record[stamp_field] = datetime.now().isoformat()
+        conn.execute(*_insert_sql(table, record))
+        _on_write(conn, table, None, record)
+        _bump_version(conn, table)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return record
+
+def _update(table: str, record_id: str, updates: Dict, expect: Dict = None) -> Optional[Dict]:
+    """Merge updates into a record inside one transaction.
+    If expect is given, only update when those fields currently match."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(f'SELECT data FROM {table} WHERE id = ?', (record_id,)).fetchone()
+        if not row:
+            conn.execute('ROLLBACK')
+            return None
+        record = json.loads(row[0])
+        if expect and any(record.get(k) != v for k, v in expect.items()):
+            conn.execute('ROLLBACK')
+            return None
+        old = dict(record)
+        record.update(updates)
+        columns = TABLES[table]
+        assignments = ''.join(f'{col} = ?, ' for col in columns.values())
+        conn.execute(f'UPDATE {table} SET {assignments}data = ? WHERE id = ?',
+                     [record.get(field) for field in columns] + [json.dumps(record), record_id])
+        _on_write(conn, table, old, record)
+        _bump_version(conn, table)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return record
+
+def _on_write(conn: sqlite3.Connection, table: str, old: Optional[Dict], new: Dict):
+    """Keep derived data in step with a record write, inside its transaction"""
+    if table == 'submissions':
+        for assignment_id in {r.get('assignmentId') for r in (old, new) if r} - {None}:
+            before = old if old and old.get('assignmentId') == assignment_id else None
+            after = new if new.get('assignmentId') == assignment_id else None
+            # Status-only churn (jobId, events, queued -> processing...) often leaves the aggregate as it was
+            if analytics.contribution(before) == analytics.contribution(after):
+                continue
+            aggregate = _load_analytics(conn, assignment_id)
+            analytics.update(aggregate, before, after)
+            _save_analytics(conn, aggregate)
+
+def _load_analytics(conn: sqlite3.Connection, assignment_id: str) -> Dict:
+    row = conn.execute('SELECT data FROM analytics WHERE id = ?', (assignment_id,)).fetchone()
+    return json.loads(row[0]) if row else analytics.empty(assignment_id)
+
+def _save_analytics(conn: sqlite3.Connection, aggregate: Dict):
+    record = dict(aggregate, id=aggregate['assignmentId'])
+    conn.execute('INSERT INTO analytics (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data',
+                 (record['id'], json.dumps(record)))
+    _bump_version(conn, 'analytics')
 
 # ========== ASSIGNMENTS ==========
-def get_all_assignments() -> List[Dict]:
+def get_all_assignments(after_id: str = None, limit: int = None) -> List[Dict]:
     """Get all assignments"""
-    return load_json_file(ASSIGNMENTS_FILE, [])
+    return _select('assignments', after_id=after_id, limit=limit)
 
 def get_assignment_by_id(assignment_id: str) -> Optional[Dict]:
     """Get assignment by ID"""
-    assignments = get_all_assignments()
-    return next((a for a in assignments if a.get('id') == assignment_id), None)
+    return _get('assignments', assignment_id)
+
+def get_assignments_by_teacher(teacher_id: str) -> List[Dict]:
+    """Get all assignments created by a teacher"""
+    return _select('assignments', 'teacher_id', [teacher_id])
 
 def create_assignment(assignment_data: Dict) -> Dict:
     """Create a new assignment"""
-    assignments = get_all_assignments()
-    assignment_data['id'] = f"asg_{int(datetime.now().timestamp() * 1000)}"
-    assignment_data['createdAt'] = datetime.now().isoformat()
-    assignments.append(assignment_data)
-    save_json_file(ASSIGNMENTS_FILE, assignments)
-    return assignment_data
+    return _create('assignments', assignment_data, prefix='asg')
 
 def update_assignment(assignment_id: str, updates: Dict) -> Optional[Dict]:
     """Update an assignment"""
-    assignments = get_all_assignments()
-    for i, assignment in enumerate(assignments):
-        if assignment.get('id') == assignment_id:
-            assignments[i].update(updates)
-            save_json_file(ASSIGNMENTS_FILE, assignments)
-            return assignments[i]
-    return None
+    return _update('assignments', assignment_id, updates)
+
+def get_assignment_analytics(assignment_id: str) -> Dict:
+    """Class aggregate for an assignment (empty when nothing was submitted yet)"""
+    return _get('analytics', assignment_id) or analytics.empty(assignment_id)
+
+def rebuild_assignment_analytics(assignment_id: str) -> Dict:
+    """Recompute an assignment's aggregate from all of its submissions"""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute('SELECT data FROM submissions WHERE assignment_id = ? ORDER BY seq',
+                            (assignment_id,)).fetchall()
+        aggregate = analytics.build(assignment_id, [json.loads(row[0]) for row in rows])
+        _save_analytics(conn, aggregate)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return aggregate
 
 # ========== SUBMISSIONS ==========
 def get_all_submissions() -> List[Dict]:
     """Get all submissions"""
-    return load_json_file(SUBMISSIONS_FILE, [])
+    return _select('submissions')
 
 def get_submission_by_id(submission_id: str) -> Optional[Dict]:
     """Get submission by ID"""
-    submissions = get_all_submissions()
-    return next((s for s in submissions if s.get('id') == submission_id), None)
+    return _get('submissions', submission_id)
 
-def get_submissions_by_assignment(assignment_id: str) -> List[Dict]:
+def get_submissions_by_assignment(assignment_id: str, after_id: str = None, limit: int = None) -> List[Dict]:
     """Get all submissions for an assignment"""
-    submissions = get_all_submissions()
-    return [s for s in submissions if s.get('assignmentId') == assignment_id]
+    return _select('submissions', 'assignment_id', [assignment_id], after_id=after_id, limit=limit)
 
-def get_submissions_by_student(student_id: str) -> List[Dict]:
+def get_submissions_by_assignments(assignment_ids: List[str], after_id: str = None,
+                                   limit: int = None) -> List[Dict]:
+    """Get all submissions for any of the given assignments"""
+    if not assignment_ids:
+        return []
+    return _select('submissions', 'assignment_id', assignment_ids, after_id=after_id, limit=limit)
+
+def get_submissions_by_student(student_id: str, after_id: str = None, limit: int = None) -> List[Dict]:
     """Get all submissions by a student"""
-    submissions = get_all_submissions()
-    return [s for s in submissions if s.get('studentId') == student_id]
+    return _select('submissions', 'student_id', [student_id], after_id=after_id, limit=limit)
 
 def create_submission(submission_data: Dict) -> Dict:
     """Create a new submission"""
-    submissions = get_all_submissions()
-    submission_data['id'] = f"sub_{int(datetime.now().timestamp() * 1000)}"
-    submission_data['submittedAt'] = datetime.now().isoformat()
-    submissions.append(submission_data)
-    save_json_file(SUBMISSIONS_FILE, submissions)
-    return submission_data
+    return _create('submissions', submission_data, prefix='sub', stamp_field='submittedAt')
 
 def update_submission(submission_id: str, updates: Dict) -> Optional[Dict]:
     """Update a submission"""
-    submissions = get_all_submissions()
-    for i, submission in enumerate(submissions):
-        if submission.get('id') == submission_id:
-            submissions[i].update(updates)
-            save_json_file(SUBMISSIONS_FILE, submissions)
-            return submissions[i]
-    return None
+    return _update('submissions', submission_id, updates)
+
+def update_submission_if(submission_id: str, updates: Dict, expect: Dict) -> Optional[Dict]:
+    """Update a submission only if the expect fields still match; returns None if they changed"""
+    return _update('submissions', submission_id, updates, expect=expect)
 
 # ========== PAPERS (Paper Check Feature) ==========
 def get_all_papers() -> List[Dict]:
     """Get all papers (for paper check feature)"""
-    return load_json_file(PAPERS_FILE, [])
+    return _select('papers')
 
 def get_paper_by_id(paper_id: str) -> Optional[Dict]:
     """Get paper by ID"""
-    papers = get_all_papers()
-    return next((p for p in papers if p.get('id') == paper_id), None)
+    return _get('papers', paper_id)
 
 def get_papers_by_teacher(teacher_id: str) -> List[Dict]:
     """Get all papers checked by a teacher"""
-    papers = get_all_papers()
-    return [p for p in papers if p.get('teacherId') == teacher_id]
+    return _select('papers', 'teacher_id', [teacher_id])
 
 def create_paper(paper_data: Dict) -> Dict:
     """Create a new paper check record"""
-    papers = get_all_papers()
-    paper_data['id'] = f"paper_{int(datetime.now().timestamp() * 1000)}"
-    paper_data['createdAt'] = datetime.now().isoformat()
-    papers.append(paper_data)
-    save_json_file(PAPERS_FILE, papers)
-    return paper_data
+    return _create('papers', paper_data, prefix='paper')
 
 def update_paper(paper_id: str, updates: Dict) -> Optional[Dict]:
     """Update a paper"""
-    papers = get_all_papers()
-    for i, paper in enumerate(papers):
-        if paper.get('id') == paper_id:
-            papers[i].update(updates)
-            save_json_file(PAPERS_FILE, papers)
-            return papers[i]
-    return None
+    return _update('papers', paper_id, updates)
+
+# ========== JOBS (Background Grading Queue) ==========
+def get_all_jobs() -> List[Dict]:
+    """Get all grading jobs"""
+    return _select('jobs')
+
+def get_job_by_id(job_id: str) -> Optional[Dict]:
+    """Get job by ID"""
+    return _get('jobs', job_id)
+
+def get_jobs_by_owner(owner_id: str) -> List[Dict]:
+    """Get all jobs enqueued by a user"""
+    return _select('jobs', 'owner_id', [owner_id])
+
+def get_jobs_by_status(statuses: List[str]) -> List[Dict]:
+    """Get all jobs whose status is one of the given statuses, oldest first"""
+    return _select('jobs', 'status', statuses)
+
+def count_jobs_by_status() -> Dict[str, int]:
+    """Number of jobs in each status"""
+    rows = get_connection().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+    return {status: count for status, count in rows}
+
+def create_job(job_data: Dict) -> Dict:
+    """Create a new job"""
+    return _create('jobs', job_data, id_value=f"job_{uuid.uuid4().hex[:12]}")
+
+def update_job(job_id: str, updates: Dict) -> Optional[Dict]:
+    """Update a job"""
+    return _update('jobs', job_id, updates)
+
+def claim_job(job_id: str, from_status: str, updates: Dict) -> Optional[Dict]:
+    """Update a job only if it is still in from_status; returns None if someone else took it"""
+    return _update('jobs', job_id, updates, expect={'status': from_status})
+
+def update_job_if(job_id: str, updates: Dict, expect: Dict) -> Optional[Dict]:
+    """Update a job only if the expected fields still match; returns None otherwise"""
+    return _update('jobs', job_id, updates, expect=expect)
+
+# ========== BATCHES (Bulk Grading) ==========
+def get_all_batches() -> List[Dict]:
+    """Get all bulk grading batches"""
+    return _select('batches')
+
+def get_batch_by_id(batch_id: str) -> Optional[Dict]:
+    """Get batch by ID"""
+    return _get('batches', batch_id)
+
+def get_batches_by_assignment(assignment_id: str) -> List[Dict]:
+    """Get all batches for an assignment"""
+    return _select('batches', 'assignment_id', [assignment_id])
+
+def create_batch(batch_data: Dict) -> Dict:
+    """Create a new batch"""
+    return _create('batches', batch_data, prefix='batch')
+
+def update_batch(batch_id: str, updates: Dict) -> Optional[Dict]:
+    """Update a batch"""
+    return _update('batches', batch_id, updates)
+
+# ========== USERS ==========
+def get_all_users() -> List[Dict]:
+    """Get all users (including password hashes)"""
+    return _select('users')
+
+def get_user_by_username(username: str) -> Optional[Dict]:
+    """Get user by username"""
+    users = _select('users', 'username', [username])
+    return users[0] if users else None
+
+def create_user(user_data: Dict) -> Optional[Dict]:
+    """Create a new user; returns None if the username is already taken"""
+    try:
+        return _create('users', user_data, id_value=user_data['id'])
+    except sqlite3.IntegrityError:
+        return None
+
+def update_user(user_id: str, updates: Dict) -> Optional[Dict]:
+    """Update a user"""
+    return _update('users', user_id, updates)
+
+# ========== BLOBS (Content-Addressed Uploads) ==========
+def get_blob_by_id(blob_id: str) -> Optional[Dict]:
+    """Get blob metadata by its SHA-256"""
+    return _get('blobs', blob_id)
+
+def add_blob_ref(blob_id: str, size: int) -> Dict:
+    """Create a blob record or bump its reference count"""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT data FROM blobs WHERE id = ?', (blob_id,)).fetchone()
+        if row:
+            record = json.loads(row[0])
+            record['refCount'] = record.get('refCount', 0) + 1
+            conn.execute('UPDATE blobs SET data = ? WHERE id = ?', (json.dumps(record), blob_id))
+        else:
+            record = {"id": blob_id, "size": size, "refCount": 1, "createdAt": datetime.now().isoformat()}
+            conn.execute(*_insert_sql('blobs', record))
+        _bump_version(conn, 'blobs')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return record
+
+def release_blob_ref(blob_id: str) -> int:
+    """Drop one reference. Returns remaining refs; at 0 the record stays, marked
+    unused, until delete_unused_blob removes it together with the file."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT data FROM blobs WHERE id = ?', (blob_id,)).fetchone()
+        if not row:
+            conn.execute('ROLLBACK')
+            return 0
+        record = json.loads(row[0])
+        record['refCount'] = max(0, record.get('refCount', 1) - 1)
+        conn.execute('UPDATE blobs SET data = ? WHERE id = ?', (json.dumps(record), blob_id))
+        _bump_version(conn, 'blobs')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return record['refCount']
+
+def delete_unused_blob(blob_id: str, remove_file: Callable[[], None]) -> bool:
+    """Delete a blob record and its file, if it still has no references.
+    remove_file runs inside the write transaction, so no process can add a
+    reference between the check and the removal."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT data FROM blobs WHERE id = ?', (blob_id,)).fetchone()
+        if not row or json.loads(row[0]).get('refCount', 0) > 0:
+            conn.execute('ROLLBACK')
+            return False
+        remove_file()
+        conn.execute('DELETE FROM blobs WHERE id = ?', (blob_id,))
+        _bump_version(conn, 'blobs')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return True
+
+# ========== PLAGIARISM INDEX (MinHash/LSH) ==========
+def index_plagiarism_signatures(assignment_id: str, submission_id: str, entries: Dict) -> None:
+    """Replace a submission's entries in its assignment's index.
+    entries maps question ID -> (word count, signature bytes, [LSH bucket keys])."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for table in ('plagiarism_signatures', 'plagiarism_buckets'):
+            conn.execute(f'DELETE FROM {table} WHERE assignment_id = ? AND submission_id = ?',
+                         (assignment_id, submission_id))
+        for question_id, (words, signature, buckets) in entries.items():
+            conn.execute('INSERT INTO plagiarism_signatures VALUES (?, ?, ?, ?, ?)',
+                         (assignment_id, question_id, submission_id, words, signature))
+            conn.executemany('INSERT OR IGNORE INTO plagiarism_buckets VALUES (?, ?, ?, ?)',
+                             [(assignment_id, question_id, bucket, submission_id) for bucket in buckets])
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+def find_plagiarism_candidates(assignment_id: str, question_id: str, buckets: List[str],
+                               exclude: str = None, exclude_student: str = None) -> Dict[str, bytes]:
+    """{submission ID: signature} of submissions sharing at least one LSH bucket for a question,
+    leaving out submission exclude and every submission of student exclude_student"""
+    if not buckets:
+        return {}
+    marks = ', '.join('?' for _ in buckets)
+    own = ''
+    params = [assignment_id, question_id, assignment_id, question_id] + list(buckets)
+    if exclude_student is not None:
+        own = 'AND submission_id NOT IN (SELECT id FROM submissions WHERE student_id = ?)'
+        params.append(exclude_student)
+    rows = get_connection().execute(
+        'SELECT submission_id, signature FROM plagiarism_signatures WHERE assignment_id = ? AND question_id = ? '
+        'AND submission_id IN (SELECT submission_id FROM plagiarism_buckets WHERE assignment_id = ? '
+        f'AND question_id = ? AND bucket IN ({marks})) {own}',
+        params).fetchall()
+    return {sub_id: signature for sub_id, signature in rows if sub_id != exclude}
+
+def get_plagiarism_word_counts(assignment_id: str, submission_id: str) -> Dict[str, int]:
+    """{question ID: indexed word count} for one submission"""
+    rows = get_connection().execute(
+        'SELECT question_id, words FROM plagiarism_signatures WHERE assignment_id = ? AND submission_id = ?',
+        (assignment_id, submission_id)).fetchall()
+    return dict(rows)
+
+# ========== PROGRESS EVENTS (Server-Sent Grading Progress) ==========
+def append_event(channel: str, event: str, data: Dict, history: int) -> int:
+    """Append an event to a channel and return its ID. The first event after a
+    'done' drops the finished run, and only the last history events are kept."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM events WHERE channel = ? AND id <= '
+                     "(SELECT MAX(id) FROM events WHERE channel = ? AND event = 'done')", (channel, channel))
+        cursor = conn.execute('INSERT INTO events (channel, event, data, created_at) VALUES (?, ?, ?, ?)',
+                              (channel, event, json.dumps(data), datetime.now().timestamp()))
+        conn.execute('DELETE FROM events WHERE channel = ? AND id NOT IN '
+                     '(SELECT id FROM events WHERE channel = ? ORDER BY id DESC LIMIT ?)',
+                     (channel, channel, history))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return cursor.lastrowid
+
+def get_events(channel: str, after: int = 0) -> List[tuple]:
+    """[(event ID, event, data)] of a channel after the given event ID, oldest first"""
+    rows = get_connection().execute(
+        'SELECT id, event, data FROM events WHERE channel = ? AND id > ? ORDER BY id',
+        (channel, after)).fetchall()
+    return [(event_id, event, json.loads(data)) for event_id, event, data in rows]
+
+def get_last_event(channel: str) -> Optional[tuple]:
+    """(event ID, event) of the newest event on a channel, or None"""
+    return get_connection().execute(
+        'SELECT id, event FROM events WHERE channel = ? ORDER BY id DESC LIMIT 1', (channel,)).fetchone()
+
+def get_new_events(after: int) -> List[tuple]:
+    """[(event ID, channel, event, data)] of all channels after the given event ID, oldest first"""
+    rows = get_connection().execute(
+        'SELECT id, channel, event, data FROM events WHERE id > ? ORDER BY id', (after,)).fetchall()
+    return [(event_id, channel, event, json.loads(data)) for event_id, channel, event, data in rows]
+
+def get_last_event_id() -> int:
+    """ID of the newest event on any channel, 0 when there is none"""
+    return get_connection().execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+
+def prune_events(done_before: float, stale_before: float) -> None:
+    """Drop runs that finished before done_before and events older than stale_before (Unix times)"""
+    get_connection().execute(
+        'DELETE FROM events WHERE created_at < ? OR channel IN '
+        "(SELECT channel FROM events WHERE event = 'done' AND created_at < ?)", (stale_before, done_before))
+
+# ========== ANSWER GROUPS (Grade Near-Identical Answers Once) ==========
+def get_answer_groups(assignment_id: str, question_id: str, key_hash: str) -> List[Dict]:
+    """Groups graded for one question under one key slice, oldest first"""
+    rows = get_connection().execute(
+        'SELECT id, normalized, vector, result, members FROM answer_groups '
+        'WHERE assignment_id = ? AND question_id = ? AND key_hash = ? ORDER BY id',
+        (assignment_id, question_id, key_hash)).fetchall()
+    return [{"id": group_id, "normalized": normalized, "vector": json.loads(vector),
+             "result": json.loads(result), "members": members}
+            for group_id, normalized, vector, result, members in rows]
+
+def create_answer_group(assignment_id: str, question_id: str, key_hash: str, normalized: str,
+                        vector: Dict, result: Dict) -> int:
+    """Store a newly graded answer as the representative of its group; returns the group ID"""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor = conn.execute(
+            'INSERT INTO answer_groups (assignment_id, question_id, key_hash, normalized, vector, result, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (assignment_id, question_id, key_hash, normalized, json.dumps(vector), json.dumps(result),
+             datetime.now().isoformat()))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return cursor.lastrowid
+
+def add_answer_group_member(group_id: int) -> None:
+    """Count one more answer graded through an existing group"""
+    get_connection().execute('UPDATE answer_groups SET members = members + 1 WHERE id = ?', (group_id,))
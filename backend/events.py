@@ -0,0 +1,117 @@
+"""
+Grading progress events shared by all server processes
+_grade_submission publishes an event per pipeline step and per graded
+question on the submission's channel; /api/submissions/<id>/events relays
+them to the browser as server-sent events. The grading job and the stream
+are usually served by different gunicorn processes, so events are written
+to the SQLite events table. While a process has open streams, one poller
+thread reads the events added since its last read, every
+EVENTS_POLL_SECONDS or as soon as this process publishes, and hands them
+to the subscribers' in-memory queues. Open streams wait on their queue and
+never query the database themselves, so watching browsers add no storage
+load. Event IDs double as Last-Event-ID, so a page that connects mid-run,
+or reconnects, catches up from the table. A channel keeps only its current
+or last run, and a finished run is dropped EVENTS_LINGER_SECONDS after 'done'.
+"""
+import time
+import queue
+import threading
+import traceback
+from typing import Dict, List, Tuple
+
+from config import EVENTS_HISTORY, EVENTS_LINGER_SECONDS, EVENTS_POLL_SECONDS
+from database import (append_event, get_events, get_last_event, get_new_events, get_last_event_id,
+                      prune_events)
+
+PRUNE_INTERVAL = 60
+# Runs that never published 'done' (e.g. their process died) are dropped after this long
+STALE_SECONDS = 24 * 3600
+
+class EventHub:
+    def __init__(self, history: int = EVENTS_HISTORY, linger: float = EVENTS_LINGER_SECONDS,
+                 poll_interval: float = EVENTS_POLL_SECONDS):
+        self.history = history
+        self.linger = linger
+        self.poll_interval = poll_interval
+        self._subscribers = {}  # channel -> set of queues
+        self._last = {}         # channel -> newest event name, for channels with subscribers
+        self._cursor = 0        # newest event ID handed to subscribers
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._poller = None
+        self._pruned_at = 0.0
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            if now - self._pruned_at < PRUNE_INTERVAL:
+                return
+            self._pruned_at = now
+        prune_events(now - self.linger, now - STALE_SECONDS)
+
+    def publish(self, channel: str, event: str, data: Dict) -> int:
+        """Append an event to channel; 'done' ends the run. Returns the event ID."""
+        self._prune()
+        event_id = append_event(channel, event, data, self.history)
+        self._wake.set()
+        return event_id
+
+    def subscribe(self, channel: str, after: int = 0) -> Tuple["queue.Queue", List[Tuple], bool]:
+        """Register a subscriber and return (its queue, the channel's events after
+        the given ID, whether a run is in progress). The queue may repeat events
+        of the backlog; skip IDs already seen."""
+        subscriber = queue.Queue()
+        with self._lock:
+            if not self._subscribers:
+                # The poller skipped reads while nobody listened
+                self._cursor = get_last_event_id()
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+            last = get_last_event(channel)
+            self._last[channel] = last[1] if last else None
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name="event-poller", daemon=True)
+                self._poller.start()
+        return subscriber, get_events(channel, after), self.active(channel)
+
+    def unsubscribe(self, channel: str, subscriber: "queue.Queue"):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[channel]
+                self._last.pop(channel, None)
+
+    def active(self, channel: str) -> bool:
+        """Whether a run is in progress on a subscribed channel, as of the last poll"""
+        with self._lock:
+            last = self._last.get(channel)
+        return last is not None and last != 'done'
+
+    def poll(self):
+        """Hand events added since the last poll to the subscribers of their channels"""
+        with self._lock:
+            if not self._subscribers:
+                return
+            cursor = self._cursor
+        events = get_new_events(cursor)
+        with self._lock:
+            for event_id, channel, event, data in events:
+                self._cursor = max(self._cursor, event_id)
+                if channel not in self._subscribers:
+                    continue
+                self._last[channel] = event
+                for subscriber in self._subscribers[channel]:
+                    subscriber.put((event_id, event, data))
+
+    def _poll_loop(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception:
+                traceback.print_exc()
+
+hub = EventHub()
@@ -0,0 +1,210 @@
+"""
+Background grading queue
+Jobs are persisted through database.py, so queued and interrupted work
+is picked up again after a process restart. A bounded pool of worker
+threads runs the registered handler for each job kind. A handler that
+raises JobDeferred puts its job back in the queue after a delay instead
+of failing it (used while the model backend is unavailable); no process
+starts it again before its retryAt.
+
+Several processes (e.g. gunicorn workers) share the jobs table. A claimed
+job records its owner (host, pid and a per-boot ID) and a lease that the
+owner's heartbeat keeps extending while the handler runs. Every process
+periodically sweeps the table: a running job is only put back in the
+queue once its lease has expired (its owner process is gone or stuck),
+and queued jobs that are due are picked up, so none is stranded in the
+memory of a process that went away.
+"""
+import os
+import time
+import uuid
+import queue
+import socket
+import threading
+import traceback
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from config import GRADING_WORKERS, JOB_LEASE_SECONDS, JOB_HEARTBEAT_SECONDS, JOB_SWEEP_SECONDS
+from database import create_job, get_job_by_id, get_jobs_by_status, claim_job, update_job_if
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_GRADED = 'graded'
+JOB_FAILED = 'failed'
+
+# Identifies this process as the owner of the jobs it runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class JobDeferred(Exception):
+    """Raised by a handler to retry the job after delay seconds"""
+    def __init__(self, message, delay):
+        super().__init__(message)
+        self.delay = delay
+
+_handlers: Dict[str, Callable[[Dict], Optional[Dict]]] = {}
+_queue: "queue.Queue[str]" = queue.Queue()
+_queued = set()   # job IDs waiting in _queue
+_running = set()  # job IDs whose handler is running in this process
+_state_lock = threading.Lock()
+_workers = []
+_start_lock = threading.Lock()
+
+def register_handler(kind: str, handler: Callable[[Dict], Optional[Dict]]):
+    """Register the function that runs jobs of a given kind"""
+    _handlers[kind] = handler
+
+def enqueue_job(kind: str, payload: Dict, owner_id: str = None) -> Dict:
+    """Persist a new job and hand it to the worker pool"""
+    job = create_job({
+        "kind": kind,
+        "payload": payload,
+        "ownerId": owner_id,
+        "status": JOB_QUEUED,
+        "attempts": 0,
+        "error": None,
+        "result": None
+    })
+    start_workers()
+    _schedule(job['id'])
+    return job
+
+def _schedule(job_id: str):
+    with _state_lock:
+        if job_id in _queued:
+            return
+        _queued.add(job_id)
+    _queue.put(job_id)
+
+def _lease_until() -> str:
+    return datetime.fromtimestamp(time.time() + JOB_LEASE_SECONDS).isoformat()
+
+def _seconds_until(stamp: Optional[str]) -> float:
+    """Seconds until an ISO timestamp; 0 when it has passed or is missing"""
+    if not stamp:
+        return 0.0
+    try:
+        return max(0.0, (datetime.fromisoformat(stamp) - datetime.now()).total_seconds())
+    except ValueError:
+        return 0.0
+
+def start_workers(num_workers: int = GRADING_WORKERS):
+    """Start the worker pool and the lease keeper once per process"""
+    with _start_lock:
+        if _workers:
+            return
+        for i in range(max(1, num_workers)):
+            worker = threading.Thread(target=_worker_loop, name=f"grading-worker-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+        keeper = threading.Thread(target=_lease_loop, name="grading-leases", daemon=True)
+        keeper.start()
+        print(f"--- Started {len(_workers)} grading workers ({WORKER_ID}) ---")
+
+def sweep_jobs():
+    """Requeue running jobs whose owner's lease expired, and schedule queued jobs that are due"""
+    for job in get_jobs_by_status([JOB_RUNNING]):
+        if _seconds_until(job.get('leaseUntil')) > 0:
+            continue
+        # Conditional on the lease we saw, so a renewal or another sweeper wins
+        requeued = update_job_if(job['id'], {"status": JOB_QUEUED, "owner": None, "leaseUntil": None},
+                                 expect={"status": JOB_RUNNING, "owner": job.get('owner'),
+                                         "leaseUntil": job.get('leaseUntil')})
+        if requeued:
+            print(f"--- Job {job['id']} requeued: lease of {job.get('owner')} expired ---")
+    for job in get_jobs_by_status([JOB_QUEUED]):
+        if _seconds_until(job.get('retryAt')) == 0:
+            _schedule(job['id'])
+
+def _renew_leases():
+    with _state_lock:
+        running = list(_running)
+    for job_id in running:
+        if not update_job_if(job_id, {"leaseUntil": _lease_until()},
+                             expect={"status": JOB_RUNNING, "owner": WORKER_ID}):
+            print(f"--- Job {job_id}: lease lost while running ---")
+
+def _lease_loop():
+    last_sweep = None
+    while True:
+        try:
+            _renew_leases()
+            if last_sweep is None or time.monotonic() - last_sweep >= JOB_SWEEP_SECONDS:
+                last_sweep = time.monotonic()
+                sweep_jobs()
+        except Exception:
+            traceback.print_exc()
+        time.sleep(max(1, min(JOB_HEARTBEAT_SECONDS, JOB_SWEEP_SECONDS)))
+
+def _worker_loop():
+    while True:
+        job_id = _queue.get()
+        with _state_lock:
+            _queued.discard(job_id)
+        try:
+            _run_job(job_id)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            _queue.task_done()
+
+def _schedule_later(job_id: str, delay: float):
+    timer = threading.Timer(delay, _schedule, args=(job_id,))
+    timer.daemon = True
+    timer.start()
+
+def _finish(job_id: str, updates: Dict):
+    """Record a job's outcome, unless its lease was lost and the job handed to another process"""
+    if not update_job_if(job_id, {**updates, "leaseUntil": None}, expect={"status": JOB_RUNNING, "owner": WORKER_ID}):
+        print(f"--- Job {job_id}: outcome dropped, the job is no longer owned by this process ---")
+
+def _run_job(job_id: str):
+    job = get_job_by_id(job_id)
+    if not job or job.get('status') != JOB_QUEUED:
+        return
+    wait = _seconds_until(job.get('retryAt'))
+    if wait > 0:
+        _schedule_later(job_id, wait)  # deferred by another process; not due yet
+        return
+    job = claim_job(job_id, JOB_QUEUED, {
+        "status": JOB_RUNNING,
+        "attempts": job.get('attempts', 0) + 1,
+        "owner": WORKER_ID,
+        "leaseUntil": _lease_until(),
+        "retryAt": None,
+        "startedAt": datetime.now().isoformat()
+    })
+    if not job:
+        return  # already picked up by another worker
+
+    with _state_lock:
+        _running.add(job_id)
+    handler = _handlers.get(job['kind'])
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job kind '{job['kind']}'")
+        result = handler(job)
+        _finish(job_id, {
+            "status": JOB_GRADED,
+            "result": result,
+            "finishedAt": datetime.now().isoformat()
+        })
+    except JobDeferred as e:
+        print(f"--- Job {job_id} deferred for {e.delay:.0f}s: {e} ---")
+        _finish(job_id, {
+            "status": JOB_QUEUED,
+            "owner": None,
+            "error": str(e),
+            "retryAt": datetime.fromtimestamp(time.time() + e.delay).isoformat()
+        })
+        _schedule_later(job_id, e.delay)
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job_id, {
+            "status": JOB_FAILED,
+            "error": str(e),
+            "finishedAt": datetime.now().isoformat()
+        })
+    finally:
+        with _state_lock:
+            _running.discard(job_id)
@@ -1,45 +1,213 @@
+"""
+Batch grading from the command line
+Builds the exam structure and faculty key once, then grades every student
+PDF in parallel. Progress is checkpointed in <out>/manifest.json after each
+paper, so rerunning the same command resumes an interrupted run and only
+grades papers that are new, changed or failed.
+
+    python main.py question.pdf solution.pdf students/ --out results/ --workers 8
+    python main.py question.pdf solution.pdf "scans/*.pdf" --pool process
+"""
 import os
-from utils import save_json, load_json
-from steps.step1_structure import get_exam_structure
-from steps.step2_faculty import create_faculty_key
-from steps.step3_student import extract_student_answers
-from steps.step4_grading import grade_student_paper
+import csv
+import glob
+import json
+import argparse
+import hashlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
 
-def main():
-    # --- SIMULATING FRONTEND INPUTS ---
-    # In a real app, these paths would come from user uploads
-    question_pdf_path = "dbms-4-que.pdf"
-    faculty_pdf_path = "faculty_sol.pdf"
-    student_pdf_path = "dbms-sol-4.pdf"
+from utils import save_json, load_json, calculate_grade
+from ai_engine.pipeline import run_grading_pipeline
 
-    # Load Files as Bytes (Binary)
-    try:
-        with open(question_pdf_path, "rb") as f: q_bytes = f.read()
-        with open(faculty_pdf_path, "rb") as f: f_bytes = f.read()
-        with open(student_pdf_path, "rb") as f: s_bytes = f.read()
-    except FileNotFoundError as e:
-        print(f"❌ Error loading files: {e}")
-        return
+MANIFEST_FILE = "manifest.json"
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def find_student_pdfs(sources):
+    """Expand directories and glob patterns into a sorted list of PDF paths"""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = glob.glob(os.path.join(source, "**", "*.pdf"), recursive=True)
+        else:
+            matches = glob.glob(source, recursive=True) or ([source] if os.path.isfile(source) else [])
+        paths.extend(p for p in matches if p.lower().endswith(".pdf"))
+    return sorted(set(os.path.abspath(p) for p in paths))
+
+def student_names(paths):
+    """File stem per student; stems shared by several PDFs get a path hash so names stay stable between runs"""
+    stems = {path: os.path.splitext(os.path.basename(path))[0] for path in paths}
+    counts = {}
+    for stem in stems.values():
+        counts[stem] = counts.get(stem, 0) + 1
+    return {path: stem if counts[stem] == 1 else f"{stem}_{hashlib.sha1(path.encode()).hexdigest()[:8]}"
+            for path, stem in stems.items()}
+
+def write_manifest(out_dir, manifest):
+    """Atomic write, so an interrupted run never leaves a truncated checkpoint"""
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
 
-    # --- EXECUTE PIPELINE ---
+def build_key(question_pdf, solution_pdf, manifest, bypass_cache):
+    """Structure and faculty key, reused from the manifest when both PDFs are unchanged"""
+    q_hash, s_hash = sha256_file(question_pdf), sha256_file(solution_pdf)
+    if (manifest.get("questionSha256") == q_hash and manifest.get("solutionSha256") == s_hash
+            and manifest.get("structure") is not None and manifest.get("facultyKey") is not None):
+        print("--- Reusing structure and faculty key from manifest ---")
+        return manifest
 
-    # 1. Get Structure
-    structure = get_exam_structure(q_bytes)
-    save_json(structure, "output_1_structure.json")
+    with open(question_pdf, "rb") as f: q_bytes = f.read()
+    with open(solution_pdf, "rb") as f: s_bytes = f.read()
+    outputs = run_grading_pipeline(question_pdf=q_bytes, solution_pdf=s_bytes,
+                                   bypass_cache=bypass_cache, until="faculty_key")
+    # A new key invalidates every earlier grade
+    return {
+        "questionPdf": os.path.abspath(question_pdf),
+        "solutionPdf": os.path.abspath(solution_pdf),
+        "questionSha256": q_hash,
+        "solutionSha256": s_hash,
+        "structure": outputs["structure"],
+        "facultyKey": outputs["faculty_key"],
+        "students": {}
+    }
 
-    # 2. Create Key
-    faculty_key = create_faculty_key(structure, f_bytes)
-    save_json(faculty_key, "output_2_faculty_key.json")
+def grade_student(path, structure, faculty_key, bypass_cache=False):
+    """Steps 3 and 4 for one student PDF (runs in a worker thread or process)"""
+    with open(path, "rb") as f:
+        student_bytes = f.read()
+    outputs = run_grading_pipeline(student_pdf=student_bytes, structure=structure,
+                                   faculty_key=faculty_key, bypass_cache=bypass_cache)
+    grading_result = outputs["grading_result"]
+    total_marks = grading_result.get("total_score", 0)
+    max_marks = sum(q.get("max_marks", 0) for q in structure if isinstance(q, dict))
+    return {
+        "totalMarks": total_marks,
+        "maxMarks": max_marks,
+        "grade": calculate_grade(total_marks, max_marks),
+        "inputPath": outputs["input_paths"].get("student"),
+        "timings": outputs["timings"],
+        "studentAnswers": outputs["student_answers"],
+        "gradingResult": grading_result
+    }
 
-    # 3. Extract Student Answers
-    student_answers = extract_student_answers(structure, s_bytes)
-    save_json(student_answers, "output_3_student_extracted.json")
+def write_summary(out_dir, manifest, paths):
+    """summary.json and summary.csv for the students of this run"""
+    rows = []
+    for path in paths:
+        entry = manifest["students"].get(path, {"status": "pending"})
+        rows.append({
+            "student": entry.get("name", os.path.basename(path)),
+            "path": path,
+            "status": entry["status"],
+            "totalMarks": entry.get("totalMarks"),
+            "maxMarks": entry.get("maxMarks"),
+            "grade": entry.get("grade"),
+            "resultFile": entry.get("resultFile"),
+            "error": entry.get("error")
+        })
+    graded = [r for r in rows if r["status"] == "graded"]
+    summary = {
+        "generatedAt": datetime.now().isoformat(),
+        "questionPdf": manifest["questionPdf"],
+        "solutionPdf": manifest["solutionPdf"],
+        "students": len(rows),
+        "graded": len(graded),
+        "failed": len(rows) - len(graded),
+        "averageMarks": round(sum(r["totalMarks"] for r in graded) / len(graded), 2) if graded else None,
+        "results": rows
+    }
+    save_json(summary, os.path.join(out_dir, "summary.json"))
+    with open(os.path.join(out_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["student", "path", "status", "totalMarks", "maxMarks", "grade", "error"],
+                                extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return summary
 
-    # 4. Grade It
-    final_report = grade_student_paper(student_answers, faculty_key)
-    save_json(final_report, "output_4_FINAL_REPORT.json")
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("question_pdf")
+    parser.add_argument("solution_pdf")
+    parser.add_argument("students", nargs="+", help="student PDFs, directories or glob patterns")
+    parser.add_argument("--out", default="batch_results", help="output directory (holds the checkpoint)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread",
+                        help="threads suit model-bound grading; processes isolate local PDF parsing")
+    parser.add_argument("--fresh", action="store_true", help="ignore the checkpoint and regrade everything")
+    parser.add_argument("--bypass-cache", action="store_true", help="ask the model again instead of the response cache")
+    args = parser.parse_args()
+
+    for path in (args.question_pdf, args.solution_pdf):
+        if not os.path.isfile(path):
+            print(f"❌ Error loading files: {path} not found")
+            return 1
+    pdfs = find_student_pdfs(args.students)
+    if not pdfs:
+        print("❌ No student PDFs found")
+        return 1
+
+    os.makedirs(os.path.join(args.out, "results"), exist_ok=True)
+    manifest = {} if args.fresh else (load_json(os.path.join(args.out, MANIFEST_FILE))
+                                      if os.path.exists(os.path.join(args.out, MANIFEST_FILE)) else {})
+    manifest = build_key(args.question_pdf, args.solution_pdf, manifest, args.bypass_cache)
+    write_manifest(args.out, manifest)
+
+    names = student_names(pdfs)
+    hashes = {path: sha256_file(path) for path in pdfs}
+    todo = []
+    for path in pdfs:
+        entry = manifest["students"].get(path, {})
+        done = (entry.get("status") == "graded" and entry.get("sha256") == hashes[path]
+                and os.path.exists(os.path.join(args.out, entry.get("resultFile", ""))))
+        if not done:
+            todo.append(path)
+    print(f"--- {len(pdfs)} student PDFs, {len(pdfs) - len(todo)} already graded, {len(todo)} to grade ---")
+
+    if args.pool == "process":
+        # Fresh interpreters: a forked child would inherit the parent's open model client
+        executor = ProcessPoolExecutor(max_workers=max(1, args.workers),
+                                       mp_context=multiprocessing.get_context("spawn"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    try:
+        futures = {executor.submit(grade_student, path, manifest["structure"], manifest["facultyKey"],
+                                   args.bypass_cache): path for path in todo}
+        for done_count, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            name = names[path]
+            entry = {"name": name, "sha256": hashes[path], "finishedAt": datetime.now().isoformat()}
+            try:
+                result = future.result()
+                result_file = os.path.join("results", f"{name}.json")
+                save_json({"student": name, "path": path, **result}, os.path.join(args.out, result_file))
+                entry.update(status="graded", resultFile=result_file, totalMarks=result["totalMarks"],
+                             maxMarks=result["maxMarks"], grade=result["grade"])
+                print(f"[{done_count}/{len(todo)}] {name}: {result['totalMarks']}/{result['maxMarks']} ({result['grade']})")
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+                print(f"[{done_count}/{len(todo)}] {name}: ❌ {e}")
+            manifest["students"][path] = entry
+            write_manifest(args.out, manifest)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume from the checkpoint.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return 130
+    executor.shutdown()
 
-    print("\n✅ Grading Complete! Check output_4_FINAL_REPORT.json")
+    summary = write_summary(args.out, manifest, pdfs)
+    print(f"\n✅ Grading Complete! {summary['graded']} graded, {summary['failed']} failed. "
+          f"See {os.path.join(args.out, 'summary.json')}")
+    return 0 if summary["failed"] == 0 else 2
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,176 @@
+"""
+In-process metrics in the Prometheus text format
+Counters and histograms are kept per process and rendered by
+/api/metrics. Labels are passed as keyword arguments; keep their values
+bounded (step names, route rules, exception class names), never IDs.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STEP_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((n, labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple((n, labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((n, labels.get(n, '')) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        """{label values: (per-bucket counts, sum, count)} for reports that diff two points in time"""
+        with self._lock:
+            return {tuple(v for _, v in key): (list(series[:len(self.buckets)]), series[-2], series[-1])
+                    for key, series in self._series.items()}
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(key + (('le', _format_value(float(bound))),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(key + (('le', '+Inf'),))
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(float(series[-2]))}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+class Gauge:
+    """Value read from a callback at render time; the callback returns {labels tuple: value}"""
+    def __init__(self, name, help_text, labelnames, collect):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.collect()
+        except Exception:
+            return lines
+        for label_values, value in sorted(values.items()):
+            key = tuple(zip(self.labelnames, label_values))
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    'paper_checker_http_requests_total', 'HTTP requests by route, method and status',
+    ('route', 'method', 'status')))
+http_latency = registry.register(Histogram(
+    'paper_checker_http_request_duration_seconds', 'HTTP request latency by route',
+    ('route', 'method')))
+step_latency = registry.register(Histogram(
+    'paper_checker_step_duration_seconds', 'Grading pipeline step latency',
+    ('step',), buckets=STEP_BUCKETS))
+step_errors = registry.register(Counter(
+    'paper_checker_step_errors_total', 'Grading pipeline step failures by exception type',
+    ('step', 'error')))
+llm_latency = registry.register(Histogram(
+    'paper_checker_llm_request_duration_seconds', 'Model call latency by step',
+    ('step',), buckets=STEP_BUCKETS))
+llm_tokens = registry.register(Counter(
+    'paper_checker_llm_tokens_total', 'Model tokens by step and direction (input/output)',
+    ('step', 'direction')))
+llm_errors = registry.register(Counter(
+    'paper_checker_llm_errors_total', 'Failed model calls by step and exception type',
+    ('step', 'error')))
+llm_cache_lookups = registry.register(Counter(
+    'paper_checker_llm_cache_total', 'Response cache lookups by step and result (hit/miss/bypass)',
+    ('step', 'result')))
+
+def record_usage(step, usage):
+    """Count tokens from a response's usage_metadata (missing fields count as 0)"""
+    if usage is None:
+        return
+    input_tokens = getattr(usage, 'prompt_token_count', None) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', None) or 0
+    if input_tokens:
+        llm_tokens.inc(input_tokens, step=step, direction='input')
+    if output_tokens:
+        llm_tokens.inc(output_tokens, step=step, direction='output')
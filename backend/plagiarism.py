@@ -0,0 +1,138 @@
+"""
+Plagiarism detection with MinHash and LSH
+Each question's extracted answer text is reduced to a MinHash signature over
+word shingles (PLAGIARISM_PERMUTATIONS values). The signature is split into
+PLAGIARISM_BANDS bands and each band is hashed to a bucket key, persisted per
+(assignment, question) in SQLite. A new submission is only compared with the
+submissions sharing one of its buckets, so a check costs about the same in a
+class of 30 or 3000; the estimated Jaccard similarity of those candidates
+decides which ones are reported as matches.
+
+Answers shorter than PLAGIARISM_MIN_WORDS words are not indexed: short
+answers to the same question look alike without being copied. A student's
+own earlier submissions (resubmissions of the same paper) are never
+reported as matches.
+"""
+import re
+import array
+import random
+import hashlib
+
+from config import (PLAGIARISM_ENABLED, PLAGIARISM_PERMUTATIONS, PLAGIARISM_BANDS, PLAGIARISM_SHINGLE_WORDS,
+                    PLAGIARISM_MIN_WORDS, PLAGIARISM_THRESHOLD)
+from database import (index_plagiarism_signatures, find_plagiarism_candidates, get_plagiarism_word_counts,
+                      get_submission_by_id, update_submission_if)
+from metrics import registry, Counter
+from ai_engine.pregrade import answer_text
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 64) - 1
+# Fixed seed: signatures stored in the index must stay comparable across restarts
+_rng = random.Random(1729)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(PLAGIARISM_PERMUTATIONS)]
+_ROWS = max(1, PLAGIARISM_PERMUTATIONS // PLAGIARISM_BANDS)
+
+plagiarism_matches = registry.register(Counter(
+    'paper_checker_plagiarism_matches_total', 'Question answers found similar to an earlier submission'))
+
+def _shingles(words):
+    k = PLAGIARISM_SHINGLE_WORDS
+    if len(words) <= k:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def signature(words):
+    """MinHash signature of a list of words, as an array of 64-bit ints"""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little') % _PRIME
+              for s in _shingles(words)]
+    return array.array('Q', [min((a * h + b) % _PRIME for h in hashes) if hashes else _MAX_HASH
+                             for a, b in _PERMUTATIONS])
+
+def buckets(sig):
+    """One LSH bucket key per band; similar signatures share at least one with high probability"""
+    keys = []
+    for band in range(PLAGIARISM_PERMUTATIONS // _ROWS):
+        rows = sig[band * _ROWS:(band + 1) * _ROWS]
+        keys.append(f"{band}:{hashlib.blake2b(rows.tobytes(), digest_size=8).hexdigest()}")
+    return keys
+
+def similarity(sig, other):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    if len(sig) != len(other) or not sig:
+        return 0.0
+    return sum(1 for x, y in zip(sig, other) if x == y) / len(sig)
+
+def _decode(blob):
+    sig = array.array('Q')
+    sig.frombytes(blob)
+    return sig
+
+def percentage(matches, words):
+    """Share of the paper's indexed words, weighted by the best similarity of
+    each question's match: 0 when nothing matches, 100 when everything was copied"""
+    total = sum(words.values())
+    if not total:
+        return 0
+    copied = sum(count * max((m['similarity'] for m in matches.get(q) or []), default=0)
+                 for q, count in words.items())
+    return round(100 * copied / total, 1)
+
+def check_submission(assignment_id, submission_id, texts, student_id=None):
+    """Add a submission's answers to its assignment's index and look up
+    similar earlier answers from other students. texts maps question ID -> answer text.
+    Returns ({question ID: [{"submissionId", "similarity"}]}, {question ID: word count})."""
+    if not PLAGIARISM_ENABLED:
+        return {}, {}
+    entries, matches, words = {}, {}, {}
+    for question_id, text in texts.items():
+        tokens = _WORD.findall(text.lower())
+        if len(tokens) < PLAGIARISM_MIN_WORDS:
+            continue
+        sig = signature(tokens)
+        keys = buckets(sig)
+        entries[question_id] = (len(tokens), sig.tobytes(), keys)
+        words[question_id] = len(tokens)
+        found = []
+        for other_id, blob in find_plagiarism_candidates(assignment_id, question_id, keys, exclude=submission_id,
+                                                         exclude_student=student_id).items():
+            score = similarity(sig, _decode(blob))
+            if score >= PLAGIARISM_THRESHOLD:
+                found.append({"submissionId": other_id, "similarity": round(score, 3)})
+        if found:
+            plagiarism_matches.inc(len(found))
+            matches[question_id] = sorted(found, key=lambda m: (-m['similarity'], m['submissionId']))
+    index_plagiarism_signatures(assignment_id, submission_id, entries)
+    return matches, words
+
+def paper_texts(inputs, student_answers):
+    """{question ID: answer text} from step 4's question_inputs; the whole
+    paper under 'paper' when the answers cannot be split by question"""
+    if inputs:
+        return {q: answer_text(answer) for q, (answer, _) in inputs.items()}
+    return {"paper": answer_text(student_answers)}
+
+def link_matches(assignment_id, submission_id, matches, attempts=3):
+    """Record a new submission on the earlier submissions it matched, so both
+    sides of a match report it. aiResult is replaced only if nobody else
+    changed it meanwhile (a regrade in progress wins and recomputes its own)."""
+    linked = {}
+    for question_id, found in matches.items():
+        for match in found:
+            linked.setdefault(match['submissionId'], {})[question_id] = match['similarity']
+    for other_id, questions in linked.items():
+        for _ in range(attempts):
+            other = get_submission_by_id(other_id)
+            ai_result = (other or {}).get('aiResult')
+            if not ai_result:
+                break
+            other_matches = {q: list(found) for q, found in (ai_result.get('plagiarismMatches') or {}).items()}
+            for question_id, score in questions.items():
+                found = [m for m in other_matches.get(question_id, []) if m['submissionId'] != submission_id]
+                found.append({"submissionId": submission_id, "similarity": score})
+                other_matches[question_id] = sorted(found, key=lambda m: (-m['similarity'], m['submissionId']))
+            words = get_plagiarism_word_counts(assignment_id, other_id)
+            updated = {**ai_result, "plagiarismMatches": other_matches,
+                       "plagiarismPercentage": percentage(other_matches, words)}
+            if update_submission_if(other_id, {"aiResult": updated}, expect={"aiResult": ai_result}):
+                break
@@ -0,0 +1,95 @@
+"""
+Content-addressed upload storage
+Uploads are streamed to disk once while their SHA-256 is computed, then
+stored as uploads/blobs/<aa>/<sha256>.pdf. Identical PDFs share one blob;
+the database keeps a reference count per blob and the file is removed
+when the last record stops pointing at it. Several processes share the
+uploads folder, so the file is only removed inside a database write
+transaction that finds the count still at 0; a concurrent upload of the
+same content either adds its reference first and keeps the file, or finds
+it gone and puts its own copy in place. Records store the blob ID
+(the hex digest) in their questionPdf / solutionPdf / submissionPdf /
+answerPdf fields; older records still hold plain file names.
+"""
+import os
+import re
+import uuid
+import hashlib
+
+from database import add_blob_ref, release_blob_ref, delete_unused_blob
+
+BASE_DIR = os.path.dirname(__file__)
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(BASE_DIR, 'uploads'))
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')
+CHUNK_SIZE = 1024 * 1024
+
+os.makedirs(BLOB_FOLDER, exist_ok=True)
+
+_BLOB_ID = re.compile(r'^[0-9a-f]{64}$')
+
+def is_blob_id(ref):
+    """True for content-addressed blob IDs, False for legacy upload file names"""
+    return bool(ref) and bool(_BLOB_ID.match(ref))
+
+def file_path(ref):
+    """Path on disk for a blob ID or legacy file name; None for anything else"""
+    if is_blob_id(ref):
+        return os.path.join(BLOB_FOLDER, ref[:2], f"{ref}.pdf")
+    if not ref or os.path.basename(ref) != ref:
+        return None
+    return os.path.join(UPLOAD_FOLDER, ref)
+
+def store_upload(stream):
+    """Stream an upload to disk in one pass while hashing it; returns the blob ID"""
+    tmp_path = os.path.join(UPLOAD_FOLDER, f".upload_{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+
+        blob_id = digest.hexdigest()
+        path = file_path(blob_id)
+        # Once the reference is committed, no process deletes the blob's file
+        add_blob_ref(blob_id, size)
+        if os.path.exists(path):
+            os.remove(tmp_path)  # duplicate content, keep the existing blob
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return blob_id
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def release(ref):
+    """Drop a record's reference to a blob, deleting the file when unused"""
+    if not is_blob_id(ref):
+        return
+    if release_blob_ref(ref) == 0:
+        delete_unused_blob(ref, lambda: _remove(file_path(ref)))
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def content_id(ref):
+    """SHA-256 of a stored PDF: the blob ID itself, or hashed from disk for legacy files"""
+    if is_blob_id(ref):
+        return ref
+    digest = hashlib.sha256()
+    with open(file_path(ref), 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_bytes(ref):
+    """Read a stored PDF fully (for sending to the model)"""
+    with open(file_path(ref), 'rb') as f:
+        return f.read()
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh SQLite database for one test, with no legacy JSON files to import"""
+    monkeypatch.setattr(database, 'DB_FILE', str(tmp_path / 'test.db'))
+    for name in ('ASSIGNMENTS_FILE', 'SUBMISSIONS_FILE', 'PAPERS_FILE', 'JOBS_FILE', 'BATCHES_FILE', 'USERS_FILE'):
+        monkeypatch.setattr(database, name, str(tmp_path / 'missing.json'))
+    return database
+
+@pytest.fixture
+def api(db, tmp_path, monkeypatch):
+    """api(user_id, role): a Flask test client logged in as that user, over the temporary database"""
+    import app as app_module
+    import jobs
+    import storage
+    # Jobs stay queued: worker threads would outlive the temporary database
+    monkeypatch.setattr(app_module, 'start_workers', lambda: None)
+    monkeypatch.setattr(jobs, 'start_workers', lambda: None)
+    (tmp_path / 'uploads' / 'blobs').mkdir(parents=True)
+    monkeypatch.setattr(storage, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(storage, 'BLOB_FOLDER', str(tmp_path / 'uploads' / 'blobs'))
+
+    def login(user_id, role):
+        client = app_module.app.test_client()
+        with client.session_transaction() as session:
+            session.update({'username': user_id, 'user_id': user_id, 'role': role})
+        return client
+    return login
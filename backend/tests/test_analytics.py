@@ -0,0 +1,51 @@
+import analytics
+
+def _graded(total, grade='B', question_marks=(('Q1', 3, 5),)):
+    return {"status": "graded", "aiResult": {
+        "totalMarks": total, "maxMarks": 10, "grade": grade,
+        "detailedResults": [{"question_id": q, "marks_obtained": m, "max_marks": mm} for q, m, mm in question_marks]
+    }}
+
+def _version(db):
+    return db.get_table_versions(['analytics'])['analytics']
+
+def _comparable(aggregate):
+    return {k: v for k, v in aggregate.items() if k not in ('id', 'updatedAt')}
+
+def test_writes_that_leave_the_contribution_unchanged_skip_the_aggregate(db):
+    submission = db.create_submission({"assignmentId": "A1", "studentId": "s1", "status": "pending"})
+    version = _version(db)
+    db.update_submission(submission['id'], {"jobId": "job-1"})
+    db.update_submission(submission['id'], {"events": ["queued"]})
+    assert _version(db) == version
+
+    db.update_submission(submission['id'], {"status": "processing"})
+    assert _version(db) == version + 1
+    db.update_submission(submission['id'], _graded(7))
+    version = _version(db)
+    db.update_submission(submission['id'], {"jobId": None, "gradedBy": "worker-2"})
+    assert _version(db) == version
+
+def test_incremental_aggregate_matches_a_rebuild(db):
+    first = db.create_submission(dict(_graded(8, 'A'), assignmentId="A1", studentId="s1"))
+    second = db.create_submission({"assignmentId": "A1", "studentId": "s2", "status": "pending"})
+    db.update_submission(second['id'], _graded(4, 'C', (('Q1', 1, 5), ('Q2', 3, 5))))
+    db.update_submission(first['id'], _graded(6, 'B'))
+    db.create_submission({"assignmentId": "A2", "studentId": "s3", "status": "pending"})
+
+    incremental = db.get_assignment_analytics('A1')
+    assert incremental['graded'] == 2 and incremental['sumMarks'] == 10
+    assert incremental['grades'] == {"B": 1, "C": 1}
+    assert _comparable(incremental) == _comparable(db.rebuild_assignment_analytics('A1'))
+
+def test_moving_a_submission_updates_both_assignments(db):
+    submission = db.create_submission(dict(_graded(5), assignmentId="A1", studentId="s1"))
+    db.update_submission(submission['id'], {"assignmentId": "A2"})
+    assert db.get_assignment_analytics('A1')['graded'] == 0
+    assert db.get_assignment_analytics('A2')['graded'] == 1
+
+def test_removing_a_contribution_restores_the_empty_aggregate():
+    aggregate = analytics.empty('A1')
+    part = analytics.contribution(_graded(7))
+    analytics.apply(analytics.apply(aggregate, part, 1), part, -1)
+    assert _comparable(aggregate) == _comparable(analytics.empty('A1'))
@@ -0,0 +1,55 @@
+import pytest
+
+import answer_groups
+from answer_groups import AnswerGroups
+
+GRADED = {"question_id": "Q1", "marks_obtained": 5, "max_marks": 5, "feedback": "Correct."}
+
+PAIRS = [
+    ("TCP is a connection oriented protocol that guarantees delivery",
+     "UDP is a connection oriented protocol that guarantees delivery",
+     {"solution": "TCP is connection oriented", "keywords": ["TCP", "connection oriented"]}),
+    ("Newton's first law says a body stays at rest unless a force acts on it",
+     "Newton's third law says a body stays at rest unless a force acts on it",
+     {"solution": "Newton's first law: inertia", "keywords": ["inertia", "rest"]}),
+    ("The mitochondria is the powerhouse of the cell",
+     "The ribosome is the powerhouse of the cell",
+     {"solution": "Mitochondria produce ATP", "keywords": ["powerhouse", "ATP"]}),
+    ("Diffusion moves particles from high concentration to low",
+     "Diffusion moves particles from low concentration to high",
+     {"solution": "From high to low concentration", "keywords": ["concentration"]}),
+]
+
+def _answer(text):
+    return {"id": "Q1", "extracted_text": text}
+
+@pytest.fixture(params=[False, True], ids=['exact-only', 'near-matches'])
+def groups(request, db, monkeypatch):
+    monkeypatch.setattr(answer_groups, 'ANSWER_GROUP_NEAR_MATCHES', request.param)
+    return AnswerGroups('A1')
+
+@pytest.mark.parametrize('graded, other, key', PAIRS)
+def test_different_answers_are_not_grouped(groups, graded, other, key):
+    groups.record('Q1', _answer(graded), key, GRADED)
+    assert groups.lookup('Q1', _answer(other), key) is None
+
+def test_same_answer_after_normalization_is_grouped(groups):
+    key = PAIRS[0][2]
+    groups.record('Q1', _answer("TCP is connection-oriented."), key, GRADED)
+    assert groups.lookup('Q1', _answer("tcp is  Connection oriented"), key) == GRADED
+
+def test_near_match_needs_the_option(db, monkeypatch):
+    key = {"solution": "Photosynthesis makes glucose from light", "keywords": ["glucose", "light"]}
+    graded = "plants use light energy to make glucose from carbon dioxide and water in their leaves every day"
+    other = graded + " too"
+    groups = AnswerGroups('A1')
+    groups.record('Q1', _answer(graded), key, GRADED)
+    assert groups.lookup('Q1', _answer(other), key) is None
+    monkeypatch.setattr(answer_groups, 'ANSWER_GROUP_NEAR_MATCHES', True)
+    monkeypatch.setattr(answer_groups, 'ANSWER_GROUP_THRESHOLD', 0.9)
+    assert groups.lookup('Q1', _answer(other), key) == GRADED
+
+def test_bigram_vectors_keep_word_order():
+    forward = answer_groups.vectorize("from high concentration to low")
+    backward = answer_groups.vectorize("from low concentration to high")
+    assert answer_groups.cosine(forward, backward) < 0.5
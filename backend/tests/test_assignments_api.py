@@ -0,0 +1,39 @@
+import pytest
+
+PRIVATE = {'facultyKey', 'artifacts', 'artifactHistory', 'fileHandles', 'inputPaths'}
+
+@pytest.fixture
+def assignment(db):
+    return db.create_assignment({
+        "title": "Networks", "teacherId": "f1", "questionPdf": "q.pdf", "solutionPdf": "s.pdf",
+        "structure": [{"id": "Q1", "max_marks": 2}], "facultyKey": [{"id": "Q1", "solution": "TCP"}],
+        "artifacts": {"facultyKey": {"hash": "abc"}}, "artifactHistory": [], "fileHandles": {},
+        "inputPaths": {}
+    })
+
+@pytest.mark.parametrize('user_id, role', [('s1', 'student'), ('f2', 'faculty')])
+def test_the_answer_key_is_hidden_from_everyone_but_the_owner(api, assignment, user_id, role):
+    client = api(user_id, role)
+    single = client.get(f"/api/assignments/{assignment['id']}").json['assignment']
+    listed = client.get('/api/assignments').json['assignments'][0]
+    for record in (single, listed):
+        assert not PRIVATE & set(record) and record['structure'] == assignment['structure']
+
+def test_the_owner_sees_the_answer_key(api, assignment):
+    client = api('f1', 'faculty')
+    assert client.get(f"/api/assignments/{assignment['id']}").json['assignment']['facultyKey'] == \
+        assignment['facultyKey']
+    assert 'facultyKey' in client.get('/api/assignments').json['assignments'][0]
+
+def test_artifact_history_is_capped_and_left_out_of_lists(api, assignment, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'ARTIFACT_HISTORY_LIMIT', 3)
+    record = assignment
+    for version in range(1, 6):
+        record = {**record, "artifactsVersion": version, "artifactHistory": app_module._archive_artifacts(record)}
+    # Each entry records the version it replaced
+    assert [entry['artifactsVersion'] for entry in record['artifactHistory']] == [2, 3, 4]
+
+    client = api('f1', 'faculty')
+    assert 'artifactHistory' in client.get(f"/api/assignments/{assignment['id']}").json['assignment']
+    assert 'artifactHistory' not in client.get('/api/assignments').json['assignments'][0]
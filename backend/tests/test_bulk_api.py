@@ -0,0 +1,62 @@
+import io
+import hashlib
+import zipfile
+
+import pytest
+
+import app as app_module
+
+@pytest.fixture
+def assignment(db):
+    return db.create_assignment({"title": "Networks", "teacherId": "f1", "questionPdf": "q.pdf",
+                                 "solutionPdf": "s.pdf"})
+
+def _archive(corrupt=None, **members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    data = buffer.getvalue()
+    if corrupt:
+        # Flip a byte of the member's content so its CRC check fails on read
+        at = data.index(corrupt)
+        data = data[:at] + bytes([data[at] ^ 0xFF]) + data[at + 1:]
+    return io.BytesIO(data)
+
+def _post(client, assignment, archive, **files):
+    return client.post(f"/api/faculty/assignments/{assignment['id']}/bulk-grade",
+                       data={"archive": (archive, 'class.zip'), **files}, content_type='multipart/form-data')
+
+def test_an_unreadable_member_is_reported_and_the_rest_graded(api, assignment, db):
+    archive = _archive(corrupt=b'%PDF broken', **{"s1.pdf": b'%PDF good', "s2.pdf": b'%PDF broken',
+                                                  "notes.txt": b'hi'})
+    response = _post(api('f1', 'faculty'), assignment, archive)
+    assert response.status_code == 202
+    batch = response.json['batch']
+    assert batch['total'] == 1
+    assert {entry['file'] for entry in batch['skipped']} == {'s2.pdf', 'notes.txt'}
+
+def test_a_failure_after_storing_releases_the_pdfs(api, assignment, db, monkeypatch):
+    created = []
+
+    def create_submission(record):
+        if created:
+            raise RuntimeError("database is locked")
+        created.append(db.create_submission(record))
+        return created[-1]
+
+    monkeypatch.setattr(app_module, 'create_submission', create_submission)
+    response = _post(api('f1', 'faculty'), assignment, _archive(**{"s1.pdf": b'%PDF one', "s2.pdf": b'%PDF two'}))
+    assert response.status_code == 500
+    # The first PDF stays with its (now failed) submission, the second is released
+    assert db.get_submission_by_id(created[0]['id'])['status'] == 'failed'
+    refs = {data: (db.get_blob_by_id(hashlib.sha256(data).hexdigest()) or {}).get('refCount', 0)
+            for data in (b'%PDF one', b'%PDF two')}
+    assert sorted(refs.values()) == [0, 1]
+
+def test_a_bad_archive_stores_nothing(api, assignment, db, monkeypatch):
+    stored = []
+    monkeypatch.setattr(app_module, 'store_upload', lambda stream: stored.append(stream) or 'x')
+    response = _post(api('f1', 'faculty'), assignment, io.BytesIO(b'not a zip'),
+                     answer_pdfs=(io.BytesIO(b'%PDF one'), 's1.pdf'))
+    assert response.status_code == 400 and stored == []
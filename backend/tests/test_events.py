@@ -0,0 +1,64 @@
+import queue
+import threading
+
+import pytest
+
+import events
+from events import EventHub
+
+@pytest.fixture
+def reader(db):
+    """A hub whose poller thread never runs on its own; tests call poll()"""
+    hub = EventHub(poll_interval=3600)
+    hub._poller = threading.Thread()  # keeps subscribe() from starting one
+    return hub
+
+def _publish_elsewhere(*published):
+    """Publish from another hub and connection, as another worker process would"""
+    hub = EventHub()
+    thread = threading.Thread(target=lambda: [hub.publish('S1', event, data) for event, data in published])
+    thread.start()
+    thread.join()
+
+def _drain(subscriber):
+    drained = []
+    while True:
+        try:
+            drained.append(subscriber.get_nowait())
+        except queue.Empty:
+            return drained
+
+def test_events_published_by_another_process_reach_subscribers(reader):
+    _publish_elsewhere(('status', {"status": "running"}))
+    subscriber, backlog, active = reader.subscribe('S1')
+    assert [event for _, event, _ in backlog] == ['status'] and active
+    _publish_elsewhere(('question', {"question_id": "Q1"}), ('done', {"status": "graded"}))
+    reader.poll()
+    assert [event for _, event, _ in _drain(subscriber)] == ['question', 'done']
+    assert not reader.active('S1')
+
+def test_one_read_serves_every_open_stream(reader, monkeypatch):
+    reads = []
+    monkeypatch.setattr(events, 'get_new_events', lambda after: reads.append(after) or
+                        [(after + 1, 'S1', 'status', {"status": "running"})])
+    subscribers = [reader.subscribe('S1')[0] for _ in range(5)]
+    reader.poll()
+    assert len(reads) == 1 and all(len(_drain(s)) == 1 for s in subscribers)
+    for subscriber in subscribers:
+        reader.unsubscribe('S1', subscriber)
+    reader.poll()
+    assert len(reads) == 1  # nobody listening, no read
+
+def test_a_new_run_replaces_the_finished_one(db):
+    hub = EventHub()
+    hub.publish('S1', 'status', {"status": "running"})
+    hub.publish('S1', 'done', {"status": "graded"})
+    first = hub.publish('S1', 'status', {"status": "running"})
+    assert [event_id for event_id, _, _ in db.get_events('S1')] == [first]
+
+def test_history_is_capped_per_channel(db):
+    hub = EventHub(history=3)
+    for i in range(5):
+        hub.publish('S1', 'question', {"i": i})
+    hub.publish('S2', 'status', {"status": "running"})
+    assert [data['i'] for _, _, data in db.get_events('S1')] == [2, 3, 4]
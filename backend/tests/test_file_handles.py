@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ai_engine import files
+
+Q_BLOB, S_BLOB = 'a' * 64, 'b' * 64
+
+@pytest.fixture
+def build(db, tmp_path, monkeypatch):
+    """build(previous=None, force=None): _build_assignment_artifacts over scanned PDFs and the
+    local Files stand-in; returns (the stored fields, the handles each pipeline call was given)"""
+    import app as app_module
+    monkeypatch.setattr(files, 'GEMINI_FILES_BACKEND', 'local')
+    monkeypatch.setattr(files, 'local_files', files.LocalFilesEndpoint(str(tmp_path / 'files'), 48 * 3600))
+    monkeypatch.setattr(app_module, 'read_bytes', lambda ref: f"%PDF scan of {ref}".encode())
+    monkeypatch.setattr(app_module, 'extract_pages', lambda data: None)
+    calls = []
+
+    def pipeline(question_file=None, solution_file=None, **kwargs):
+        calls.append({"questionPdf": question_file, "solutionPdf": solution_file})
+        return {"structure": [{"id": "Q1", "max_marks": 5}], "faculty_key": [{"id": "Q1"}], "input_paths": {}}
+    monkeypatch.setattr(app_module, 'run_grading_pipeline', pipeline)
+
+    def run(previous=None, force=None):
+        fields = app_module._build_assignment_artifacts(Q_BLOB, S_BLOB, previous, force)
+        return dict(previous or {}, questionPdf=Q_BLOB, solutionPdf=S_BLOB, **fields), calls[-1]
+    return run
+
+def test_assignment_pdfs_are_uploaded_at_creation(build):
+    assignment, sent = build()
+    assert set(assignment['fileHandles']) == {'questionPdf', 'solutionPdf'}
+    assert sent == assignment['fileHandles']
+    assert assignment['fileHandles']['solutionPdf']['blobId'] == S_BLOB
+
+def test_handles_are_reused_until_they_near_expiry(build):
+    assignment, _ = build()
+    created = assignment['fileHandles']
+    assignment, sent = build(assignment, force='structure')
+    assert sent == created
+
+    expiring = datetime.now(timezone.utc) + timedelta(hours=1)  # inside the 6 hour refresh margin
+    assignment['fileHandles']['solutionPdf'] = dict(created['solutionPdf'], expiresAt=expiring.isoformat())
+    assignment, sent = build(assignment, force='facultyKey')
+    assert sent['solutionPdf']['name'] != created['solutionPdf']['name']
+    assert assignment['fileHandles'] == {"questionPdf": created['questionPdf'], "solutionPdf": sent['solutionPdf']}
+
+def test_expired_handles_of_unused_pdfs_are_dropped(build):
+    assignment, _ = build()
+    expired = datetime.now(timezone.utc) - timedelta(minutes=1)
+    assignment['fileHandles']['questionPdf']['expiresAt'] = expired.isoformat()
+    assignment, _ = build(assignment, force='facultyKey')
+    assert set(assignment['fileHandles']) == {'solutionPdf'}
@@ -0,0 +1,50 @@
+import time
+from datetime import datetime, timedelta
+
+import jobs
+
+def _stamp(seconds):
+    return (datetime.now() + timedelta(seconds=seconds)).isoformat()
+
+def _running_job(db, lease_until):
+    job = db.create_job({"kind": "grade", "payload": {}, "status": jobs.JOB_RUNNING,
+                         "owner": "other-host:1:abc", "leaseUntil": lease_until})
+    return job['id']
+
+def test_sweep_leaves_jobs_with_a_live_lease(db, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(jobs, '_schedule', scheduled.append)
+    job_id = _running_job(db, _stamp(60))
+    jobs.sweep_jobs()
+    assert db.get_job_by_id(job_id)['status'] == jobs.JOB_RUNNING
+    assert scheduled == []
+
+def test_sweep_requeues_jobs_with_an_expired_lease(db, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(jobs, '_schedule', scheduled.append)
+    job_id = _running_job(db, _stamp(-1))
+    jobs.sweep_jobs()
+    job = db.get_job_by_id(job_id)
+    assert job['status'] == jobs.JOB_QUEUED and job['owner'] is None
+    assert scheduled == [job_id]
+
+def test_deferred_job_is_not_claimed_before_retry_at(db, monkeypatch):
+    later = []
+    monkeypatch.setattr(jobs, '_schedule_later', lambda job_id, delay: later.append((job_id, delay)))
+    job = db.create_job({"kind": "grade", "payload": {}, "status": jobs.JOB_QUEUED, "retryAt": _stamp(30)})
+    jobs._run_job(job['id'])
+    assert db.get_job_by_id(job['id'])['status'] == jobs.JOB_QUEUED
+    assert later and later[0][0] == job['id'] and 25 < later[0][1] <= 30
+
+def test_outcome_is_dropped_once_the_lease_is_lost(db, monkeypatch):
+    job = db.create_job({"kind": "slow", "payload": {}, "status": jobs.JOB_QUEUED})
+
+    def handler(claimed):
+        # Another process requeued and claimed the job meanwhile
+        db.update_job(claimed['id'], {"owner": "other-host:1:abc"})
+        return {"ok": True}
+
+    monkeypatch.setitem(jobs._handlers, 'slow', handler)
+    jobs._run_job(job['id'])
+    stored = db.get_job_by_id(job['id'])
+    assert stored['status'] == jobs.JOB_RUNNING and stored['owner'] == "other-host:1:abc"
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from ai_engine.json_stream import JsonArrayItems
+from ai_engine.step3_student import ANSWER_KEYS, _answer_items
+
+ANSWERS = [
+    {"question_id": "Q1", "extracted_text": "Braces } and ] in \"quotes\", a \\ backslash"},
+    {"question_id": "Q2", "status": "unanswered"},
+    {"question_id": "Q3", "sub_parts": [{"part": "a", "extracted_text": "[1, 2]"}, {"part": "b", "lines": [["x"]]}]},
+]
+
+def _stream(text, size):
+    parser, items = JsonArrayItems(ANSWER_KEYS), []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return items
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000])
+@pytest.mark.parametrize('response', [
+    ANSWERS,
+    {"student_name": "Ada [B]", "answers": ANSWERS},
+    {"student_name": "Ada", "remarks": ["see Q1", {"question_id": "X"}], "student_answers": ANSWERS, "pages": [1]},
+])
+def test_every_chunking_yields_the_answers(response, size):
+    text = json.dumps(response, indent=1)
+    assert _stream(text, size) == ANSWERS == _answer_items(json.loads(text))
+
+def test_unicode_escapes_in_keys_are_decoded():
+    text = '{"not\\u005fanswers": [{"id": "X"}], "\\u0061nswers": [{"id": "Q1"}]}'
+    assert _stream(text, 1) == [{"id": "Q1"}]
+
+def test_a_wrapper_without_an_answer_key_streams_nothing():
+    response = {"student_name": "Ada", "questions": ANSWERS}
+    assert _stream(json.dumps(response), 5) == []
+    # The final parse still finds the wrapper's only list
+    assert _answer_items(response) == ANSWERS
@@ -0,0 +1,36 @@
+import pytest
+
+@pytest.fixture
+def client(api, db):
+    for i in range(5):
+        db.create_submission({"assignmentId": "A1", "studentId": "s1", "status": "graded",
+                              "aiResult": {"totalMarks": i, "grade": "B"}})
+    return api('s1', 'student')
+
+def test_pages_cover_the_list_once_in_order(client):
+    seen, cursor = [], None
+    while True:
+        body = client.get('/api/submissions', query_string={"limit": 2, **({"cursor": cursor} if cursor else {})}).json
+        seen += [s['aiResult']['totalMarks'] for s in body['submissions']]
+        cursor = body['nextCursor']
+        if cursor is None:
+            break
+    assert seen == [0, 1, 2, 3, 4]
+
+def test_fields_project_nested_keys(client):
+    first = client.get('/api/submissions?limit=1&fields=id,aiResult.grade').json['submissions'][0]
+    assert set(first) == {'id', 'aiResult'} and first['aiResult'] == {"grade": "B"}
+
+@pytest.mark.parametrize('query', ['cursor=not-a-cursor', 'cursor=c3ViX25vbmU', 'limit=abc', 'limit=0', 'limit=201'])
+def test_bad_paging_parameters_are_rejected(client, query):
+    response = client.get(f'/api/submissions?{query}')
+    assert response.status_code == 400 and not response.json['success']
+
+def test_an_unchanged_list_is_answered_with_304(client, db):
+    first = client.get('/api/submissions')
+    etag = first.headers['ETag']
+    assert client.get('/api/submissions', headers={'If-None-Match': etag}).status_code == 304
+    submission = first.json['submissions'][0]
+    db.update_submission(submission['id'], {"status": "pending"})
+    changed = client.get('/api/submissions', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
@@ -0,0 +1,54 @@
+import types
+
+import pytest
+
+from ai_engine import llm
+from ai_engine.llm import CircuitBreaker, LLMUnavailableError
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    monkeypatch.setattr(llm, 'breaker', breaker)
+    return breaker
+
+def _open(breaker, monkeypatch):
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock = [100.0]
+    monkeypatch.setattr(llm.time, 'monotonic', lambda: clock[0])
+    breaker._opened_at = clock[0]
+    return clock
+
+def test_rate_limit_timeout_does_not_use_up_the_probe(breaker, monkeypatch):
+    clock = _open(breaker, monkeypatch)
+    clock[0] += 1
+
+    def timeout(step, estimate):
+        raise LLMUnavailableError("Rate limiter wait exceeded", 1)
+
+    monkeypatch.setattr(llm, '_acquire', timeout)
+    with pytest.raises(LLMUnavailableError):
+        llm._admit('step', 10)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()  # the probe is still available
+
+def test_unresolved_probe_expires_after_cooldown(breaker, monkeypatch):
+    clock = _open(breaker, monkeypatch)
+    clock[0] += 1
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+def test_stream_closed_early_resolves_the_probe(breaker, monkeypatch):
+    clock = _open(breaker, monkeypatch)
+    clock[0] += 1
+    monkeypatch.setattr(llm, '_acquire', lambda step, estimate: None)
+    chunks = [types.SimpleNamespace(text='[{"id": 1}', usage_metadata=None),
+              types.SimpleNamespace(text=']', usage_metadata=None)]
+    models = types.SimpleNamespace(generate_content_stream=lambda **kwargs: iter(chunks))
+    monkeypatch.setattr(llm, 'client', types.SimpleNamespace(models=models))
+    stream = llm.generate_content_stream('step', 'prompt')
+    assert next(stream) == '[{"id": 1}'
+    stream.close()
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,23 @@
+from plagiarism import check_submission
+
+ANSWER = ("A primary key is a column or set of columns whose values uniquely identify "
+          "every row of a table and can never be null")
+
+def _submission(db, student_id):
+    return db.create_submission({"assignmentId": "A1", "studentId": student_id, "status": "pending"})['id']
+
+def test_resubmission_by_the_same_student_is_not_a_match(db):
+    first = _submission(db, 'student_1')
+    assert check_submission('A1', first, {"Q1": ANSWER}, student_id='student_1')[0] == {}
+    again = _submission(db, 'student_1')
+    matches, words = check_submission('A1', again, {"Q1": ANSWER}, student_id='student_1')
+    assert matches == {} and words == {"Q1": len(ANSWER.split())}
+
+def test_copy_by_another_student_is_a_match(db):
+    first = _submission(db, 'student_1')
+    check_submission('A1', first, {"Q1": ANSWER}, student_id='student_1')
+    check_submission('A1', _submission(db, 'student_1'), {"Q1": ANSWER}, student_id='student_1')
+    other = _submission(db, 'student_2')
+    matches, _ = check_submission('A1', other, {"Q1": ANSWER}, student_id='student_2')
+    assert {m['submissionId'] for m in matches["Q1"]} >= {first}
+    assert all(m['similarity'] == 1.0 for m in matches["Q1"])
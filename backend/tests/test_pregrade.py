@@ -0,0 +1,28 @@
+import pytest
+
+from ai_engine.pregrade import pregrade
+
+KEY = {"id": "Q1", "solution": "The powerhouse of the cell, produces ATP", "keywords": ["powerhouse", "ATP"],
+       "max_marks": 2}
+
+@pytest.mark.parametrize('answer', [
+    {"id": "Q1", "extracted_text": "B"},
+    {"id": "Q1", "extracted_text": "42"},
+    {"id": "Q1", "extracted_text": "Mitochondria"},
+    {"id": "Q1", "sub_parts": [{"part": "a", "extracted_text": "ATP"}]},
+    {"question": "Q1", "answer": "B"},
+])
+def test_short_answers_go_to_the_model(answer):
+    assert pregrade({"Q1": (answer, KEY)})[0] == {}
+
+@pytest.mark.parametrize('answer', [
+    {"id": "Q1", "status": "unanswered"},
+    {"id": "Q1", "status": "unanswered", "sub_parts": ["a", "b"]},
+    {"id": "Q1", "status": "unanswered", "extracted_text": "(left blank)"},
+    {"id": "Q1", "extracted_text": ""},
+    {"id": "Q1", "sub_parts": ["a", "b"]},
+    {"question": "Q1", "answer": ""},
+])
+def test_unanswered_questions_are_scored_locally(answer):
+    local, _ = pregrade({"Q1": (answer, KEY)})
+    assert local["Q1"]["marks_obtained"] == 0.0 and local["Q1"]["max_marks"] == 2
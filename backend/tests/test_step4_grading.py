@@ -0,0 +1,96 @@
+import re
+import json
+import types
+
+import pytest
+
+from ai_engine import step4_grading
+from ai_engine.cache import llm_cache
+from ai_engine.step3_student import AnswerFeed
+from ai_engine.step4_grading import grade_student_paper, question_inputs
+
+KEY = [{"question_id": "Q1", "solution": "TCP", "max_marks": 2},
+       {"question_id": "Q2", "solution": "Newton's first law", "max_marks": 3}]
+
+@pytest.fixture
+def model(monkeypatch):
+    """Fake model: full marks when the answer contains 'right'; records every call"""
+    calls = []
+
+    def generate_content(step, contents, config):
+        calls.append((step, contents))
+        if step == 'step4_question':
+            question_id = re.search(r"Question ID: (\S+)", contents).group(1)
+            answer = re.search(r"Student Answer: (.*)", contents).group(1)
+            marks = 5 if 'right' in answer else 0
+            return types.SimpleNamespace(text=json.dumps(
+                {"question_id": question_id, "marks_obtained": marks, "max_marks": 5, "feedback": answer}))
+        return types.SimpleNamespace(text=json.dumps(
+            {"student_name": "", "results": [], "total_score": 0, "remarks": "graded whole"}))
+
+    monkeypatch.setattr(step4_grading, 'generate_content', generate_content)
+    monkeypatch.setattr(llm_cache, 'enabled', False)
+    return calls
+
+def test_each_question_is_graded_with_its_own_answer_and_key_slice(model):
+    answers = [{"question_id": "Q1", "extracted_text": "right: TCP"},
+               {"question_id": "Q2", "extracted_text": "wrong"}]
+    report = grade_student_paper(answers, KEY, mode='per_question')
+    assert sorted(step for step, _ in model) == ['step4_question', 'step4_question']
+    q1 = next(prompt for _, prompt in model if 'Question ID: Q1' in prompt)
+    assert 'TCP' in q1 and "Newton" not in q1 and 'wrong' not in q1
+    # Marks are clamped to the key's max_marks and the total is computed locally
+    assert [(r['question_id'], r['marks_obtained']) for r in report['results']] == [('Q1', 2.0), ('Q2', 0.0)]
+    assert report['total_score'] == 2.0 and report['remarks'] == "Scored 2 out of 5."
+
+def test_a_failed_question_is_reported_without_losing_the_others(model, monkeypatch):
+    real = step4_grading.generate_content
+
+    def flaky(step, contents, config):
+        if 'Question ID: Q2' in contents:
+            return types.SimpleNamespace(text='not json')
+        return real(step, contents, config)
+
+    monkeypatch.setattr(step4_grading, 'generate_content', flaky)
+    monkeypatch.setattr(step4_grading, 'GRADING_QUESTION_RETRIES', 0)
+    answers = [{"question_id": "Q1", "extracted_text": "right"}, {"question_id": "Q2", "extracted_text": "right"}]
+    report = grade_student_paper(answers, KEY, mode='per_question')
+    assert report['failed_questions'] == ['Q2'] and report['total_score'] == 2.0
+    assert report['results'][1]['feedback'].startswith("Grading failed")
+
+def test_a_streamed_answer_that_changed_in_the_final_extraction_is_graded_again(model):
+    feed = AnswerFeed()
+    feed.put({"question_id": "Q1", "extracted_text": "wrong, partial"})
+    feed.put({"question_id": "Q2", "extracted_text": "right"})
+    final = [{"question_id": "Q1", "extracted_text": "right: TCP"}, {"question_id": "Q2", "extracted_text": "right"}]
+    feed.close(result=final)
+    seen = []
+    report = grade_student_paper(None, KEY, mode='per_question', on_question=seen.append, answer_feed=feed)
+    assert [(r['question_id'], r['marks_obtained']) for r in report['results']] == [('Q1', 2.0), ('Q2', 3.0)]
+    assert [r['marks_obtained'] for r in seen if r['question_id'] == 'Q1'][-1] == 2.0
+
+@pytest.mark.parametrize('extraction', [
+    {"Q1": "right: TCP", "Q2": "right"},
+    [[{"question_id": "Q1", "extracted_text": "right: TCP"}, {"question_id": "Q2", "extracted_text": "right"}]],
+    {"answers": [{"question": "Q1", "answer": "right: TCP"}, {"question": "Q2", "answer": "right"}]},
+])
+def test_other_extraction_shapes_are_split_by_question(extraction, model):
+    assert set(question_inputs(extraction, KEY)) == {'Q1', 'Q2'}
+    report = grade_student_paper(extraction, KEY, mode='per_question')
+    assert report['total_score'] == 5.0
+
+def test_an_extraction_missing_a_question_is_graded_whole(model):
+    report = grade_student_paper([{"question_id": "Q1", "extracted_text": "right"}], KEY, mode='per_question')
+    assert [step for step, _ in model] == ['step4_grading'] and report['remarks'] == "graded whole"
+
+@pytest.mark.parametrize('mode', ['per_question', 'whole'])
+def test_an_extraction_that_cannot_be_indexed_still_reaches_the_model(mode, model):
+    extraction = {"pages": [["Q1: TCP", "Q2: objects stay at rest"]], "student": {"name": "A"}}
+    report = grade_student_paper(extraction, KEY, mode=mode)
+    assert [step for step, _ in model] == ['step4_grading']
+    assert "objects stay at rest" in model[0][1] and report['remarks'] == "graded whole"
+
+def test_answer_statistics_are_passed_to_the_model(model):
+    key = [{"question_id": "Q1", "solution": "TCP", "keywords": ["TCP", "handshake"], "max_marks": 2}]
+    grade_student_paper([{"question_id": "Q1", "extracted_text": "TCP uses a handshake"}], key, mode='per_question')
+    assert "Answer Statistics: 4 words, 2 of 2 key keywords present" in model[0][1]
@@ -0,0 +1,37 @@
+import io
+import os
+import threading
+
+import pytest
+
+import storage
+
+@pytest.fixture
+def blobs(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(storage, 'BLOB_FOLDER', str(tmp_path / 'blobs'))
+    return storage
+
+def test_a_blob_is_removed_with_its_last_reference(blobs):
+    first = blobs.store_upload(io.BytesIO(b'%PDF same'))
+    assert blobs.store_upload(io.BytesIO(b'%PDF same')) == first
+    blobs.release(first)
+    assert blobs.read_bytes(first) == b'%PDF same'
+    blobs.release(first)
+    assert not os.path.exists(blobs.file_path(first))
+
+def test_a_reference_added_before_the_delete_keeps_the_file(blobs, db, monkeypatch):
+    blob_id = blobs.store_upload(io.BytesIO(b'%PDF racing'))
+    real = db.delete_unused_blob
+
+    def upload_meanwhile(ref, remove_file):
+        # Another process stores the same PDF after the count reached 0, before the delete
+        thread = threading.Thread(target=blobs.store_upload, args=(io.BytesIO(b'%PDF racing'),))
+        thread.start()
+        thread.join()
+        return real(ref, remove_file)
+
+    monkeypatch.setattr(blobs, 'delete_unused_blob', upload_meanwhile)
+    blobs.release(blob_id)
+    assert blobs.read_bytes(blob_id) == b'%PDF racing'
+    assert db.get_blob_by_id(blob_id)['refCount'] == 1
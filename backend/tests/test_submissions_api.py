@@ -0,0 +1,22 @@
+import pytest
+
+@pytest.fixture
+def submission(db):
+    return db.create_submission({
+        "assignmentId": "A1", "studentId": "s1", "status": "graded", "aiResult": {"totalMarks": 2},
+        "gradeHistory": [{"aiResult": {"totalMarks": 1}, "replacedAt": "2025-01-01T00:00:00"}]
+    })
+
+def test_grade_history_is_for_faculty_only(api, submission):
+    student = api('s1', 'student')
+    assert 'gradeHistory' not in student.get(f"/api/submissions/{submission['id']}").json['submission']
+    assert 'gradeHistory' not in student.get('/api/submissions').json['submissions'][0]
+    faculty = api('f1', 'faculty')
+    assert faculty.get(f"/api/submissions/{submission['id']}").json['submission']['gradeHistory']
+
+def test_students_can_poll_a_regrade_of_their_submission(api, submission):
+    import jobs
+    job = jobs.enqueue_job('submission', {"submissionId": submission['id']}, owner_id='f1')
+    assert api('s1', 'student').get(f"/api/jobs/{job['id']}").json['job']['id'] == job['id']
+    assert api('f1', 'faculty').get(f"/api/jobs/{job['id']}").status_code == 200
+    assert api('s2', 'student').get(f"/api/jobs/{job['id']}").status_code == 403
@@ -0,0 +1,77 @@
+"""
+In-memory user store
+Users are persisted in the database `users` table but served from a dict
+indexed by username. The dict is reloaded only when the table's change
+counter moves, so logins don't re-read every user. Password hashing and
+checking run on a small bounded pool so a login burst can't take every
+CPU away from other requests.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from config import AUTH_HASH_WORKERS, AUTH_HASH_MAX_PENDING
+from database import get_all_users, create_user, get_table_versions
+
+class AuthBusyError(Exception):
+    """Too many password hashes are already queued"""
+
+class UserStore:
+    def __init__(self):
+        self._users: Dict[str, Dict] = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        version = get_table_versions(['users'])['users']
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._users = {u['username']: u for u in get_all_users()}
+                self._version = version
+
+    def get(self, username: str) -> Optional[Dict]:
+        """Get a user by username"""
+        self._refresh()
+        return self._users.get(username)
+
+    def exists(self, username: str) -> bool:
+        """Check whether a username is taken"""
+        return self.get(username) is not None
+
+    def add(self, user: Dict) -> Optional[Dict]:
+        """Insert one user; returns None if the username is already taken"""
+        self._refresh()
+        created = create_user(user)
+        if created:
+            version = get_table_versions(['users'])['users']
+            with self._lock:
+                self._users[created['username']] = created
+                # Skip the next reload when our insert was the only change
+                if self._version is not None and version == self._version + 1:
+                    self._version = version
+        return created
+
+user_store = UserStore()
+
+_hash_pool = ThreadPoolExecutor(max_workers=max(1, AUTH_HASH_WORKERS), thread_name_prefix="auth-hash")
+_hash_slots = threading.BoundedSemaphore(max(1, AUTH_HASH_MAX_PENDING))
+
+def _run_on_hash_pool(func, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise AuthBusyError("Server is busy, please try again")
+    try:
+        return _hash_pool.submit(func, *args).result()
+    finally:
+        _hash_slots.release()
+
+def hash_password(password: str) -> str:
+    """Hash a password on the bounded pool"""
+    return _run_on_hash_pool(generate_password_hash, password)
+
+def verify_password(password_hash: str, password: str) -> bool:
+    """Check a password on the bounded pool"""
+    return _run_on_hash_pool(check_password_hash, password_hash, password)
@@ -13,4 +13,20 @@ def load_json(filename):
             return json.load(f)
     except FileNotFoundError:
         print(f"❌ Error: {filename} not found.")
-        return None
\ No newline at end of file
+        return None
+
+def calculate_grade(total_marks, max_marks):
+    """Letter grade for a score (A >= 90%, B >= 80%, C >= 70%, D >= 60%)"""
+    if max_marks == 0:
+        return 'F'
+    percentage = (total_marks / max_marks) * 100
+    if percentage >= 90:
+        return 'A'
+    elif percentage >= 80:
+        return 'B'
+    elif percentage >= 70:
+        return 'C'
+    elif percentage >= 60:
+        return 'D'
+    else:
+        return 'F'
@@ -132,9 +132,14 @@ class DataStore {
 
     // ========== ASSIGNMENTS ==========
 
-    async getAssignments() {
+    /**
+     * fields: optional comma-separated projection (e.g. 'id,title,deadline').
+     * List responses carry an ETag, so the browser revalidates and gets a 304
+     * when nothing changed.
+     */
+    async getAssignments(fields = null) {
         try {
-            const response = await fetch(`${API_BASE_URL}/assignments`, {
+            const response = await fetch(`${API_BASE_URL}/assignments${this.listQuery(fields)}`, {
                 method: 'GET',
                 credentials: 'include'
             });
@@ -168,6 +173,24 @@ class DataStore {
         }
     }
 
+    async getAssignmentAnalytics(id) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/assignments/${id}/analytics`, {
+                method: 'GET',
+                credentials: 'include'
+            });
+
+            const data = await response.json();
+            if (data.success) {
+                return data.analytics;
+            }
+            return null;
+        } catch (error) {
+            console.error('Get assignment analytics error:', error);
+            return null;
+        }
+    }
+
     async createAssignment(title, subject, description, deadline, qFile, sFile) {
         const formData = new FormData();
         formData.append('title', title);
@@ -197,11 +220,36 @@ class DataStore {
         }
     }
 
+    async rebuildAssignmentArtifacts(assignmentId, qFile = null, sFile = null) {
+        const formData = new FormData();
+        if (qFile) formData.append('question_pdf', qFile);
+        if (sFile) formData.append('faculty_solution_pdf', sFile);
+
+        try {
+            const response = await fetch(`${API_BASE_URL}/faculty/assignments/${assignmentId}/rebuild-artifacts`, {
+                method: 'POST',
+                credentials: 'include',
+                body: formData
+            });
+
+            const data = await response.json();
+
+            if (data.success) {
+                return { success: true, assignment: data.assignment };
+            } else {
+                return { success: false, error: data.error || 'Failed to rebuild assignment' };
+            }
+        } catch (error) {
+            console.error('Rebuild assignment error:', error);
+            return { success: false, error: 'Network error. Please check if backend is running.' };
+        }
+    }
+
     // ========== SUBMISSIONS ==========
 
-    async getSubmissions() {
+    async getSubmissions(fields = null) {
         try {
-            const response = await fetch(`${API_BASE_URL}/submissions`, {
+            const response = await fetch(`${API_BASE_URL}/submissions${this.listQuery(fields)}`, {
                 method: 'GET',
                 credentials: 'include'
             });
@@ -251,7 +299,7 @@ class DataStore {
             const data = await response.json();
 
             if (data.success) {
-                return { success: true, result: data.result };
+                return { success: true, result: data.result, job: data.job };
             } else {
                 return { success: false, error: data.error || 'Submission failed' };
             }
@@ -261,14 +309,14 @@ class DataStore {
         }
     }
 
-    async getStudentSubmissions(studentId) {
-        const submissions = await this.getSubmissions();
+    async getStudentSubmissions(studentId, fields = null) {
+        const submissions = await this.getSubmissions(fields);
         return submissions.filter(s => s.studentId === studentId);
     }
 
-    async getAssignmentSubmissions(assignmentId) {
+    async getAssignmentSubmissions(assignmentId, fields = null) {
         try {
-            const response = await fetch(`${API_BASE_URL}/assignments/${assignmentId}/submissions`, {
+            const response = await fetch(`${API_BASE_URL}/assignments/${assignmentId}/submissions${this.listQuery(fields)}`, {
                 method: 'GET',
                 credentials: 'include'
             });
@@ -301,7 +349,7 @@ class DataStore {
             const data = await response.json();
 
             if (data.success) {
-                return { success: true, paper: data.paper };
+                return { success: true, paper: data.paper, job: data.job };
             } else {
                 return { success: false, error: data.error || 'Paper check failed' };
             }
@@ -347,8 +395,138 @@ class DataStore {
         }
     }
 
+    // ========== BULK GRADING (Teachers Only) ==========
+
+    async bulkGrade(assignmentId, archiveFile = null, pdfFiles = []) {
+        const formData = new FormData();
+        if (archiveFile) formData.append('archive', archiveFile);
+        pdfFiles.forEach(file => formData.append('answer_pdfs', file));
+
+        try {
+            const response = await fetch(`${API_BASE_URL}/faculty/assignments/${assignmentId}/bulk-grade`, {
+                method: 'POST',
+                credentials: 'include',
+                body: formData
+            });
+
+            const data = await response.json();
+
+            if (data.success) {
+                return { success: true, batch: data.batch, job: data.job };
+            } else {
+                return { success: false, error: data.error || 'Bulk upload failed' };
+            }
+        } catch (error) {
+            console.error('Bulk grade error:', error);
+            return { success: false, error: 'Network error. Please check if backend is running.' };
+        }
+    }
+
+    async getBatch(batchId) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/faculty/batches/${batchId}`, {
+                method: 'GET',
+                credentials: 'include'
+            });
+
+            const data = await response.json();
+            if (data.success) {
+                return data.batch;
+            }
+            return null;
+        } catch (error) {
+            console.error('Get batch error:', error);
+            return null;
+        }
+    }
+
+    getBatchResultsUrl(batchId, format = 'csv') {
+        return `${API_BASE_URL}/faculty/batches/${batchId}/results?format=${format}`;
+    }
+
+    // ========== GRADING JOBS ==========
+
+    async getJob(jobId) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`, {
+                method: 'GET',
+                credentials: 'include'
+            });
+
+            const data = await response.json();
+            if (data.success) {
+                return data.job;
+            }
+            return null;
+        } catch (error) {
+            console.error('Get job error:', error);
+            return null;
+        }
+    }
+
+    /**
+     * Poll a grading job until it is graded or failed.
+     * onUpdate is called with every job snapshot so pages can show progress.
+     */
+    async waitForJob(jobId, onUpdate = null, intervalMs = 3000) {
+        while (true) {
+            const job = await this.getJob(jobId);
+            if (onUpdate) onUpdate(job);
+            if (!job || job.status === 'graded' || job.status === 'failed') {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+    }
+
+    /**
+     * Follow a submission's grading over server-sent events.
+     * handlers.status / handlers.step / handlers.question are called as events
+     * arrive; resolves with the final {status, aiResult, error}. Falls back to
+     * polling the job when the stream cannot be opened.
+     */
+    streamSubmission(submission, handlers = {}) {
+        const poll = async () => {
+            if (submission.jobId) {
+                await this.waitForJob(submission.jobId, job => {
+                    if (job && handlers.status) handlers.status({ status: job.status });
+                });
+            }
+            const latest = await this.getSubmissionById(submission.id) || submission;
+            return { status: latest.status, aiResult: latest.aiResult, error: latest.error };
+        };
+        if (!window.EventSource) return poll();
+
+        return new Promise(resolve => {
+            const source = new EventSource(`${API_BASE_URL}/submissions/${submission.id}/events`,
+                { withCredentials: true });
+            let opened = false;
+            source.onopen = () => { opened = true; };
+            ['status', 'step', 'question'].forEach(name => {
+                source.addEventListener(name, event => {
+                    if (handlers[name]) handlers[name](JSON.parse(event.data));
+                });
+            });
+            source.addEventListener('done', event => {
+                source.close();
+                resolve(JSON.parse(event.data));
+            });
+            source.onerror = () => {
+                // Once open, EventSource reconnects by itself and resumes from Last-Event-ID
+                if (!opened) {
+                    source.close();
+                    poll().then(resolve);
+                }
+            };
+        });
+    }
+
     // ========== FILE URL HELPERS ==========
 
+    listQuery(fields) {
+        return fields ? `?fields=${encodeURIComponent(fields)}` : '';
+    }
+
     getFileUrl(filename) {
         return `${API_BASE_URL}/files/${filename}`;
     }
@@ -42,8 +42,8 @@ document.addEventListener('DOMContentLoaded', async () => {
 });
 
 async function renderDashboard() {
-    const assignments = await db.getAssignments();
-    const submissions = await db.getSubmissions();
+    const assignments = await db.getAssignments('id,title,description,deadline,questions');
+    const submissions = await db.getSubmissions('id,assignmentId');
 
     // Update Stats
     const totalAssignmentsEl = document.getElementById('totalAssignments');
@@ -102,6 +102,81 @@ async function renderDashboard() {
             modal.style.display = 'none';
         }
     }
+
+    setupSubmissionActions();
+}
+
+function setupSubmissionActions() {
+    const modal = document.getElementById('submissionsModal');
+    const status = document.getElementById('modalStatus');
+    const bulkBtn = document.getElementById('bulkGradeBtn');
+    const bulkInput = document.getElementById('bulkGradeFiles');
+    const replaceBtn = document.getElementById('replaceSolutionBtn');
+    const replaceInput = document.getElementById('replaceSolutionFile');
+
+    if (!modal || !status || !bulkBtn || !bulkInput || !replaceBtn || !replaceInput) return;
+
+    bulkBtn.onclick = () => bulkInput.click();
+    replaceBtn.onclick = () => replaceInput.click();
+
+    bulkInput.onchange = async () => {
+        const files = Array.from(bulkInput.files);
+        bulkInput.value = '';
+        if (files.length === 0) return;
+
+        const { assignmentId, title } = modal.dataset;
+        const archive = files.find(f => f.name.toLowerCase().endsWith('.zip')) || null;
+        const pdfs = files.filter(f => f !== archive);
+
+        bulkBtn.disabled = true;
+        status.textContent = 'Uploading...';
+        const result = await db.bulkGrade(assignmentId, archive, pdfs);
+        bulkBtn.disabled = false;
+
+        if (!result.success) {
+            status.textContent = 'Bulk upload failed: ' + result.error;
+            return;
+        }
+        await viewSubmissions(assignmentId, title);
+        trackBatch(result.batch, assignmentId, title);
+    };
+
+    replaceInput.onchange = async () => {
+        const file = replaceInput.files[0];
+        replaceInput.value = '';
+        if (!file) return;
+
+        replaceBtn.disabled = true;
+        status.textContent = 'Rebuilding the answer key from the new solution...';
+        const result = await db.rebuildAssignmentArtifacts(modal.dataset.assignmentId, null, file);
+        replaceBtn.disabled = false;
+
+        status.textContent = result.success
+            ? 'Answer key rebuilt. New submissions are graded against it.'
+            : 'Error replacing solution: ' + result.error;
+    };
+}
+
+async function trackBatch(batch, assignmentId, title) {
+    const modal = document.getElementById('submissionsModal');
+    const status = document.getElementById('modalStatus');
+    const skipped = batch.skipped && batch.skipped.length
+        ? ` • Skipped: ${batch.skipped.map(s => `${s.file} (${s.reason})`).join(', ')}`
+        : '';
+
+    while (modal.dataset.assignmentId === assignmentId && modal.style.display !== 'none') {
+        const done = batch.status === 'completed' || batch.status === 'failed';
+        status.innerHTML = `
+            Bulk grading ${batch.status}: ${batch.graded || 0}/${batch.total} graded, ${batch.failed || 0} failed${skipped}
+            • <a href="${db.getBatchResultsUrl(batch.id)}" target="_blank">Download results (CSV)</a>
+        `;
+        if (done) {
+            await viewSubmissions(assignmentId, title);
+            return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 3000));
+        batch = await db.getBatch(batch.id) || batch;
+    }
 }
 
 window.viewSubmissions = async function (assignmentId, title) {
@@ -111,7 +186,20 @@ window.viewSubmissions = async function (assignmentId, title) {
     
     if (!modal || !titleEl || !content) return;
 
-    const submissions = await db.getAssignmentSubmissions(assignmentId);
+    if (modal.dataset.assignmentId !== assignmentId) {
+        const status = document.getElementById('modalStatus');
+        if (status) status.textContent = '';
+    }
+    modal.dataset.assignmentId = assignmentId;
+    modal.dataset.title = title;
+
+    const [submissions, analytics] = await Promise.all([
+        db.getAssignmentSubmissions(
+            assignmentId,
+            'id,studentId,submittedAt,submissionPdf,aiResult.totalMarks,aiResult.maxMarks,aiResult.grade'
+        ),
+        db.getAssignmentAnalytics(assignmentId)
+    ]);
 
     titleEl.textContent = `Submissions: ${title}`;
     modal.style.display = 'flex';
@@ -121,7 +209,20 @@ window.viewSubmissions = async function (assignmentId, title) {
         return;
     }
 
-    let html = `
+    let html = '';
+    if (analytics && analytics.graded > 0) {
+        const grades = Object.entries(analytics.grades).sort().map(([g, n]) => `${g}: ${n}`).join(', ');
+        const hardest = analytics.questions.filter(q => q.difficulty !== null)
+            .sort((a, b) => a.difficulty - b.difficulty)[0];
+        html += `
+            <p class="text-muted" style="margin-bottom: 1rem;">
+                ${analytics.graded} graded • Mean ${analytics.mean} • Median ${analytics.median} • ${grades}
+                ${hardest ? ` • Hardest: ${hardest.questionId} (${Math.round(hardest.difficulty * 100)}%)` : ''}
+            </p>
+        `;
+    }
+
+    html += `
         <table class="table">
             <thead>
                 <tr>
@@ -284,7 +385,7 @@ function setupPaperCheck() {
         }
 
         if (result.success) {
-            alert('Paper checked successfully!');
+            alert('Paper uploaded! Grading will continue in the background.');
             // Redirect to paper result page or show result
             window.location.href = `paper-result.html?id=${result.paper.id}`;
         } else {
@@ -136,7 +136,7 @@ async function renderSidebarTree(container, user, subjectFilter = null) {
 
 async function buildFacultyTree(user, subjectFilter = null) {
     const container = document.createElement('div');
-    let assignments = await db.getAssignments();
+    let assignments = await db.getAssignments('id,title,subject');
 
     if (subjectFilter) {
         assignments = assignments.filter(asg => asg.subject === subjectFilter);
@@ -198,8 +198,8 @@ async function buildFacultyTree(user, subjectFilter = null) {
 
 async function buildStudentTree(user, subjectFilter = null) {
     const container = document.createElement('div');
-    const assignments = await db.getAssignments();
-    const submissions = await db.getStudentSubmissions(user.id);
+    const assignments = await db.getAssignments('id,title,subject');
+    const submissions = await db.getStudentSubmissions(user.id, 'id,assignmentId,studentId');
 
     // Identify Pending vs Completed
     const pending = [];
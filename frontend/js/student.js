@@ -39,8 +39,8 @@ document.addEventListener('DOMContentLoaded', async () => {
  * Shows pending and completed counts, and recent pending assignments.
  */
 async function renderStudentDashboard(studentId) {
-    const allAssignments = await db.getAssignments();
-    const mySubmissions = await db.getStudentSubmissions(studentId);
+    const allAssignments = await db.getAssignments('id,title,description,deadline,questions');
+    const mySubmissions = await db.getStudentSubmissions(studentId, 'id,assignmentId,studentId');
 
     const submittedIds = new Set(mySubmissions.map(s => s.assignmentId));
     const pending = allAssignments.filter(a => !submittedIds.has(a.id));
@@ -84,8 +84,8 @@ async function renderAllAssignments(studentId) {
     const listContainer = document.getElementById('viewAssignmentsList');
     if (!listContainer) return;
 
-    const allAssignments = await db.getAssignments();
-    const mySubmissions = await db.getStudentSubmissions(studentId);
+    const allAssignments = await db.getAssignments('id,title,description,deadline,questions');
+    const mySubmissions = await db.getStudentSubmissions(studentId, 'id,assignmentId,studentId');
     const submittedIds = new Set(mySubmissions.map(s => s.assignmentId));
 
     if (allAssignments.length === 0) {
@@ -208,7 +208,7 @@ async function setupSubmissionForm(studentId) {
             }
 
             if (result.success) {
-                alert('Assignment submitted successfully!');
+                alert('Assignment submitted! Grading will continue in the background.');
                 // Refresh sidebar before redirect
                 if (window.refreshSidebar) {
                     await window.refreshSidebar();
@@ -234,7 +234,7 @@ async function renderAiResult() {
         return;
     }
 
-    const submission = await db.getSubmissionById(submissionId);
+    let submission = await db.getSubmissionById(submissionId);
     if (!submission) {
         const container = document.getElementById('aiResultContainer');
         if (container) container.innerHTML = '<p>Result not found.</p>';
@@ -247,6 +247,43 @@ async function renderAiResult() {
         asgTitleEl.textContent = assignment.title;
     }
 
+    // Follow background grading as it happens
+    const jobStatusEl = document.getElementById('jobStatus');
+    if (submission.status === 'pending') {
+        const statusText = {
+            queued: 'Waiting in the grading queue...',
+            running: 'AI is grading your paper...'
+        };
+        const stepText = {
+            structure: 'Reading the question paper...',
+            faculty_key: 'Preparing the answer key...',
+            student_answers: 'Reading your answers...',
+            grading_result: 'Grading your answers...'
+        };
+        const graded = {};
+        const done = await db.streamSubmission(submission, {
+            status: event => {
+                if (jobStatusEl) jobStatusEl.textContent = statusText[event.status] || '';
+            },
+            step: event => {
+                if (jobStatusEl && event.state === 'started') jobStatusEl.textContent = stepText[event.step] || '';
+            },
+            question: result => {
+                graded[result.question_id] = result;
+                renderQuestionResults(Object.values(graded));
+                const scoreEl = document.getElementById('scoreDisplay');
+                const total = Object.values(graded).reduce((sum, r) => sum + (r.marks_obtained || 0), 0);
+                if (scoreEl) scoreEl.textContent = `${total} so far`;
+            }
+        });
+        submission = { ...submission, status: done.status, aiResult: done.aiResult || submission.aiResult, error: done.error };
+    }
+    if (jobStatusEl) {
+        jobStatusEl.textContent = submission.status === 'failed'
+            ? (submission.error || 'Grading failed. Please contact your instructor.')
+            : '';
+    }
+
     // Display Result Data
     const result = submission.aiResult || {};
     const scoreDisplayEl = document.getElementById('scoreDisplay');
@@ -261,6 +298,7 @@ async function renderAiResult() {
     if (gradeDisplayEl) gradeDisplayEl.textContent = result.grade || '-';
     if (plagiarismDisplayEl) plagiarismDisplayEl.textContent = `${result.plagiarismPercentage || 0}%`;
     if (feedbackDisplayEl) feedbackDisplayEl.textContent = result.feedback || 'No feedback available.';
+    renderQuestionResults(result.detailedResults || []);
 
     // Color code grade
     const circle = document.querySelector('.grade-circle');
@@ -272,3 +310,29 @@ async function renderAiResult() {
         else circle.style.background = 'linear-gradient(135deg, #ef4444, #dc2626)'; // Red
     }
 }
+
+/**
+ * Per-question marks and feedback (filled in progressively while grading)
+ */
+function renderQuestionResults(results) {
+    const container = document.getElementById('questionResults');
+    if (!container) return;
+    container.innerHTML = '';
+    if (results.length === 0) return;
+
+    const table = document.createElement('table');
+    table.className = 'table';
+    table.innerHTML = '<thead><tr><th>Question</th><th>Marks</th><th>Feedback</th></tr></thead>';
+    const body = document.createElement('tbody');
+    results.forEach(r => {
+        const row = document.createElement('tr');
+        [r.question_id, `${r.marks_obtained}/${r.max_marks}`, r.feedback || ''].forEach(text => {
+            const cell = document.createElement('td');
+            cell.textContent = text;
+            row.appendChild(cell);
+        });
+        body.appendChild(row);
+    });
+    table.appendChild(body);
+    container.appendChild(table);
+}